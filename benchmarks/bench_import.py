@@ -0,0 +1,83 @@
+#!/usr/bin/python
+# (c) 2018 Ian Leiman, ian.leiman@gmail.com
+# bench_import
+# part of PYDPLAN, a Python Dive Planner with PyQt5 GUI
+# import time benchmark of the calculation modules, checks that they start fast and without PyQt5 or scipy
+#
+# usage:
+#   python benchmarks/bench_import.py                 # exit code 1 if over the budget
+#   python benchmarks/bench_import.py --budget 0.1 --json import.json
+#
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+# the modules used by worker processes and the command line planner
+CORE_MODULES = ('pydplan_buhlmann', 'pydplan_classes', 'pydplan_profiletools', 'pydplan_plancache', 'tmx_calc',
+                'vdw_calc', 'vdw_ztable')
+# these must not be loaded just by importing the core modules
+FORBIDDEN_MODULES = ('PyQt5', 'scipy')
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# executed in a fresh interpreter for each run, so that nothing is cached in sys.modules
+CHILD_CODE = '''
+import sys, time, json
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+seconds = time.perf_counter() - start
+loaded = sorted(set(name.split('.')[0] for name in sys.modules))
+print(json.dumps({{'seconds': seconds, 'loaded': loaded}}))
+'''
+
+
+def measureImport(modules=CORE_MODULES, runs=5):
+    '''import the modules in fresh interpreters
+
+    :param modules: module names to import
+    :type modules: tuple
+    :param runs: number of interpreters started
+    :type runs: int
+    :return: import seconds of each run, and the top level packages loaded
+    :rtype: tuple
+    '''
+    times = []
+    loaded = set()
+    for run in range(runs):
+        output = subprocess.run([sys.executable, '-c', CHILD_CODE.format(modules=tuple(modules))],
+                                cwd=REPO_DIR, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+        result = json.loads(output)
+        times.append(result['seconds'])
+        loaded.update(result['loaded'])
+    return times, loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='import time benchmark of the pydplan calculation modules')
+    parser.add_argument('--budget', type=float, default=0.25, help='seconds allowed for importing the modules')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args(argv)
+
+    times, loaded = measureImport(runs=args.runs)
+    best = min(times)
+    forbidden = [name for name in FORBIDDEN_MODULES if name in loaded]
+    print('import {}: best {:.1f} ms, median {:.1f} ms, budget {:.1f} ms'
+          .format(', '.join(CORE_MODULES), best * 1000.0, sorted(times)[len(times) // 2] * 1000.0,
+                  args.budget * 1000.0))
+    if forbidden:
+        print('FAIL: {} loaded at import'.format(', '.join(forbidden)))
+    if best > args.budget:
+        print('FAIL: over the import time budget')
+    if args.json:
+        with open(args.json, 'w') as out:
+            json.dump({'benchmark': 'import', 'modules': CORE_MODULES, 'seconds': times,
+                       'budget': args.budget, 'forbidden': forbidden}, out, indent=1)
+    return 1 if forbidden or best > args.budget else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
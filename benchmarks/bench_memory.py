@@ -0,0 +1,128 @@
+#!/usr/bin/python
+# (c) 2018 Ian Leiman, ian.leiman@gmail.com
+# bench_memory
+# part of PYDPLAN, a Python Dive Planner with PyQt5 GUI
+# memory footprint of a long decompression plan, and of the objects it is made of
+#
+# usage:
+#   python benchmarks/bench_memory.py
+#   python benchmarks/bench_memory.py --json memory.json --compare old_memory.json
+#
+import os
+import sys
+import json
+import argparse
+import copy
+import platform
+import tracemalloc
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from pydplan_buhlmann import Compartment
+from pydplan_classes import DecoStop
+from pydplan_profiletools import calculatePlan
+from pydplan_cli import planFromDict
+from bench_plan import gitCommit
+
+# 90 m trimix with a travel gas and two deco gases, about four hours of deco
+LONG_DECO_PLAN = {'depth': 90, 'time': 30, 'gfLow': 30, 'gfHigh': 70,
+                  'tanks': {'B': {'o2': 10, 'he': 70}, 'T1': {'use': True},
+                            'D1': {'use': True}, 'D2': {'use': True}}}
+
+
+def instanceBytes(factory, count=1000):
+    '''bytes allocated per instance when count instances are created by factory'''
+    tracemalloc.start()
+    instances = [factory() for index in range(count)]
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # the list itself is not part of the instances
+    return (current - sys.getsizeof(instances)) / float(count)
+
+
+def dictInstanceBytes(obj, count=1000):
+    '''bytes per instance of a copy of obj that keeps its attributes in a __dict__, as without __slots__'''
+    attributes = getattr(type(obj), '__slots__', None)
+    if attributes is None:
+        return instanceBytes(lambda: copy.copy(obj), count)
+    values = [(name, getattr(obj, name)) for name in attributes]
+    plainClass = type(type(obj).__name__, (), dict())
+
+    def plainCopy():
+        plain = plainClass()
+        for name, value in values:
+            setattr(plain, name, value)
+        return plain
+    return instanceBytes(plainCopy, count)
+
+
+def planMemory(data, options):
+    '''allocations still alive after calculatePlan(), that is the profile, the model states and the stops
+
+    :return: bytes and blocks retained, the tracemalloc peak and the number of profile points
+    :rtype: dict
+    '''
+    divePlan = planFromDict(data)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    calculatePlan(divePlan, **options)
+    after = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    allocated = [stat for stat in after.compare_to(before, 'filename') if stat.size_diff > 0]
+    retained = sum(stat.size_diff for stat in allocated)
+    points = len(divePlan.profileSampled)
+    return {'points': points,
+            'runtime': divePlan.totalTime,
+            'bytes': retained,
+            'blocks': sum(stat.count_diff for stat in allocated),
+            'bytesPerPoint': retained / points,
+            'peakBytes': peak,
+            }, divePlan
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='memory footprint of a long decompression plan')
+    parser.add_argument('--engine', choices=['python', 'numpy'])
+    parser.add_argument('--deco-solver', dest='decoSolver', choices=['step', 'analytic'])
+    parser.add_argument('--stepping', choices=['fixed', 'adaptive'])
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='an earlier results file to compare with')
+    args = parser.parse_args(argv)
+    options = {key: getattr(args, key) for key in ('engine', 'decoSolver', 'stepping')
+               if getattr(args, key) is not None}
+
+    plan, divePlan = planMemory(LONG_DECO_PLAN, options)
+    print('plan: {} points, runtime {:.0f} min, {:.1f} kB in {} blocks, {:.0f} bytes per point, peak {:.1f} kB'
+          .format(plan['points'], plan['runtime'] / 60.0, plan['bytes'] / 1024.0, plan['blocks'],
+                  plan['bytesPerPoint'], plan['peakBytes'] / 1024.0))
+
+    # one instance of each class, as it is after the plan
+    instances = {'DiveProfilePoint': divePlan.profileSampled[-1],
+                 'Compartment': Compartment(0),
+                 'DecoStop': divePlan.decoStopsCalculated[0] if divePlan.decoStopsCalculated else DecoStop(3.0, 60.0, 0),
+                 'ScubaTank': divePlan.currentTank}
+    objects = dict()
+    for name, obj in instances.items():
+        objects[name] = {'bytes': instanceBytes(lambda: copy.copy(obj)), 'dictBytes': dictInstanceBytes(obj),
+                         'slots': hasattr(type(obj), '__slots__')}
+        print('{:<18} {:>5.0f} bytes, {:>5.0f} bytes with a __dict__'.format(name, objects[name]['bytes'],
+                                                                      objects[name]['dictBytes']))
+
+    results = {'benchmark': 'memory', 'commit': gitCommit(), 'python': platform.python_version(),
+               'options': options, 'plan': plan, 'objects': objects}
+    if args.json:
+        with open(args.json, 'w') as out:
+            json.dump(results, out, indent=1)
+    if args.compare:
+        with open(args.compare) as oldFile:
+            old = json.load(oldFile)
+        print('compared to {}: plan bytes {:+.1f} %, bytes per point {:+.1f} %'.format(
+            old.get('commit'), (plan['bytes'] / old['plan']['bytes'] - 1.0) * 100.0,
+            (plan['bytesPerPoint'] / old['plan']['bytesPerPoint'] - 1.0) * 100.0))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# (c) 2018 Ian Leiman, ian.leiman@gmail.com
+# bench_paint
+# part of PYDPLAN, a Python Dive Planner with PyQt5 GUI
+# paint time of the plot widgets for a long profile, runs without a display on the offscreen Qt platform
+#
+# usage:
+#   python benchmarks/bench_paint.py
+#   python benchmarks/bench_paint.py --samples 5000 --json paint.json --compare old_paint.json
+#
+import os
+import sys
+import json
+import importlib
+import time
+import argparse
+import platform
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtGui import QImage
+from PyQt5.QtWidgets import QApplication
+
+from pydplan_profiletools import calculatePlan
+from pydplan_cli import planFromDict
+from bench_plan import gitCommit, FIXTURES
+
+WIDGETS = (('pydplan_plot', 'PlotPlanWidget'), ('pydplan_plot', 'PlotBelowWidget'),
+           ('pydplan_plot', 'PlotTissuesWidget'), ('pydplan_plot', 'PlotPressureGraphWidget'),
+           ('pydplan_heat', 'PlotHeatMapWidget'))
+
+
+def longProfile(samples):
+    '''the trimix plan of bench_plan.py, resampled to about the given number of profile points'''
+    divePlan = planFromDict(FIXTURES['trimix60'])
+    calculatePlan(divePlan, stepping='adaptive', sampleInterval=None)
+    runtime = divePlan.totalTime
+    divePlan = planFromDict(FIXTURES['trimix60'])
+    calculatePlan(divePlan, stepping='adaptive', sampleInterval=runtime / samples)
+    return divePlan
+
+
+def paintTime(widget, repeats, newPlan=False):
+    '''milliseconds of one paint of the widget, best of repeats
+
+    :param newPlan: increase the plan version before each paint, so cached layers are drawn again
+    :type newPlan: bool
+    '''
+    image = QImage(widget.size(), QImage.Format_ARGB32_Premultiplied)
+    times = []
+    for repeat in range(repeats):
+        if newPlan:
+            widget.plan.version += 1
+        start = time.perf_counter()
+        widget.render(image)
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='paint time of the pydplan plot widgets')
+    parser.add_argument('--samples', type=int, default=2000, help='profile points to plot')
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--width', type=int, default=1000)
+    parser.add_argument('--height', type=int, default=500)
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='an earlier results file to compare with')
+    args = parser.parse_args(argv)
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    divePlan = longProfile(args.samples)
+    points = len(divePlan.profileSampled)
+    print('profile of {} points'.format(points))
+
+    results = {'benchmark': 'paint', 'commit': gitCommit(), 'python': platform.python_version(),
+               'points': points, 'size': [args.width, args.height], 'widgets': dict()}
+    for moduleName, name in WIDGETS:
+        widget = getattr(importlib.import_module(moduleName), name)(divePlan)
+        widget.resize(args.width, args.height)
+        app.processEvents()
+        result = {'paintMs': paintTime(widget, args.repeats, newPlan=True)}
+        if hasattr(widget, 'layerKey') or hasattr(widget, 'curveKey') or hasattr(widget, 'heatKey'):
+            # a plain repaint of the same plan, with the cached layers, decimated curves or heat map image
+            result['cachedPaintMs'] = paintTime(widget, args.repeats)
+        results['widgets'][name] = result
+        print('{:<24} {:>8.2f} ms'.format(name, result['paintMs']) +
+              ('  cached {:.2f} ms'.format(result['cachedPaintMs']) if 'cachedPaintMs' in result else ''))
+        widget.close()
+
+    if args.json:
+        with open(args.json, 'w') as out:
+            json.dump(results, out, indent=1)
+    if args.compare:
+        with open(args.compare) as oldFile:
+            old = json.load(oldFile)
+        print('compared to {}:'.format(old.get('commit')))
+        for name, result in results['widgets'].items():
+            if name in old['widgets']:
+                print('  {:<24} paint {:+6.1f} %'.format(
+                    name, (result['paintMs'] / old['widgets'][name]['paintMs'] - 1.0) * 100.0))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
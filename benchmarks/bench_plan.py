@@ -0,0 +1,174 @@
+#!/usr/bin/python
+# (c) 2018 Ian Leiman, ian.leiman@gmail.com
+# bench_plan
+# part of PYDPLAN, a Python Dive Planner with PyQt5 GUI
+# benchmark of the planning engine and the gas tools, results to a JSON file for comparing commits
+#
+# usage:
+#   python benchmarks/bench_plan.py --json plan.json
+#   python benchmarks/bench_plan.py --stepping adaptive --json adaptive.json --compare plan.json
+#
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tracemalloc
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from pydplan_buhlmann import ModelPoint, Buhlmann
+from pydplan_profiletools import calculatePlan, planSteps, newModelPoint
+from pydplan_cli import planFromDict
+from tmx_calc import tmx_calc
+from vdw_calc import vdw_calc
+from vdw_ztable import ztable
+
+# representative plans, in the plan file format of pydplan_cli
+FIXTURES = {
+    # the default GF 30/80 gives a short stop even on shallow dives
+    'air_nodeco': {'depth': 18, 'time': 30, 'gfLow': 100, 'gfHigh': 100},
+    'trimix60': {'depth': 60, 'time': 25,
+                 'tanks': {'B': {'o2': 18, 'he': 45}, 'T1': {'use': True},
+                           'D1': {'use': True}, 'D2': {'use': True}}},
+    'repetitive_day': {'depth': 30, 'time': 30, 'surfaceTime': 90,
+                       'repeat': [{'time': 30, 'gf': 80}, {'time': 25, 'gf': 80}, {'time': 20, 'gf': 85}]},
+    'custom_9stops': {'depth': 40, 'time': 30, 'mode': 'Custom',
+                      'stops': [{'depth': 27, 'time': 1}, {'depth': 24, 'time': 1}, {'depth': 21, 'time': 2},
+                                {'depth': 18, 'time': 2}, {'depth': 15, 'time': 3}, {'depth': 12, 'time': 3},
+                                {'depth': 9, 'time': 5}, {'depth': 6, 'time': 8}, {'depth': 3, 'time': 12}]},
+}
+
+
+def timeCalls(function, seconds):
+    '''call function repeatedly for at least seconds, return calls per second'''
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        function()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return calls / elapsed
+
+
+def benchPlan(data, options, seconds):
+    '''speed and memory of calculatePlan() for one plan dictionary
+
+    :return: plansPerSecond, stepsPerSecond, steps and runtime of the plan, peakBytes is the tracemalloc peak
+        during one plan, blocks and bytes are the allocations still alive after it (the profile and model states)
+    :rtype: dict
+    '''
+    divePlan = planFromDict(data)
+    stepOptions = {key: value for key, value in options.items() if key != 'engine'}
+    steps = sum(1 for point in planSteps(divePlan, newModelPoint(options.get('engine', 'python')),
+                                         **stepOptions))
+    plansPerSecond = timeCalls(lambda: calculatePlan(divePlan, **options), seconds)
+
+    # memory of one plan, drop the previous results first so they are not counted
+    divePlan = planFromDict(data)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    calculatePlan(divePlan, **options)
+    after = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    allocated = [stat for stat in after.compare_to(before, 'filename') if stat.size_diff > 0]
+    return {'steps': steps,
+            'runtime': divePlan.totalTime,
+            'plansPerSecond': plansPerSecond,
+            'stepsPerSecond': plansPerSecond * steps,
+            'peakBytes': peak,
+            'blocks': sum(stat.count_diff for stat in allocated),
+            'bytes': sum(stat.size_diff for stat in allocated),
+            }
+
+
+def benchFunctions(seconds):
+    '''calls per second of the inner functions: the tissue model, tmx_calc and vdw_calc, with and without the Z table'''
+    results = dict()
+    modelUsed = Buhlmann().model['ZHL16c']
+    model = ModelPoint()
+    model.initSurface(modelUsed)
+    results['calculateAllTissues_constant'] = timeCalls(
+        lambda: model.calculateAllTissuesDepth(modelUsed, 30.0, 30.0, 1.0, 0.0, 0.79, 0.8), seconds)
+    results['calculateAllTissues_ascent'] = timeCalls(
+        lambda: model.calculateAllTissuesDepth(modelUsed, 30.0, 29.25, 5.0 / 60.0, 0.35, 0.44, 0.8), seconds)
+    results['tmx_calc'] = timeCalls(
+        lambda: tmx_calc('pp', 50, 200, 21, 35, 18, 45), seconds)
+    results['vdw_calc'] = timeCalls(lambda: vdw_calc(50, 200, 21, 35, 18, 45), seconds)
+    table = ztable()
+    results['tmx_calc_ztable'] = timeCalls(
+        lambda: tmx_calc('pp', 50, 200, 21, 35, 18, 45, ztable=table), seconds)
+    results['vdw_calc_ztable'] = timeCalls(lambda: vdw_calc(50, 200, 21, 35, 18, 45, ztable=table), seconds)
+    return {name: {'callsPerSecond': callsPerSecond} for name, callsPerSecond in results.items()}
+
+
+def gitCommit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, check=True,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, old):
+    '''print the change of each result to an older results file'''
+    print('compared to {}:'.format(old.get('commit')))
+    for name, plan in results['plans'].items():
+        oldPlan = old['plans'].get(name)
+        if oldPlan:
+            print('  {:<16} plans/s {:+6.1f} %  peak {:+6.1f} %'.format(
+                name, (plan['plansPerSecond'] / oldPlan['plansPerSecond'] - 1.0) * 100.0,
+                (plan['peakBytes'] / oldPlan['peakBytes'] - 1.0) * 100.0))
+    for name, function in results['functions'].items():
+        oldFunction = old['functions'].get(name)
+        if oldFunction:
+            print('  {:<30} calls/s {:+6.1f} %'.format(
+                name, (function['callsPerSecond'] / oldFunction['callsPerSecond'] - 1.0) * 100.0))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='benchmark of the pydplan planning engine and gas tools')
+    parser.add_argument('--seconds', type=float, default=1.0, help='time to run each benchmark')
+    parser.add_argument('--fixture', action='append', choices=sorted(FIXTURES), help='run only these plans')
+    parser.add_argument('--engine', choices=['python', 'numpy'])
+    parser.add_argument('--deco-solver', dest='decoSolver', choices=['step', 'analytic'])
+    parser.add_argument('--stepping', choices=['fixed', 'adaptive'])
+    parser.add_argument('--no-functions', action='store_true', help='skip the function benchmarks')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='an earlier results file to compare with')
+    args = parser.parse_args(argv)
+    options = {key: getattr(args, key) for key in ('engine', 'decoSolver', 'stepping')
+               if getattr(args, key) is not None}
+
+    results = {'benchmark': 'plan', 'commit': gitCommit(), 'python': platform.python_version(),
+               'options': options, 'plans': dict(), 'functions': dict()}
+    print('{:<16} {:>6} {:>9} {:>10} {:>9} {:>8}'.format('plan', 'steps', 'plans/s', 'steps/s', 'peak kB',
+                                                         'blocks'))
+    for name in args.fixture or FIXTURES:
+        plan = benchPlan(FIXTURES[name], options, args.seconds)
+        results['plans'][name] = plan
+        print('{:<16} {:>6} {:>9.1f} {:>10.0f} {:>9.1f} {:>8}'.format(
+            name, plan['steps'], plan['plansPerSecond'], plan['stepsPerSecond'], plan['peakBytes'] / 1024.0,
+            plan['blocks']))
+    if not args.no_functions:
+        results['functions'] = benchFunctions(args.seconds)
+        for name, function in results['functions'].items():
+            print('{:<30} {:>10.0f} calls/s'.format(name, function['callsPerSecond']))
+
+    if args.json:
+        with open(args.json, 'w') as out:
+            json.dump(results, out, indent=1)
+    if args.compare:
+        with open(args.compare) as oldFile:
+            compare(results, json.load(oldFile))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
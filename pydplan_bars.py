@@ -7,8 +7,8 @@
 from PyQt5 import QtGui
 from PyQt5.QtCore import Qt, QRect, QLineF, QPointF
 from PyQt5.QtGui import QPainter, QPainterPath, QLinearGradient, QBrush, QPalette, QPen, QColor
-from PyQt5.QtWidgets import *
-from pydplan_buhlmann import *
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QSlider
+from pydplan_buhlmann import ModelPoint, Constants, pressure2depth
 from pydplan_plot import colors
 
 class TCbarsController(QWidget):
@@ -0,0 +1,166 @@
+#!/usr/bin/python
+# (c) 2018 Ian Leiman, ian.leiman@gmail.com
+# pydplan_batch
+# part of PYDPLAN, a Python Dive Planner with PyQt5 GUI
+# batch planner, executes many dive plans together and updates all their tissues in one vectorized step
+#
+import numpy as np
+
+from pydplan_buhlmann import ModelPoint, Constants, depth2absolutePressure
+from pydplan_profiletools import planSteps, planSummary
+from pydplan_vector import vectorCoefficients, tissuePressures, mixedCoefficients, maxAmbientPressures, \
+    NITROGEN, HELIUM
+
+
+class BatchModel():
+    """
+    Buhlmann model states of N dive plans, tissue pressures in an array of shape (N, COMPS, 2)
+    """
+    COMPS = ModelPoint.COMPS
+
+    def __init__(self, plans):
+        self.plans = plans
+        self.coefficients = None
+        self.waterVapor = Constants.WaterVaporSurface
+        self.pressures = np.zeros((plans, self.COMPS, 2))
+        # the segment each plan has requested for the current step
+        self.beginPressure = np.zeros(plans)
+        self.endPressure = np.zeros(plans)
+        self.intervalMinutes = np.zeros(plans)
+        self.gasFractions = np.zeros((plans, 2))
+        self.gfNow = np.ones(plans)
+        # mask of the plans that requested a segment in this step, calculateStep() updates only these rows
+        self.stepping = np.zeros(plans, dtype=bool)
+        # results of the last step
+        self.ambient = np.zeros(plans)
+        self.leadTissue = np.full(plans, -1)
+        self.leadCeilingMeters = np.full(plans, -100.0)
+        self.leadCeilingStop = np.full(plans, -1)
+        self.maxNitrogenPressure = np.zeros(plans)
+        self.maxHeliumPressure = np.zeros(plans)
+
+    def rows(self):
+        return [BatchModelRow(self, index) for index in range(self.plans)]
+
+    def calculateStep(self):
+        '''update the tissues of all plans that have requested a segment, in one vectorized step'''
+        rows = np.flatnonzero(self.stepping)
+        if len(rows) == 0:
+            return
+        coefficients = self.coefficients
+        beginPressure = self.beginPressure[rows]
+        endPressure = self.endPressure[rows]
+        minutes = self.intervalMinutes[rows]
+        fractions = self.gasFractions[rows]
+        gfNow = self.gfNow[rows]
+
+        gasInspired = (beginPressure - self.waterVapor)[:, np.newaxis] * fractions
+        # ascending or descending, calculate BAR/min change rate for inert gases, zero at constant depth
+        changing = beginPressure != endPressure
+        barPerMin = np.zeros(len(rows))
+        barPerMin[changing] = (endPressure[changing] - beginPressure[changing]) / minutes[changing]
+        gasRate = barPerMin[:, np.newaxis] * fractions
+        # same rule as Compartment.calculateCompartment(), Schreiner only when both gases are changing
+        schreiner = (gasRate[:, NITROGEN] != 0) & (gasRate[:, HELIUM] != 0)
+
+        pressures = tissuePressures(self.pressures[rows], coefficients.k, gasInspired, gasRate,
+                                    minutes, schreiner)
+        self.pressures[rows] = pressures
+        heliumNitrogenA, heliumNitrogenB = mixedCoefficients(pressures, coefficients)
+        ceilings = (maxAmbientPressures(pressures, heliumNitrogenA, heliumNitrogenB, gfNow)
+                    - Constants.surfacePressure) * 10.0
+        lead = np.argmax(ceilings, axis=1)
+        leadCeilingMeters = ceilings[np.arange(len(rows)), lead]
+
+        self.ambient[rows] = endPressure
+        self.leadTissue[rows] = lead
+        self.leadCeilingMeters[rows] = leadCeilingMeters
+        self.leadCeilingStop[rows] = (np.ceil(leadCeilingMeters / 3.0) * 3.0).astype(int)
+        maxPressures = pressures.max(axis=1)
+        self.maxNitrogenPressure[rows] = np.where(maxPressures[:, NITROGEN] > 0.0,
+                                                  maxPressures[:, NITROGEN], self.maxNitrogenPressure[rows])
+        self.maxHeliumPressure[rows] = np.where(maxPressures[:, HELIUM] > 0.0,
+                                                maxPressures[:, HELIUM], self.maxHeliumPressure[rows])
+        self.stepping[:] = False
+
+
+class BatchModelRow():
+    """
+    the model of one plan inside a BatchModel, has the interface of ModelPoint used by planSteps()
+    calculateAllTissuesDepth() only records the segment, BatchModel.calculateStep() does the calculation
+    """
+    def __init__(self, batch, index):
+        self.batch = batch
+        self.index = index
+
+    def initSurface(self, mc):
+        batch = self.batch
+        coefficients = vectorCoefficients(mc)
+        if batch.coefficients is not None and batch.coefficients is not coefficients:
+            raise ValueError('all plans of a batch must use the same model')
+        batch.coefficients = coefficients
+        batch.pressures[self.index, :, HELIUM] = 0.0
+        batch.pressures[self.index, :, NITROGEN] = Constants.initN2
+
+    def calculateAllTissuesDepth(self, modelUsed, beginDepth, endDepth,
+                                 intervalMinutes,  # in minutes
+                                 heliumFraction, nitrogenFraction, gfNow):
+        batch = self.batch
+        index = self.index
+        batch.beginPressure[index] = depth2absolutePressure(beginDepth)
+        batch.endPressure[index] = depth2absolutePressure(endDepth)
+        batch.intervalMinutes[index] = intervalMinutes
+        batch.gasFractions[index] = (nitrogenFraction, heliumFraction)
+        batch.gfNow[index] = gfNow
+        batch.stepping[index] = True
+
+    @property
+    def ambient(self):
+        return float(self.batch.ambient[self.index])
+
+    @property
+    def leadTissue(self):
+        return int(self.batch.leadTissue[self.index])
+
+    @property
+    def leadCeilingMeters(self):
+        return float(self.batch.leadCeilingMeters[self.index])
+
+    @property
+    def leadCeilingStop(self):
+        return int(self.batch.leadCeilingStop[self.index])
+
+    @property
+    def maxNitrogenPressure(self):
+        return float(self.batch.maxNitrogenPressure[self.index])
+
+    @property
+    def maxHeliumPressure(self):
+        return float(self.batch.maxHeliumPressure[self.index])
+
+
+def calculatePlans(diveplans, verbose=False):
+    '''Calculates many diveplans together, like calculatePlan() does for one
+
+    Every plan runs its own state machine, but the tissue updates and ceilings of all plans are calculated
+    together as arrays of shape (N, 16, 2). Each plan object gets the same decoStopsCalculated,
+    tank pressures and maximum values as calculatePlan() would give, but the profile and model states
+    are not recorded.
+    :param diveplans: list of DivePlan objects, each must be a separate object
+    :type diveplans: list
+    :return: list of planSummary() dictionaries, in the same order as diveplans
+    :rtype: list
+    '''
+    batch = BatchModel(len(diveplans))
+    steps = [planSteps(diveplan, model, verbose=verbose, record=False)
+             for diveplan, model in zip(diveplans, batch.rows())]
+    active = np.ones(len(diveplans), dtype=bool)
+    while active.any():
+        for index in np.flatnonzero(active):
+            try:
+                next(steps[index])
+            except StopIteration:
+                active[index] = False
+        batch.calculateStep()
+
+    return [planSummary(diveplan) for diveplan in diveplans]
@@ -6,6 +6,9 @@
 #
 import math
 import copy
+import threading
+from array import array
+from collections import OrderedDict
 
 class tcCoefficients():
     """
@@ -125,6 +128,75 @@ class Buhlmann():
         self.model = BUHLMANN_COEF
 
 
+class DecayTable():
+    """
+    shared table of the exponential decay factors exp(-k * minutes) of one Buhlmann model variant,
+    indexed by the interval in minutes. Each entry has a (Helium, Nitrogen) pair for every compartment.
+    The intervals the planner uses all the time are calculated once and kept, other intervals are kept
+    in a bounded LRU cache, which is locked as plans can be calculated in many threads at the same time
+    """
+    # intervals of the dive plan state machine: ascent 5 s, deco stops and tank changes 1, 2, 3 minutes
+    INTERVALS = (5.0 / 60.0, 60.0 / 60.0, 120.0 / 60.0, 180.0 / 60.0)
+    CACHE_SIZE = 64
+
+    def __init__(self, modelUsed):
+        self.modelUsed = modelUsed
+        self.factors = dict()
+        self.recent = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        for minutes in self.INTERVALS:
+            self.factors[minutes] = self.calculate(minutes)
+
+    def calculate(self, minutes):
+        return [(math.exp(-coefficient.HeliumK * minutes), math.exp(-coefficient.NitrogenK * minutes))
+                for coefficient in self.modelUsed]
+
+    def get(self, minutes):
+        '''the decay factors of all compartments for an interval
+
+        :param minutes: minutes of exposure of the segment
+        :type minutes: float
+        :return: list of (Helium, Nitrogen) decay factors, one tuple for each compartment
+        :rtype: list
+        '''
+        decays = self.factors.get(minutes)
+        if decays is not None:
+            self.hits += 1
+            return decays
+        with self.lock:
+            decays = self.recent.get(minutes)
+            if decays is not None:
+                self.hits += 1
+                self.recent.move_to_end(minutes)
+                return decays
+            self.misses += 1
+        decays = self.calculate(minutes)
+        with self.lock:
+            self.recent[minutes] = decays
+            if len(self.recent) > self.CACHE_SIZE:
+                self.recent.popitem(last=False)
+        return decays
+
+# one DecayTable per model variant, keyed by the identity of the coefficients list
+_decayTables = dict()
+
+def decayTable(modelUsed):
+    '''return the shared DecayTable of a model variant, create it at first use
+
+    :param modelUsed: the model coefficients list, like BUHLMANN_COEF['ZHL16c']
+    :type modelUsed: list
+    :return: decay factor table for the model
+    :rtype: DecayTable
+    '''
+    table = _decayTables.get(id(modelUsed))
+    if table is None:
+        table = DecayTable(modelUsed)
+        _decayTables[id(modelUsed)] = table
+    return table
+
+
 class ModelPoint():
     """
     object that stores a Buhlmann model state for 16 tissue compartments
@@ -179,10 +251,28 @@ class ModelPoint():
             newobj.tissues[i] = copy.deepcopy(self.tissues[i])
         return newobj
 
+    def tissueColumns(self):
+        '''the tissue state as arrays of COMPS values, used by ModelHistory to record this state
+
+        :return: Nitrogen pressures, Helium pressures, HeliumNitrogen A & B coefficients and ceilings
+        :rtype: tuple
+        '''
+        return (array('d', [comp.nitrogenPressure for comp in self.tissues]),
+                array('d', [comp.heliumPressure for comp in self.tissues]),
+                array('d', [comp.HeliumNitrogenA for comp in self.tissues]),
+                array('d', [comp.HeliumNitrogenB for comp in self.tissues]),
+                array('d', self.ceilings))
+
     def initSurface(self, mc):
         for comp in self.tissues:
             comp.setNewPressures(mc[comp.index], heliumPressure=0.0, nitrogenPressure = Constants.initN2)
 
+    def restoreTissues(self, mc, modelpoint):
+        '''set the tissue pressures from another model state, like a recorded ModelPointView'''
+        for comp, recorded in zip(self.tissues, modelpoint.tissues):
+            comp.setNewPressures(mc[comp.index], heliumPressure= recorded.heliumPressure,
+                                 nitrogenPressure= recorded.nitrogenPressure)
+
 
     def control_compartment(self, gradient):
         control_compartment_number = 0
@@ -278,10 +368,13 @@ class ModelPoint():
         maxHeliumP_now = 0.0
         maxNitrogenP_now = 0.0
         self.gfNow = gfNow
+        # decay factors of this interval for all compartments, from the table shared by all model points
+        decays = decayTable(modelUsed).get(intervalMinutes)
         for compartment in self.tissues:
             coefficients: tcCoefficients = modelUsed[compartment.index]
             compartment.calculateCompartment(coefficients, heliumInspired, nitrogenInspired,
-                                      heliumBarPerMin, nitrogenBarPerMin, intervalMinutes)
+                                      heliumBarPerMin, nitrogenBarPerMin, intervalMinutes,
+                                      decays[compartment.index])
             compartment.ambTolP = compartment.ambientToleratedPressure(endAmbientPressure)
 
             # the actual ceiling to use, based on gfNow
@@ -341,6 +434,10 @@ class Compartment():
     '''
     tissue compartment object
     '''
+    # 16 of these in each model state, slots instead of a __dict__ per compartment
+    __slots__ = ('index', 'heliumPressure', 'nitrogenPressure', 'HeliumNitrogenA', 'HeliumNitrogenB',
+                 'mv', 'ambTolP')
+
     def __init__(self, index):
         self.index = index
 
@@ -353,11 +450,6 @@ class Compartment():
         self.mv = 0.0
         self.ambTolP = 0.0
 
-        self.const_exp_const_depth_he = None
-        self.const_exp_const_depth_n2 = None
-        self.old_k_he = None
-        self.old_seg_time = None
-
     def __deepcopy__(self, memo):
         newobj = Compartment(self.index)
 
@@ -368,10 +460,6 @@ class Compartment():
         newobj.HeliumNitrogenB = self.HeliumNitrogenB
         newobj.mv = self.mv
         newobj.ambTolP = self.ambTolP
-        newobj.const_exp_const_depth_he = self.const_exp_const_depth_he
-        newobj.const_exp_const_depth_n2 = self.const_exp_const_depth_n2
-        newobj.old_k_he = self.old_k_he
-        newobj.old_seg_time = self.old_seg_time
         return newobj
 
     ####
@@ -398,7 +486,7 @@ class Compartment():
 
     ####
     def calculateCompartment(self, coefficient, heliumInspired, nitrogenInspired,
-                             heliumRate, nitrogenRate, minutes):
+                             heliumRate, nitrogenRate, minutes, decay=None):
         '''calculate for one tissue compartment the new partial pressures for Nitrogen and Helium
             then store the new values into the compartment
         :param coefficient: coefficients of Buhlmann model to be used
@@ -413,9 +501,14 @@ class Compartment():
         :type nitrogenRate:float
         :param minutes:
         :type minutes:float
+        :param decay: (Helium, Nitrogen) decay factors exp(-k * minutes), like from DecayTable.get()
+        :type decay: tuple
         :return: does not return anything, calls setNewPressures()
         :rtype: None
         '''
+        if decay is None:
+            decay = (math.exp(-coefficient.HeliumK * minutes), math.exp(-coefficient.NitrogenK * minutes))
+        heliumDecay, nitrogenDecay = decay
         # first check if we are staying at constant depth or ascending/descending
         if heliumRate != 0 and nitrogenRate != 0 :
             # ascending or descending -> we use Schreiner equation
@@ -425,31 +518,28 @@ class Compartment():
                                           constK= coefficient.HeliumK,
                                           gasInspired= heliumInspired,
                                           gasRate= heliumRate,
-                                          minutes= minutes)
+                                          minutes= minutes,
+                                          decay= heliumDecay)
             nitrogenNewPressure = \
                 self.newPressureSchreiner(oldPressure= self.nitrogenPressure,
                                           constK= coefficient.NitrogenK,
                                           gasInspired= nitrogenInspired,
                                           gasRate= nitrogenRate,
-                                          minutes= minutes)
+                                          minutes= minutes,
+                                          decay= nitrogenDecay)
         else:
             # at constant depth -> we use simplified Haldane or the instantaneous equation
-            # we can also reuse the previously calculated component, no need to calculate it again
-            if self.old_seg_time is None or self.old_seg_time != minutes:
-                self.old_seg_time = minutes
-                self.const_exp_const_depth_he = (1 - math.exp(-coefficient.HeliumK   * minutes))
-                self.const_exp_const_depth_n2 = (1 - math.exp(-coefficient.NitrogenK * minutes ))
             heliumNewPressure = \
-                self.heliumPressure + ((heliumInspired - self.heliumPressure) * self.const_exp_const_depth_he)
+                self.heliumPressure + ((heliumInspired - self.heliumPressure) * (1 - heliumDecay))
             nitrogenNewPressure = \
-                self.nitrogenPressure + ((nitrogenInspired - self.nitrogenPressure) * self.const_exp_const_depth_n2)
+                self.nitrogenPressure + ((nitrogenInspired - self.nitrogenPressure) * (1 - nitrogenDecay))
 
         self.setNewPressures(coefficient,
                              heliumPressure= heliumNewPressure,
                              nitrogenPressure= nitrogenNewPressure)
 
 
-    def newPressureSchreiner(self, oldPressure, constK, gasInspired, gasRate, minutes):
+    def newPressureSchreiner(self, oldPressure, constK, gasInspired, gasRate, minutes, decay=None):
         '''Schreiner equation, used when depth is changing
 
         :param oldPressure: the previous partial pressure for the given gas
@@ -462,14 +552,18 @@ class Compartment():
         :type gasRate: float
         :param minutes:
         :type minutes: float
+        :param decay: exp(-constK * minutes), calculated here if not given
+        :type decay: float
         :return: the new tissue partial pressure for the given gas
         :rtype: float
         '''
+        if decay is None:
+            decay = math.exp(-constK * minutes)
         pressure = (gasInspired +
                     gasRate * (minutes - (1.0 / constK)) -
                     (gasInspired - oldPressure -
                     (gasRate / constK)) *
-                    math.exp(-constK * minutes))
+                    decay)
         return pressure
 
     def ambientToleratedPressure(self, pressure):
@@ -486,6 +580,101 @@ class Compartment():
                        (float(p_amb) / self.HeliumNitrogenB + self.HeliumNitrogenA))
         return mv
 
+def decoStopMinutes(nitrogenPressures, heliumPressures, modelUsed, ambientPressure,
+                    heliumFraction, nitrogenFraction, gf, ceilingDepth):
+    '''time to stay at a constant depth until the GF ceilings of all compartments are shallower than ceilingDepth
+
+    Uses the closed form Haldane solution p(t) = pInspired + (p0 - pInspired) * exp(-k * t) for each compartment.
+    For a compartment with only one inert gas the crossing time is solved exactly with a logarithm, for a Nitrogen
+    and Helium mix the crossing is bracketed and bisected on the same closed form. The stop time is the time of
+    the slowest compartment, checked against all compartments in case some of them are still ongassing.
+    :param nitrogenPressures: Nitrogen pressures of all compartments now
+    :type nitrogenPressures: list
+    :param heliumPressures: Helium pressures of all compartments now
+    :type heliumPressures: list
+    :param modelUsed: the model coefficients list to be used in calculation
+    :type modelUsed: Buhlmann.model
+    :param ambientPressure: bar of absolute pressure at the stop
+    :type ambientPressure: float
+    :param heliumFraction: fraction of Helium breathed at the stop
+    :type heliumFraction: float
+    :param nitrogenFraction: fraction of Nitrogen breathed at the stop
+    :type nitrogenFraction: float
+    :param gf: gradient factor used for the ceilings
+    :type gf: float
+    :param ceilingDepth: the ceilings must become shallower than this depth in meters, usually the next stop
+    :type ceilingDepth: float
+    :return: minutes to stay, 0.0 if the ceilings are already shallower
+    :rtype: float
+    '''
+    heliumInspired = (ambientPressure - Constants.WaterVaporSurface) * heliumFraction
+    nitrogenInspired = (ambientPressure - Constants.WaterVaporSurface) * nitrogenFraction
+    # the ceiling is shallower than ceilingDepth when the tolerated ambient pressure is below this
+    targetAmb = Constants.surfacePressure + depth2pressure(ceilingDepth)
+    maxMinutes = 100000.0 # beyond this the ceiling is never cleared at this depth
+
+    def ceilingAmb(comp, minutes):
+        # closed form Haldane pressures of one compartment after minutes, and the tolerated ambient pressure
+        coefficient = modelUsed[comp]
+        heliumPressure = heliumInspired + (heliumPressures[comp] - heliumInspired) * \
+                         math.exp(-coefficient.HeliumK * minutes)
+        nitrogenPressure = nitrogenInspired + (nitrogenPressures[comp] - nitrogenInspired) * \
+                           math.exp(-coefficient.NitrogenK * minutes)
+        totalPressure = heliumPressure + nitrogenPressure
+        a = ((coefficient.HeliumA * heliumPressure) + (coefficient.NitrogenA * nitrogenPressure)) / totalPressure
+        b = ((coefficient.HeliumB * heliumPressure) + (coefficient.NitrogenB * nitrogenPressure)) / totalPressure
+        return (totalPressure - a * gf) / (gf / b - gf + 1.0)
+
+    def leadCeilingAmb(minutes):
+        return max(ceilingAmb(comp, minutes) for comp in range(len(modelUsed)))
+
+    def firstClearTime(clear, low, high):
+        # clear(low) is False and clear(high) is True, bisect the first time it becomes True
+        for iteration in range(100):
+            if high - low < 1e-9:
+                break
+            middle = (low + high) / 2.0
+            if clear(middle):
+                high = middle
+            else:
+                low = middle
+        return high
+
+    def bracketClearTime(clear, start):
+        # double the interval until the ceiling is cleared
+        high = max(start, 1.0)
+        while not clear(high):
+            high *= 2.0
+            if high > maxMinutes:
+                raise ValueError('deco stop at {:.1f} bar can not be completed'.format(ambientPressure))
+        return firstClearTime(clear, start, high)
+
+    slowest = 0.0
+    for comp in range(len(modelUsed)):
+        clear = lambda minutes, comp=comp: ceilingAmb(comp, minutes) < targetAmb
+        if clear(0.0):
+            continue
+        coefficient = modelUsed[comp]
+        if heliumPressures[comp] == 0.0 and heliumInspired == 0.0:
+            # only Nitrogen, A and B are constant and the crossing time has a closed form
+            limit = targetAmb * (gf / coefficient.NitrogenB - gf + 1.0) + coefficient.NitrogenA * gf
+            if nitrogenInspired >= limit:
+                raise ValueError('deco stop at {:.1f} bar can not be completed'.format(ambientPressure))
+            minutes = math.log((nitrogenPressures[comp] - nitrogenInspired) / (limit - nitrogenInspired)) / \
+                      coefficient.NitrogenK
+            # step over the rounding error of the logarithm, so that the ceiling is really cleared
+            while not clear(minutes):
+                minutes += 1e-9
+        else:
+            minutes = bracketClearTime(clear, 0.0)
+        slowest = max(slowest, minutes)
+
+    # compartments that are still ongassing may have crossed back, so check the lead ceiling of all of them
+    leadClear = lambda minutes: leadCeilingAmb(minutes) < targetAmb
+    if not leadClear(slowest):
+        slowest = bracketClearTime(leadClear, slowest)
+    return slowest
+
 def depth2pressure(depth):
     pressure =  float(depth) / 10.0
     return pressure
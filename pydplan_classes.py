@@ -1,3 +1,5 @@
+import copy
+
 from pydplan_buhlmann import Buhlmann
 
 from enum import Enum, auto
@@ -47,6 +49,7 @@ class DivePlan():
         self.stopCount = 0
         self.decoStopList = []
         self.decoStopsCalculated = []
+        self.totalTime = 0.0
         # capture maximum values
         self.maxPPoxygen = 0.0
         self.maxPPnitrogen = 0.0
@@ -60,6 +63,9 @@ class DivePlan():
         self.surfaceTime = 180
         self.diveDurations = []
         self.diveGFs = []
+        self.ascentBegins = 0
+        # increased each time new results are stored, so the plots know when to redraw their caches
+        self.version = 0
 
     def setDefaults(self):
         self.GFhigh = 0.80
@@ -121,7 +127,79 @@ class DivePlan():
             'ascToSurface': {'label': 'ascent rate from 6 m to surface', 'default': 3},
         }
 
+    # inputs of calculatePlan(), copied by inputCopy()
+    INPUT_ATTRIBUTES = ('GFhigh', 'GFlow', 'planMode', 'modelConstants', 'maxDepth', 'bottomDepth', 'bottomTime',
+                        'descRate', 'descTime', 'ascRateToDeco', 'ascRateAtDeco', 'ascRateToSurface',
+                        'nDives', 'surfaceTime')
+    # results of calculatePlan(), published to the plan shown by setResults()
+    RESULT_ATTRIBUTES = ('profileSampled', 'model', 'modelUsed', 'decoStopsCalculated', 'totalTime', 'ascentBegins',
+                         'changeDepth',
+                         'maxPPoxygen', 'maxPPnitrogen', 'maxPPhelium', 'maxPPanyGas',
+                         'maxTCpressure', 'maxTCnitrogen', 'maxTChelium')
+    TANK_RESULTS = ('pressure', 'useFromTime', 'useUntilTime', 'useFromTime2', 'useUntilTime2')
+
+    def inputCopy(self):
+        '''a new DivePlan with a copy of the inputs of this plan, without the widget dictionaries
+
+        calculatePlan() changes the tanks, the planned stops and some inputs of the plan it calculates, so a copy
+        can be calculated in another thread while the GUI keeps changing this plan.
+        :return: a plan ready for calculatePlan()
+        :rtype: DivePlan
+        '''
+        newPlan = DivePlan()
+        for name in DivePlan.INPUT_ATTRIBUTES:
+            setattr(newPlan, name, getattr(self, name))
+        newPlan.rates = copy.deepcopy(self.rates)
+        newPlan.tankList = {tankType: copy.copy(tank) for tankType, tank in self.tankList.items()}
+        newPlan.decoStopList = [copy.copy(stop) for stop in self.decoStopList]
+        newPlan.diveDurations = list(self.diveDurations)
+        newPlan.diveGFs = list(self.diveGFs)
+        return newPlan
+
+    def setResults(self, calculated):
+        '''take the results of a calculated inputCopy() of this plan, the tanks keep their input values
+
+        :param calculated: a plan returned by inputCopy(), after calculatePlan(), or the PlanResult of runPlan()
+        :type calculated: DivePlan or PlanResult
+        '''
+        for name in DivePlan.RESULT_ATTRIBUTES:
+            setattr(self, name, getattr(calculated, name))
+        self.currentTank = self.nextTank = None
+        for tankType, tank in self.tankList.items():
+            calculatedTank = calculated.tankList[tankType]
+            for name in DivePlan.TANK_RESULTS:
+                setattr(tank, name, getattr(calculatedTank, name))
+            if calculated.currentTank is calculatedTank:
+                self.currentTank = tank
+            if calculated.nextTank is calculatedTank:
+                self.nextTank = tank
+        self.version += 1
+
+
+class PlanResult():
+    """
+    the results of one calculation of a plan by runPlan(), kept apart from the DivePlan that was calculated.
+    Has the RESULT_ATTRIBUTES of a DivePlan, and the tanks of the run in tankList, with their end pressures
+    and use times, so it can be given to DivePlan.setResults() and planSummary() like a calculated plan
+    """
+    def __init__(self, calculated=None):
+        '''
+        :param calculated: the inputCopy() that was calculated, nobody else may use it, None gives an empty
+            result for the plan cache to fill in
+        :type calculated: DivePlan
+        '''
+        if calculated is None:
+            return
+        for name in DivePlan.RESULT_ATTRIBUTES:
+            setattr(self, name, getattr(calculated, name))
+        self.tankList = calculated.tankList
+        self.currentTank = calculated.currentTank
+        self.nextTank = calculated.nextTank
+
+
 class DecoStop():
+    __slots__ = ('depth', 'time', 'number', 'done', 'runtime')
+
     def __init__(self, depth, time, number):
         self.depth = depth
         self.time = time
@@ -130,6 +208,9 @@ class DecoStop():
         self.runtime = 0.0
 
 class ScubaTank():
+    __slots__ = ('label', 'name', 'use', 'changeDepth', 'o2', 'he', 'liters', 'bar', 'pressure', 'SAC', 'ppo2max',
+                 'useFromTime', 'useUntilTime', 'useFromTime2', 'useUntilTime2', 'type', 'useOrder', 'color')
+
     def __init__(self, label, name, use,  o2, he,
                  liters, bar, pressure, SAC, ppo2max,
                  useFromTime, useUntilTime,
@@ -0,0 +1,303 @@
+#!/usr/bin/python
+# (c) 2018 Ian Leiman, ian.leiman@gmail.com
+# pydplan_cli
+# command line interface for PYDPLAN, a Python Dive Planner with PyQt5 GUI
+# runs the same calculatePlan() as the GUI, but reads the plan from a JSON or TOML file, does not need PyQt5
+#
+# usage:
+#   python pydplan_cli.py plan.json                  # write the results as JSON to stdout
+#   python pydplan_cli.py plan.toml -f csv -o out.csv
+#   python pydplan_cli.py --batch < plans.ndjson     # one plan per line in, one result per line out
+#
+import sys
+import csv
+import json
+import argparse
+
+from pydplan_classes import DivePlan, DecoStop, PlanMode, TankType
+from pydplan_profiletools import calculatePlan, iterPlan, planSummary
+
+# tank names used in the input files, same as the names shown in the GUI
+TANK_NAMES = {'B': TankType.BOTTOM, 'D1': TankType.DECO1, 'D2': TankType.DECO2, 'T1': TankType.TRAVEL}
+TANK_KEYS = ('use', 'o2', 'he', 'changeDepth', 'liters', 'bar', 'SAC', 'ppo2max')
+# the tank values the gas use is divided by
+POSITIVE_TANK_KEYS = ('liters', 'SAC')
+# the options of calculatePlan() that can be given in the input file or on the command line
+PLAN_OPTIONS = ('engine', 'decoSolver', 'quantize', 'stepping', 'sampleInterval')
+# the errors of a plan that can not be calculated, they are reported and the next plans of a batch are still done
+PLAN_ERRORS = (ValueError, KeyError, TypeError, AttributeError, ArithmeticError)
+
+
+def tankValue(name, key, value):
+    '''check the type of a tank value of a plan file, use is true or false and the others are numbers'''
+    if key == 'use':
+        if not isinstance(value, bool):
+            raise ValueError('use of tank {} must be true or false, not <{}>'.format(name, value))
+    elif isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError('{} of tank {} must be a number, not <{}>'.format(key, name, value))
+    elif key in POSITIVE_TANK_KEYS and value <= 0:
+        raise ValueError('{} of tank {} must be more than 0, not <{}>'.format(key, name, value))
+    return value
+
+
+def listValues(what, values, keys):
+    '''the numbers of the keys of a stop or a repeated dive, all the keys are needed'''
+    if not isinstance(values, dict):
+        raise ValueError('a {} must be an object, not <{}>'.format(what, values))
+    for key in keys:
+        if key not in values:
+            raise ValueError('a {} needs <{}>'.format(what, key))
+    return [float(values[key]) for key in keys]
+
+
+def planFromDict(data):
+    '''create a DivePlan from a dictionary, with the same units as the GUI controls
+
+    Missing values get the defaults of DivePlan.setDefaults() and the GUI. Example:
+    {"depth": 45, "time": 30, "gfLow": 30, "gfHigh": 80, "mode": "Calculate",
+     "rates": {"descent": 20, "ascBelow50": 9, "ascBelow6m": 6, "ascToSurface": 3},
+     "tanks": {"B": {"o2": 21, "he": 35}, "D1": {"use": true, "o2": 50, "changeDepth": 21}},
+     "stops": [{"depth": 6, "time": 5}, {"depth": 3, "time": 6}],
+     "repeat": [{"time": 40, "gf": 80}], "surfaceTime": 180}
+    :param data: depth in meters, times in minutes, rates in m/min, gradient factors in percent
+    :type data: dict
+    :return: a new plan, ready for calculatePlan()
+    :rtype: DivePlan
+    '''
+    if not isinstance(data, dict):
+        raise ValueError('a plan must be an object, not <{}>'.format(type(data).__name__))
+    divePlan = DivePlan()
+    divePlan.setDefaults()
+
+    mode = data.get('mode', 'Calculate')
+    if mode not in ('Calculate', 'Custom'):
+        raise ValueError('unsupported mode <{}>'.format(mode))
+    divePlan.planMode = PlanMode[mode].value
+    divePlan.GFlow = float(data.get('gfLow', divePlan.GFlow * 100.0)) / 100.0
+    divePlan.GFhigh = float(data.get('gfHigh', divePlan.GFhigh * 100.0)) / 100.0
+
+    # same conversions as pydplan_main getNewProfileSettings()
+    divePlan.bottomTime = float(data.get('time', 60)) * 60.0
+    divePlan.bottomDepth = float(data.get('depth', 30))
+    divePlan.maxDepth = divePlan.bottomDepth
+    rates = data.get('rates', dict())
+    if not isinstance(rates, dict):
+        raise ValueError('rates must be an object, not <{}>'.format(rates))
+    for key in rates.keys():
+        if key not in divePlan.rates:
+            raise ValueError('unknown rate <{}>'.format(key))
+    def rate(key):
+        value = float(rates.get(key, divePlan.rates[key]['default']))
+        if value <= 0:
+            raise ValueError('rate <{}> must be more than 0, not <{}>'.format(key, value))
+        return value / 60.0
+    divePlan.descRate = rate('descent')
+    divePlan.ascRateToDeco = rate('ascBelow50')
+    divePlan.ascRateAtDeco = rate('ascBelow6m')
+    divePlan.ascRateToSurface = rate('ascToSurface')
+    divePlan.descTime = divePlan.bottomDepth / divePlan.descRate
+
+    for name, values in data.get('tanks', dict()).items():
+        if name not in TANK_NAMES:
+            raise ValueError('unknown tank <{}>'.format(name))
+        if not isinstance(values, dict):
+            raise ValueError('tank {} must be an object, not <{}>'.format(name, values))
+        tank = divePlan.tankList[TANK_NAMES[name]]
+        for key, value in values.items():
+            if key not in TANK_KEYS:
+                raise ValueError('unknown tank value <{}> of tank {}'.format(key, name))
+            setattr(tank, key, tankValue(name, key, value))
+        tank.pressure = tank.bar
+
+    divePlan.decoStopList = []
+    for stop in data.get('stops', []):
+        depth, time = listValues('stop', stop, ('depth', 'time'))
+        if time > 0:
+            divePlan.decoStopList.append(DecoStop(depth=depth, time=time * 60.0, number=len(divePlan.decoStopList)))
+
+    # repetitive dives after the first one, each has its own bottom time and gradient factor
+    repeat = data.get('repeat', [])
+    divePlan.nDives = 1 + len(repeat)
+    divePlan.surfaceTime = float(data.get('surfaceTime', divePlan.surfaceTime))
+    divePlan.diveDurations = [listValues('repeated dive', dive, ('time',))[0] * 60.0 for dive in repeat]
+    divePlan.diveGFs = [float(dive.get('gf', divePlan.GFhigh * 100.0)) / 100.0 for dive in repeat]
+    return divePlan
+
+
+def planOptions(data, overrides=None):
+    '''the calculatePlan() options of a plan dictionary, the values given in overrides take precedence'''
+    options = dict(data.get('options', dict()))
+    for key in options.keys():
+        if key not in PLAN_OPTIONS:
+            raise ValueError('unknown option <{}>'.format(key))
+    if overrides:
+        options.update((key, value) for key, value in overrides.items() if value is not None)
+    return options
+
+
+def pointRecord(point):
+    '''one calculated profile point as a dictionary'''
+    modelpoint = point.modelpoint
+    return {'runtime': point.time,
+            'depth': point.depth,
+            'phase': point.divephase.name,
+            'tank': point.tank.name,
+            'tankPressure': point.currentTankPressure,
+            'ppOxygen': point.ppOxygen,
+            'ppNitrogen': point.ppNitrogen,
+            'ppHelium': point.ppHelium,
+            'gf': modelpoint.gfNow,
+            'ceiling': modelpoint.leadCeilingMeters,
+            'leadTissue': modelpoint.leadTissue + 1,
+            }
+
+
+def profileRecords(divePlan):
+    '''the calculated profile as a list of dictionaries, one for each recorded point'''
+    return [pointRecord(point) for point in divePlan.profileSampled]
+
+
+def runPlanDict(data, overrides=None, profile=True, every=None, events=False):
+    '''calculate one plan dictionary, return the results as a dictionary
+
+    :param data: the plan, see planFromDict()
+    :type data: dict
+    :param overrides: calculatePlan() options that replace the options of the plan
+    :type overrides: dict
+    :param profile: if True, the calculated profile is included
+    :type profile: bool
+    :param every: if given, the profile has every k:th calculated point and the last one, from iterPlan(),
+        instead of the points sampled by sampleInterval
+    :type every: int
+    :param events: if True, the profile has only the points where the phase or the tank changes, from iterPlan()
+    :type events: bool
+    :return: planSummary() values, and the profile as a list of records
+    :rtype: dict
+    '''
+    divePlan = planFromDict(data)
+    options = planOptions(data, overrides)
+    if profile and (every is not None or events):
+        # the points are made into records as they are calculated, the plan does not keep them
+        options.pop('sampleInterval', None)
+        records = [pointRecord(point) for point in
+                   iterPlan(divePlan, every=1 if every is None else every, events=events, states=True, **options)]
+        result = planSummary(divePlan)
+        result['profile'] = records
+        return result
+    calculatePlan(divePlan, **options)
+    result = planSummary(divePlan)
+    if profile:
+        result['profile'] = profileRecords(divePlan)
+    return result
+
+
+def writeJson(result, out):
+    json.dump(result, out, indent=1)
+    out.write('\n')
+
+
+def writeCsv(result, out):
+    '''write the results as CSV tables: deco stops, gas usage and the profile, each table starts with a # line'''
+    writer = csv.writer(out, lineterminator='\n')
+    out.write('# runtime {:.0f} s, deco {:.0f} s\n'.format(result['runtime'], result['decoTime']))
+    out.write('# deco stops\n')
+    writer.writerow(['runtime', 'depth', 'time'])
+    for stop in result['decoStops']:
+        writer.writerow([stop['runtime'], stop['depth'], stop['time']])
+    out.write('\n# gas\n')
+    writer.writerow(['tank', 'start', 'end', 'used'])
+    for name, tank in result['tanks'].items():
+        writer.writerow([name, tank['start'], tank['end'], tank['used']])
+    if 'profile' in result:
+        out.write('\n# profile\n')
+        fields = list(result['profile'][0].keys()) if result['profile'] else []
+        writer.writerow(fields)
+        for record in result['profile']:
+            writer.writerow([record[field] for field in fields])
+
+
+def readPlanFile(path):
+    '''read a plan dictionary from a JSON or a TOML file, selected by the file name extension'''
+    if path.endswith('.toml'):
+        # tomllib is in the standard library since Python 3.11
+        import tomllib
+        with open(path, 'rb') as planFile:
+            return tomllib.load(planFile)
+    with open(path, 'r') as planFile:
+        return json.load(planFile)
+
+
+def runBatch(lines, out, overrides=None, profile=False, every=None, events=False):
+    '''calculate plans from NDJSON lines, write one JSON result line for each plan as soon as it is ready
+
+    A plan that can not be calculated gives a line with the error message, and the next plans are still done.
+    :return: number of plans that failed
+    :rtype: int
+    '''
+    failed = 0
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            data = json.loads(line)
+            if not isinstance(data, dict):
+                raise ValueError('a plan must be an object, not <{}>'.format(type(data).__name__))
+            result = runPlanDict(data, overrides, profile=profile, every=every, events=events)
+            if 'id' in data:
+                result['id'] = data['id']
+        except PLAN_ERRORS as error:
+            failed += 1
+            result = {'line': number, 'error': str(error)}
+        out.write(json.dumps(result))
+        out.write('\n')
+        out.flush()
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='pydplan command line dive planner')
+    parser.add_argument('plan', nargs='?', help='plan file, .json or .toml')
+    parser.add_argument('-f', '--format', choices=['json', 'csv'], default='json', help='output format')
+    parser.add_argument('-o', '--output', help='output file, default is stdout')
+    parser.add_argument('--batch', action='store_true',
+                        help='read plans from stdin as NDJSON, write one JSON result line per plan')
+    parser.add_argument('--no-profile', action='store_true', help='leave the profile out of the results')
+    parser.add_argument('--profile', action='store_true', help='include the profile in the batch results')
+    parser.add_argument('--every', type=int,
+                        help='profile of every N:th calculated point and the last one, instead of sampled points')
+    parser.add_argument('--events', action='store_true',
+                        help='profile of only the points where the phase or the tank changes')
+    parser.add_argument('--engine', choices=['python', 'numpy'])
+    parser.add_argument('--deco-solver', dest='decoSolver', choices=['step', 'analytic'])
+    parser.add_argument('--stepping', choices=['fixed', 'adaptive'])
+    parser.add_argument('--sample-interval', dest='sampleInterval', type=float)
+    args = parser.parse_args(argv)
+    overrides = {key: getattr(args, key) for key in ('engine', 'decoSolver', 'stepping', 'sampleInterval')}
+
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        if args.batch:
+            failed = runBatch(sys.stdin, out, overrides, profile=args.profile, every=args.every,
+                              events=args.events)
+            return 1 if failed else 0
+        if not args.plan:
+            parser.error('a plan file or --batch is needed')
+        try:
+            result = runPlanDict(readPlanFile(args.plan), overrides, profile=not args.no_profile,
+                                 every=args.every, events=args.events)
+        except PLAN_ERRORS as error:
+            print('pydplan: {}'.format(error), file=sys.stderr)
+            return 1
+        if args.format == 'csv':
+            writeCsv(result, out)
+        else:
+            writeJson(result, out)
+        return 0
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+#!/usr/bin/python
+# (c) 2018 Ian Leiman, ian.leiman@gmail.com
+# pydplan_decimate
+# part of PYDPLAN, a Python Dive Planner with PyQt5 GUI
+# reduces the points of a plotted curve to what can be seen at the pixel resolution of the plot
+#
+# A long profile has many more samples than the plot has pixel columns. The curves are reduced to their
+# min/max envelope: the points are grouped to runs of consecutive points in the same pixel column, and of each
+# run only the first, the lowest, the highest and the last point are kept. The curve still reaches all its
+# extremes and joins the neighbouring columns at the same points.
+#
+# The runs depend only on the x coordinates, so they are found once for all the curves of a plot, and the
+# envelope is taken of the model values before scaling them to y coordinates. Any y scaling that keeps the
+# order of the values, like zeroLevel - value * scale, keeps the same points.
+#
+from itertools import compress, islice
+from operator import add, ne
+
+
+def pixelRuns(xs):
+    '''boundaries of the runs of consecutive points in the same pixel column int(x)
+
+    With a monotonic x, like a runtime plot, there is one run per pixel column. With any other x, like the ambient
+    pressure of the pressure graph, a new run begins whenever the curve moves to another column.
+    :param xs: x coordinates in pixels
+    :type xs: list
+    :return: start index of each run, and len(xs) as the end of the last run
+    :rtype: list
+    '''
+    count = len(xs)
+    if count == 0:
+        return [0]
+    columns = list(map(int, xs))
+    runs = [0]
+    # the indices where the column changes, without a python loop over the points
+    runs.extend(compress(range(1, count), map(ne, columns, islice(columns, 1, None))))
+    runs.append(count)
+    return runs
+
+
+def envelopeIndices(values, runs):
+    '''indices of the points kept of a curve, the first, lowest, highest and last point of each run
+
+    The lowest point is always kept before the highest one. They are in the same pixel column, so the curve
+    covers the same pixels in either order. The runs are handled with map() over the slices of the values,
+    without a python loop over the runs or the points.
+    :param values: the values of the curve, one for each x of pixelRuns()
+    :type values: list or array.array
+    :param runs: the runs from pixelRuns()
+    :type runs: list
+    :return: four indices for each run, or all the indices if the runs are too short to reduce anything
+    :rtype: list or range
+    '''
+    count = runs[-1]
+    if count <= 4 * (len(runs) - 1):
+        return range(count)
+    if not isinstance(values, list):
+        # min() and max() of list slices do not create a new float object for every value, like array slices do
+        values = values.tolist()
+    starts = runs[:-1]
+    ends = runs[1:]
+    pieces = list(map(values.__getitem__, map(slice, starts, ends)))
+    index = list.index
+    kept = [0] * (4 * len(starts))
+    kept[0::4] = starts
+    kept[1::4] = list(map(add, starts, map(index, pieces, map(min, pieces))))
+    kept[2::4] = list(map(add, starts, map(index, pieces, map(max, pieces))))
+    kept[3::4] = [end - 1 for end in ends]
+    return kept
@@ -4,17 +4,55 @@
 # part of PYDPLAN, a Python Dive Planner with PyQt5 GUI
 # hatmap plotting tools
 
-from PyQt5 import QtGui
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QPainter, QPainterPath, QLinearGradient, QBrush, QPalette, QPen, QColor
-from PyQt5.QtWidgets import *
-from pydplan_buhlmann import *
-from pydplan_plot import colors
+import numpy as np
+from PyQt5 import sip
+from PyQt5.QtCore import Qt, QRectF
+from PyQt5.QtGui import QPainter, QPen, QColor, QImage
+from PyQt5.QtWidgets import QWidget
+from pydplan_buhlmann import ModelPoint
+
+# the colors of the heat map cells, indexed by the int() of the HSL saturation, the same colors as
+# hColor.setHsl(240, delta, delta) for on-gassing and hColor.setHsl(0, delta, 127) for exceeding the limit
+BLUE_COLORS = np.array([QColor.fromHsl(240, delta, delta).rgb() for delta in range(256)], dtype=np.uint32)
+RED_COLORS = np.array([QColor.fromHsl(0, delta, 127).rgb() for delta in range(256)], dtype=np.uint32)
+
+
+def heatPixels(history):
+    '''the heat map as COMPS rows of len(history) RGB32 pixels, one row per compartment
+
+    All the compartments of all model points are classified at once on the columns of the model history,
+    which are wrapped without copying, and the colors are looked up for the whole map with one indexing.
+    :param history: the model states of the plan
+    :type history: ModelHistory
+    :return: the pixels, a contiguous array of shape (COMPS, len(history))
+    :rtype: numpy.ndarray
+    '''
+    tissue = lambda name: np.frombuffer(history.column(name), dtype=np.float64).reshape(-1, ModelPoint.COMPS).T
+    ambient = np.frombuffer(history.column('ambient'), dtype=np.float64)
+    pressure = tissue('nitrogen') + tissue('helium')
+    # the tolerated pressure is ambTolP of the compartment
+    tolerated = ambient / tissue('heliumNitrogenB') + tissue('heliumNitrogenA')
+    # tissue is on gassisng show blue, 100% is totally dark, less is lighter
+    onGassing = pressure < ambient
+    # tissue is supersaturated and offgassing but below limit, so not at red yet
+    belowLimit = ~onGassing & (pressure < tolerated)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # exceeding limit, show red hot
+        saturation = np.select([onGassing, belowLimit],
+                               [255 * (ambient - pressure) / ambient, 100 * (tolerated - pressure) / pressure],
+                               pressure / tolerated * 50 + 150)
+    saturation = np.clip(np.nan_to_num(saturation), 0, 255).astype(np.intp)
+    return np.ascontiguousarray(np.where(onGassing | belowLimit, BLUE_COLORS[saturation], RED_COLORS[saturation]))
+
 
 class PlotHeatMapWidget(QWidget):
     def __init__(self, plan=None):
         super().__init__()
         self.plan = plan
+        # the heat map image and the pixel buffer it is wrapped around, built again when the plan version changes
+        self.heatKey = None
+        self.heatPixels = None
+        self.heatImage = None
         self.initUI()
 
     def initUI(self):
@@ -23,6 +61,7 @@ class PlotHeatMapWidget(QWidget):
 
     def setPlan(self, plan):
         self.plan = plan
+        self.heatKey = None
 
     def paintEvent(self, e):
         self.qp.begin(self)
@@ -35,54 +74,22 @@ class PlotHeatMapWidget(QWidget):
         self.plot_width = size.width()
         self.plot_height = size.height()
 
+    def buildHeatMap(self):
+        if self.plan.version == self.heatKey:
+            return
+        self.heatKey = self.plan.version
+        samples = len(self.plan.model)
+        self.heatPixels = heatPixels(self.plan.model)
+        # x is the model point and y the compartment, the image uses the buffer without copying it
+        self.heatImage = QImage(sip.voidptr(self.heatPixels.ctypes.data), samples, ModelPoint.COMPS,
+                                samples * self.heatPixels.itemsize, QImage.Format_RGB32)
+
     def drawHeatMap(self, qp, plot ='Total'):
         if not self.plan.model :
             return
         qp.setPen(QPen(Qt.black, 1, Qt.SolidLine))
         qp.drawText(0, 10,'Heat map here')
-        #xStep = self.plot_width / len(self.plan.model)
-        #yStep = self.plot_height / Model.COMPS
-        xStep = 5
-        yStep = 10
-
-        # iterate all compartments
-        for tc in range(ModelPoint.COMPS):
-            color = colors[tc % len(colors)]
-            hColor = QColor(Qt.white)
-            #color = QColor(tc*15, 15+(tc*15), 255-tc*15)
-            qp.setPen(QPen(color, 1, Qt.SolidLine))
-            zeroLevel = self.plot_height / 2.0
-
-            # iterate all model points
-            qp.setPen(QPen(Qt.white, 0, Qt.NoPen))
-            for n, mPoint in enumerate( self.plan.model ):
-                ambP = mPoint.ambient
-                sTissue = mPoint.tissues[tc]
-                ppN2 = sTissue.nitrogenPressure
-                ppHe = sTissue.heliumPressure
-                ppTot = ppN2 + ppHe
-
-                ambTolP = sTissue.ambTolP
-
-                if ppTot < ambP:
-                    # tissue is on gassisng show blue, 100% is totally dark, less is lighter
-                    delta = 255 * (ambP - ppTot)/ambP
-                    hColor.setHsl(240, int(delta), int(delta))
-                    brush = QBrush(hColor)
-                else:
-                    # tissue is supersaturated and offgassing, show green to red gradient
-                    if ppTot < ambTolP:
-                        # tissue is below limit, so not at red yet
-                        delta = 100 * (ambTolP - ppTot) / ppTot
-                        hColor.setHsl(240, int(delta), int(delta))
-                        brush = QBrush(hColor)
-                    else:
-                        # exceeding limit, show red hot
-                        delta = ppTot / ambTolP * 50 + 150
-                        hColor.setHsl(0, int(delta), 127)
-                        brush = QBrush(hColor)
-                x = n * xStep
-                y = tc* yStep
-                qp.setBrush(brush)
-                qp.drawRect(x, y, xStep, yStep)
 
+        # the cells of all compartments and model points, scaled to the widget with one call
+        self.buildHeatMap()
+        qp.drawImage(QRectF(0, 0, self.plot_width, self.plot_height), self.heatImage)
@@ -0,0 +1,228 @@
+#!/usr/bin/python
+# (c) 2018 Ian Leiman, ian.leiman@gmail.com
+# pydplan_history
+# part of PYDPLAN, a Python Dive Planner with PyQt5 GUI
+# append only, columnar storage of the Buhlmann model states calculated for a dive profile
+#
+from array import array
+
+from pydplan_buhlmann import ModelPoint, Constants
+
+
+class ModelHistory():
+    """
+    Append only history of Buhlmann model states. Instead of one ModelPoint object per sample, the states are
+    stored in preallocated and growable columns:
+     - time x compartment columns, COMPS values per row: nitrogen, helium, heliumNitrogenA, heliumNitrogenB, ceilings
+     - scalar columns, one value per row: ambient, gfNow, leadTissue, leadCeilingMeters, leadCeilingStop, ...
+    Indexing the history returns a ModelPointView of a row, so it can be used like the old list of ModelPoints.
+    The columns are array.array objects, so they can be wrapped without copying, like numpy.frombuffer()
+    """
+    COMPS = ModelPoint.COMPS
+    TISSUE_COLUMNS = ('nitrogen', 'helium', 'heliumNitrogenA', 'heliumNitrogenB', 'ceilings')
+    SCALAR_COLUMNS = ('ambient', 'gfNow', 'leadMaxAmbBars', 'leadCeilingMeters',
+                      'maxNitrogenPressure', 'maxHeliumPressure')
+    INTEGER_COLUMNS = ('leadTissue', 'leadCeilingStop')
+
+    def __init__(self, capacity=256):
+        self.length = 0
+        self.capacity = 0
+        for name in self.TISSUE_COLUMNS + self.SCALAR_COLUMNS:
+            setattr(self, name, array('d'))
+        for name in self.INTEGER_COLUMNS:
+            setattr(self, name, array('q'))
+        self.reserve(capacity)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.length
+        if index < 0 or index >= self.length:
+            raise IndexError('model history index out of range')
+        return ModelPointView(self, index)
+
+    def __iter__(self):
+        for row in range(self.length):
+            yield ModelPointView(self, row)
+
+    def reserve(self, rows):
+        '''make room for at least rows model states, the capacity is at least doubled when growing'''
+        if rows <= self.capacity:
+            return
+        newCapacity = max(rows, self.capacity * 2)
+        extra = newCapacity - self.capacity
+        for name in self.TISSUE_COLUMNS:
+            column = getattr(self, name)
+            column.frombytes(bytes(extra * self.COMPS * column.itemsize))
+        for name in self.SCALAR_COLUMNS + self.INTEGER_COLUMNS:
+            column = getattr(self, name)
+            column.frombytes(bytes(extra * column.itemsize))
+        self.capacity = newCapacity
+
+    def append(self, model):
+        '''record the current state of a model as a new row
+
+        :param model: the model state to record
+        :type model: ModelPoint or VectorModelPoint
+        :return: the row number of the recorded state
+        :rtype: int
+        '''
+        row = self.length
+        self.reserve(row + 1)
+        base = row * self.COMPS
+        end = base + self.COMPS
+        for name, values in zip(self.TISSUE_COLUMNS, model.tissueColumns()):
+            getattr(self, name)[base:end] = values
+        for name in self.SCALAR_COLUMNS + self.INTEGER_COLUMNS:
+            getattr(self, name)[row] = getattr(model, name)
+        self.length += 1
+        return row
+
+    def copy(self):
+        '''a new history with a copy of the recorded rows, more rows can be appended to either one'''
+        newHistory = ModelHistory(capacity=0)
+        for name in self.TISSUE_COLUMNS:
+            setattr(newHistory, name, getattr(self, name)[:self.length * self.COMPS])
+        for name in self.SCALAR_COLUMNS + self.INTEGER_COLUMNS:
+            setattr(newHistory, name, getattr(self, name)[:self.length])
+        newHistory.length = newHistory.capacity = self.length
+        return newHistory
+
+    def compartmentColumn(self, name, index):
+        '''the values of one compartment in all recorded rows of a tissue column, like the curve of a plot
+
+        :param name: one of TISSUE_COLUMNS
+        :type name: str
+        :param index: compartment number
+        :type index: int
+        :rtype: array
+        '''
+        return getattr(self, name)[index:self.length * self.COMPS:self.COMPS]
+
+    def column(self, name):
+        '''a column trimmed to the recorded rows, as a memoryview that does not copy the data'''
+        width = self.COMPS if name in self.TISSUE_COLUMNS else 1
+        return memoryview(getattr(self, name))[:self.length * width]
+
+
+class ModelPointView():
+    """
+    lightweight read only view to one row of a ModelHistory, has the attributes of ModelPoint used by
+    the plots and tables
+    """
+    __slots__ = ('history', 'row')
+    COMPS = ModelPoint.COMPS
+
+    def __init__(self, history, row):
+        self.history = history
+        self.row = row
+
+    @property
+    def ambient(self):
+        return self.history.ambient[self.row]
+
+    @property
+    def gfNow(self):
+        return self.history.gfNow[self.row]
+
+    @property
+    def leadMaxAmbBars(self):
+        return self.history.leadMaxAmbBars[self.row]
+
+    @property
+    def leadTissue(self):
+        return self.history.leadTissue[self.row]
+
+    @property
+    def leadCeilingMeters(self):
+        return self.history.leadCeilingMeters[self.row]
+
+    @property
+    def leadCeilingStop(self):
+        return self.history.leadCeilingStop[self.row]
+
+    @property
+    def maxNitrogenPressure(self):
+        return self.history.maxNitrogenPressure[self.row]
+
+    @property
+    def maxHeliumPressure(self):
+        return self.history.maxHeliumPressure[self.row]
+
+    @property
+    def ceilings(self):
+        base = self.row * self.COMPS
+        return self.history.ceilings[base:base + self.COMPS].tolist()
+
+    @property
+    def tissues(self):
+        return TissuesView(self.history, self.row)
+
+    def tissueColumns(self):
+        '''the tissue state of the row as arrays of COMPS values, so a row can be appended to another history'''
+        base = self.row * self.COMPS
+        end = base + self.COMPS
+        return tuple(getattr(self.history, name)[base:end] for name in ModelHistory.TISSUE_COLUMNS)
+
+
+class TissuesView():
+    """
+    sequence of the CompartmentViews of one history row, replaces the ModelPoint.tissues list
+    """
+    __slots__ = ('history', 'row')
+
+    def __init__(self, history, row):
+        self.history = history
+        self.row = row
+
+    def __len__(self):
+        return ModelPoint.COMPS
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += ModelPoint.COMPS
+        if index < 0 or index >= ModelPoint.COMPS:
+            raise IndexError('compartment index out of range')
+        return CompartmentView(self.history, self.row, index)
+
+
+class CompartmentView():
+    """
+    read only view to one compartment of one history row, has the attributes of Compartment used by the plots
+    """
+    __slots__ = ('history', 'row', 'index', 'offset')
+
+    def __init__(self, history, row, index):
+        self.history = history
+        self.row = row
+        self.index = index
+        self.offset = row * ModelPoint.COMPS + index
+
+    @property
+    def nitrogenPressure(self):
+        return self.history.nitrogen[self.offset]
+
+    @property
+    def heliumPressure(self):
+        return self.history.helium[self.offset]
+
+    @property
+    def HeliumNitrogenA(self):
+        return self.history.heliumNitrogenA[self.offset]
+
+    @property
+    def HeliumNitrogenB(self):
+        return self.history.heliumNitrogenB[self.offset]
+
+    @property
+    def mv(self):
+        # same as Compartment.get_mv(Constants.surfacePressure), as calculated by setNewPressures()
+        return ((self.heliumPressure + self.nitrogenPressure) /
+                (Constants.surfacePressure / self.HeliumNitrogenB + self.HeliumNitrogenA))
+
+    @property
+    def ambTolP(self):
+        # same as Compartment.ambientToleratedPressure() at the ambient pressure of the row
+        return self.history.ambient[self.row] / self.HeliumNitrogenB + self.HeliumNitrogenA
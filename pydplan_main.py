@@ -5,15 +5,13 @@
 
 
 # import modules, like PyQt5 stuff
+# the plotting and table widget modules are imported when the window is created, see initUI()
 from pydplan_classes import DivePlan, DecoStop
-from pydplan_plot import PlotPlanWidget, PlotBelowWidget, PlotPressureGraphWidget, \
-    PlotTissuesWidget
-from pydplan_table import *
-from pydplan_bars import *
-from pydplan_heat import *
 from pydplan_profiletools import calculatePlan
 from pydplan_classes import PlanMode
+from pydplan_worker import PlanScheduler
 
+from PyQt5 import QtGui
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import  QPalette
 from PyQt5.QtWidgets import *
@@ -32,6 +30,10 @@ class pydplan_main(QMainWindow):
         self.divePlan.setDefaults()
         global globalDivePlan
         globalDivePlan = self.divePlan
+        # the changes of the inputs are calculated in a worker thread
+        self.planScheduler = PlanScheduler(self.newPlanInput, parent=self)
+        self.planScheduler.planReady.connect(self.showNewProfile)
+        self.planScheduler.planFailed.connect(self.planFailed)
 
         # define the main window structure, menu bar, tool bar, MDI area, status bar
         self.menubar = self.menuBar()                 # menu bar
@@ -64,6 +66,11 @@ class pydplan_main(QMainWindow):
 
 
         # create tabbed output panels to right hand side
+        from pydplan_plot import PlotPlanWidget, PlotBelowWidget, PlotPressureGraphWidget, \
+            PlotTissuesWidget
+        from pydplan_bars import PlotTCbarsWidget
+        from pydplan_heat import PlotHeatMapWidget
+        from pydplan_table import ProfileTableModel
         self.tabOutputs = QTabWidget()
 
         # PROFILE TAB
@@ -83,10 +90,11 @@ class pydplan_main(QMainWindow):
         self.tabOutputs.addTab(plotPanelWidget, 'Profile')
 
         # TABLE TAB
-        self.tableModel = QTableWidget()
-        self.tableModel.setRowCount(100)
-        self.tableModel.setColumnCount(2)
-        self.tabOutputs.addTab(self.tableModel, 'TABLE')
+        self.tableModel = ProfileTableModel(parent=self)
+        self.tableView = QTableView()
+        self.tableView.setAlternatingRowColors(True)
+        self.tableView.setModel(self.tableModel)
+        self.tabOutputs.addTab(self.tableView, 'TABLE')
 
         # PRESSURE GRAPH
         self.pg =PlotPressureGraphWidget(self.divePlan)
@@ -135,7 +143,8 @@ class pydplan_main(QMainWindow):
         central.setLayout(lay_main)
         self.setCentralWidget(central)
 
-        self.drawNewProfile()
+        # the first plan is calculated right now, the later ones in the worker thread
+        self.calculateNewProfile()
         self.show()
 
         # define one exit action
@@ -155,6 +164,10 @@ class pydplan_main(QMainWindow):
         self.setWindowTitle("pydplan dive planner prototype")
         self.show()
 
+    def closeEvent(self, event):
+        self.planScheduler.shutdown()
+        super().closeEvent(event)
+
     # handler for toolbar buttons
     def r_tool_B1_pressed(self, qact):
         print('toolbar button pressed')
@@ -664,15 +677,33 @@ class pydplan_main(QMainWindow):
 
 
     def drawNewProfile(self):
-        divePlan = self.divePlan
+        # called by every input change, the plan is calculated after the inputs have settled
+        self.planScheduler.request()
+
+    def newPlanInput(self):
+        # a copy of the current inputs, for calculating in the worker thread
         self.getNewProfileSettings()
+        return self.divePlan.inputCopy()
+
+    def calculateNewProfile(self):
+        # calculate in this thread and wait for the result
+        newPlan = self.newPlanInput()
         try:
-            modelRun = calculatePlan(divePlan)
+            calculatePlan(newPlan)
         except ValueError as error:
-            errormsg = error.args[0]
-            msg = QMessageBox.information(self,
-                                          "calculatePlan() exception",
-                                          errormsg)
+            self.planFailed(error.args[0])
+            return
+        self.showNewProfile(newPlan)
+
+    def planFailed(self, errormsg):
+        msg = QMessageBox.information(self,
+                                      "calculatePlan() exception",
+                                      errormsg)
+
+    def showNewProfile(self, calculatedPlan):
+        # publish all results at once, the widgets are drawn after this from the same results
+        divePlan = self.divePlan
+        divePlan.setResults(calculatedPlan)
 
         # if calc deco mode, then output the stops
         if self.divePlan.planMode == PlanMode.Calculate.value:
@@ -709,9 +740,10 @@ class pydplan_main(QMainWindow):
 
 
         # dump model data to a table, that can be seen under tab 'TABLE'
-        #tableUpdate(self.tableModel, modelRun)
-        #tableUpdate2(self.tableModel, modelRun)
-        tableUpdate3(self.tableModel, self.divePlan.profileSampled)
+        # the table model formats only the cells that are shown
+        from pydplan_table import sizeProfileColumns
+        self.tableModel.setProfile(self.divePlan.profileSampled)
+        sizeProfileColumns(self.tableView)
 
 ##################################################################################################
 # main window loop starts now
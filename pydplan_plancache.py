@@ -0,0 +1,338 @@
+#!/usr/bin/python
+# (c) 2018 Ian Leiman, ian.leiman@gmail.com
+# pydplan_plancache
+# part of PYDPLAN, a Python Dive Planner with PyQt5 GUI
+# results of calculated plans, kept under a fingerprint of the inputs of the plan, so the same plan is not
+# calculated again
+#
+# planFingerprint() hashes only the inputs calculatePlan() reads: the settings, the tanks, the planned stops in
+# Custom mode and the later dives of a repetitive dive day, and the options. Labels, colors, the widget
+# dictionaries and the results of an earlier calculation do not change the fingerprint.
+# The fingerprint also has a hash of the source of the calculation modules, so the results of an older version
+# of the code are not used.
+# The results are kept in a bounded LRU cache in memory, and optionally as JSON files in a cache directory, which
+# are shared by all processes of the user using the same directory. The files are plain data, reading them does
+# not run any code, but a file that is changed gives wrong results, so the directory must be private to the user,
+# it is created with mode 0o700.
+#
+import os
+import json
+import hashlib
+import importlib
+import threading
+from array import array
+from collections import OrderedDict
+
+from pydplan_buhlmann import Buhlmann
+from pydplan_classes import PlanMode, PlanResult, DecoStop, ScubaTank, TankType
+from pydplan_history import ModelHistory, ModelPointView
+from pydplan_profiletools import runPlan, DiveProfilePoint, DivePhase
+
+# change this when the inputs or the format of the files change, so the old results are not used
+FINGERPRINT_VERSION = 2
+# the modules whose source is in the fingerprint, a change in any of them changes the results
+CODE_MODULES = ('pydplan_buhlmann', 'pydplan_classes', 'pydplan_history', 'pydplan_vector',
+                'pydplan_profiletools', 'pydplan_plancache')
+# the options of calculatePlan() that change the results, with their defaults
+PLAN_OPTIONS = {'engine': 'python', 'decoSolver': 'step', 'quantize': True, 'stepping': 'fixed',
+                'sampleInterval': 60.0}
+# the inputs of calculatePlan() that change the results, maxDepth, rates and modelConstants are not used
+PLAN_INPUTS = ('planMode', 'GFlow', 'GFhigh', 'bottomDepth', 'bottomTime', 'descRate', 'descTime',
+               'ascRateToDeco', 'ascRateAtDeco', 'ascRateToSurface', 'nDives', 'surfaceTime')
+# the tank inputs, the pressure is set from bar when the plan starts, name is in the results of planSummary()
+TANK_INPUTS = ('name', 'use', 'o2', 'he', 'changeDepth', 'liters', 'bar', 'SAC', 'ppo2max', 'type', 'useOrder')
+PLAN_CACHE_DIR = 'plans'
+# the values of the results stored as they are, the profile, model, stops and tanks are converted
+RESULT_VALUES = ('totalTime', 'ascentBegins', 'changeDepth', 'maxPPoxygen', 'maxPPnitrogen', 'maxPPhelium',
+                 'maxPPanyGas', 'maxTCpressure', 'maxTCnitrogen', 'maxTChelium')
+# the values of a profile point stored as they are, divephase, tank and modelpoint are converted
+POINT_VALUES = tuple(name for name in DiveProfilePoint.__slots__ if name not in ('divephase', 'tank', 'modelpoint'))
+
+
+def canonical(value):
+    '''the same value for the same number, so 30 and 30.0 give the same fingerprint'''
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+
+_codeFingerprint = None
+
+def codeFingerprint():
+    '''SHA-256 hash of the source of the CODE_MODULES, calculated once'''
+    global _codeFingerprint
+    if _codeFingerprint is None:
+        code = hashlib.sha256()
+        for name in CODE_MODULES:
+            with open(importlib.import_module(name).__file__, 'rb') as source:
+                code.update(source.read())
+        _codeFingerprint = code.hexdigest()
+    return _codeFingerprint
+
+
+def planFingerprint(divePlan, **options):
+    '''the hash of the inputs and options that change the results of calculatePlan()
+
+    Two plans with the same fingerprint have the same results.
+    :param divePlan: the plan, it is not changed
+    :type divePlan: DivePlan
+    :param options: the calculatePlan() options, the missing ones have their default values, verbose and
+        checkpoints do not change the results
+    :return: SHA-256 hash as a hex string
+    :rtype: str
+    '''
+    for name in options.keys():
+        if name not in PLAN_OPTIONS and name not in ('verbose', 'checkpoints'):
+            raise ValueError('unknown option <{}>'.format(name))
+    inputs = {
+        'version': FINGERPRINT_VERSION,
+        'code': codeFingerprint(),
+        'options': {name: canonical(options.get(name, default)) for name, default in PLAN_OPTIONS.items()},
+        'plan': {name: canonical(getattr(divePlan, name)) for name in PLAN_INPUTS},
+        'tanks': {tankType.name: {name: canonical(getattr(tank, name)) for name in TANK_INPUTS}
+                  for tankType, tank in divePlan.tankList.items()},
+    }
+    if divePlan.planMode == PlanMode.Custom.value:
+        inputs['stops'] = [[canonical(stop.depth), canonical(stop.time)] for stop in divePlan.decoStopList]
+    if divePlan.nDives > 1:
+        inputs['dives'] = [[canonical(duration), canonical(gf)]
+                           for duration, gf in zip(divePlan.diveDurations, divePlan.diveGFs)]
+    text = json.dumps(inputs, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode('ascii')).hexdigest()
+
+
+def planCacheDir():
+    '''the directory of the cached plans, in $PYDPLAN_CACHE_DIR or in ~/.cache/pydplan, it must be private to the
+    user, as the results are read from it as they are'''
+    cacheDir = os.environ.get('PYDPLAN_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'pydplan')
+    return os.path.join(cacheDir, PLAN_CACHE_DIR)
+
+
+def tankName(tankList, tank):
+    '''the TankType name of a tank of tankList, or None'''
+    for tankType, listed in tankList.items():
+        if listed is tank:
+            return tankType.name
+    return None
+
+
+def resultData(result):
+    '''the results as plain data for a JSON file
+
+    The profile points refer to their tank by TankType name and to their model state by the row in the model.
+    :type result: PlanResult
+    :rtype: dict
+    '''
+    history = result.model
+    points = []
+    for point in result.profileSampled:
+        values = {name: getattr(point, name) for name in POINT_VALUES}
+        values['divephase'] = point.divephase.name
+        values['tank'] = tankName(result.tankList, point.tank)
+        values['row'] = point.modelpoint.row if isinstance(point.modelpoint, ModelPointView) else None
+        points.append(values)
+    data = {name: getattr(result, name) for name in RESULT_VALUES}
+    data.update({
+        'profile': points,
+        'model': {name: getattr(history, name)[:len(history) * history.COMPS].tolist()
+                  for name in ModelHistory.TISSUE_COLUMNS},
+        'stops': [None if stop is None else {name: getattr(stop, name) for name in DecoStop.__slots__}
+                  for stop in result.decoStopsCalculated],
+        'tanks': {tankType.name: {name: getattr(tank, name) for name in ScubaTank.__slots__}
+                  for tankType, tank in result.tankList.items()},
+        'currentTank': tankName(result.tankList, result.currentTank),
+        'nextTank': tankName(result.tankList, result.nextTank),
+    })
+    data['model'].update({name: getattr(history, name)[:len(history)].tolist()
+                          for name in ModelHistory.SCALAR_COLUMNS + ModelHistory.INTEGER_COLUMNS})
+    data['model']['length'] = len(history)
+    return data
+
+
+def resultFromData(data):
+    '''the PlanResult of resultData(), raises KeyError, TypeError or ValueError if the data is not valid
+
+    :type data: dict
+    :rtype: PlanResult
+    '''
+    result = PlanResult()
+    for name in RESULT_VALUES:
+        setattr(result, name, data[name])
+    result.tankList = dict()
+    for name, values in data['tanks'].items():
+        tank = ScubaTank.__new__(ScubaTank)
+        for key in ScubaTank.__slots__:
+            setattr(tank, key, values[key])
+        result.tankList[TankType[name]] = tank
+    tank = lambda name: None if name is None else result.tankList[TankType[name]]
+    result.currentTank = tank(data['currentTank'])
+    result.nextTank = tank(data['nextTank'])
+
+    columns = data['model']
+    history = ModelHistory(capacity=0)
+    history.length = history.capacity = int(columns['length'])
+    for name in ModelHistory.TISSUE_COLUMNS + ModelHistory.SCALAR_COLUMNS:
+        setattr(history, name, array('d', columns[name]))
+    for name in ModelHistory.INTEGER_COLUMNS:
+        setattr(history, name, array('q', columns[name]))
+    for name in ModelHistory.TISSUE_COLUMNS:
+        if len(getattr(history, name)) != history.length * history.COMPS:
+            raise ValueError('model column <{}> has a wrong length'.format(name))
+    for name in ModelHistory.SCALAR_COLUMNS + ModelHistory.INTEGER_COLUMNS:
+        if len(getattr(history, name)) != history.length:
+            raise ValueError('model column <{}> has a wrong length'.format(name))
+    result.model = history
+    result.modelUsed = Buhlmann().model['ZHL16c']
+
+    result.profileSampled = []
+    for values in data['profile']:
+        point = DiveProfilePoint.__new__(DiveProfilePoint)
+        for name in POINT_VALUES:
+            setattr(point, name, values[name])
+        point.divephase = DivePhase[values['divephase']]
+        point.tank = tank(values['tank'])
+        point.modelpoint = None if values['row'] is None else history[values['row']]
+        result.profileSampled.append(point)
+    result.decoStopsCalculated = []
+    for values in data['stops']:
+        stop = None
+        if values is not None:
+            stop = DecoStop(values['depth'], values['time'], values['number'])
+            stop.done = values['done']
+            stop.runtime = values['runtime']
+        result.decoStopsCalculated.append(stop)
+    return result
+
+
+class PlanCache():
+    """
+    results of calculated plans by fingerprint, a bounded LRU cache in memory and optionally a directory of files
+    The results are shared by everyone who gets them from the cache, so they must not be changed.
+    DivePlan.setResults() copies the tank results, so it can be used.
+    """
+    def __init__(self, size=128, directory=None):
+        '''
+        :param size: plans kept in memory
+        :type size: int
+        :param directory: directory of the cached plans, None keeps them only in memory
+        :type directory: str
+        '''
+        self.size = size
+        self.directory = directory
+        self.recent = OrderedDict()
+        # the GUI worker and the threads of runPlan() use the same cache
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+
+    def path(self, fingerprint):
+        return os.path.join(self.directory, fingerprint + '.json')
+
+    def get(self, fingerprint):
+        '''
+        :return: the cached results, or None if the plan has not been calculated
+        :rtype: PlanResult or None
+        '''
+        with self.lock:
+            result = self.recent.get(fingerprint)
+            if result is not None:
+                self.hits += 1
+                self.recent.move_to_end(fingerprint)
+                return result
+        if self.directory is not None:
+            result = self.load(fingerprint)
+        with self.lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.diskHits += 1
+            self.remember(fingerprint, result)
+        return result
+
+    def put(self, fingerprint, result):
+        with self.lock:
+            self.remember(fingerprint, result)
+        if self.directory is not None:
+            self.save(fingerprint, result)
+
+    def remember(self, fingerprint, result):
+        # called with the lock
+        self.recent[fingerprint] = result
+        self.recent.move_to_end(fingerprint)
+        if len(self.recent) > self.size:
+            self.recent.popitem(last=False)
+
+    def load(self, fingerprint):
+        '''the results of a file, only data is read from it, no code is run'''
+        try:
+            with open(self.path(fingerprint), 'r') as cached:
+                data = json.load(cached)
+            if data.get('fingerprint') != fingerprint:
+                return None
+            return resultFromData(data)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError, IndexError):
+            # no file, or a file that is not valid, it is calculated again
+            return None
+
+    def save(self, fingerprint, result):
+        '''a new file is renamed over the old one, so other processes never read half a file'''
+        path = self.path(fingerprint)
+        temporary = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+        data = resultData(result)
+        data['fingerprint'] = fingerprint
+        try:
+            # only the user can read and write the cached results
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            with open(temporary, 'w') as cached:
+                json.dump(data, cached, separators=(',', ':'))
+            os.replace(temporary, path)
+        except OSError:
+            pass # no place to cache, the plan is calculated again by the next process
+
+    def clear(self):
+        '''forget the plans in memory and reset the counters, the files are kept'''
+        with self.lock:
+            self.recent.clear()
+            self.hits = self.diskHits = self.misses = 0
+
+    def stats(self):
+        '''
+        :return: hits in memory, hits from the files, misses, and the plans in memory
+        :rtype: dict
+        '''
+        with self.lock:
+            return {'hits': self.hits, 'diskHits': self.diskHits, 'misses': self.misses,
+                    'size': len(self.recent)}
+
+
+_planCache = None
+
+def planCache():
+    '''the shared PlanCache in memory, created at first use'''
+    global _planCache
+    if _planCache is None:
+        _planCache = PlanCache()
+    return _planCache
+
+
+def cachedPlan(divePlan, cache=None, **options):
+    '''runPlan() of the plan, or its results from the cache if the same plan has been calculated before
+
+    A plan that fails raises the ValueError of calculatePlan() and is not cached.
+    :param divePlan: the plan to calculate, it is not changed
+    :type divePlan: DivePlan
+    :param cache: the cache to use, planCache() if None
+    :type cache: PlanCache
+    :param options: the calculatePlan() options
+    :return: the results, shared with the other users of the cache, they must not be changed
+    :rtype: PlanResult
+    '''
+    if cache is None:
+        cache = planCache()
+    fingerprint = planFingerprint(divePlan, **options)
+    result = cache.get(fingerprint)
+    if result is None:
+        result = runPlan(divePlan, **options)
+        cache.put(fingerprint, result)
+    return result
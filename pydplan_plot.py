@@ -4,11 +4,16 @@
 # part of PYDPLAN, a Python Dive Planner with PyQt5 GUI
 # plotting tools
 
+from array import array
+from itertools import compress, islice
+from operator import attrgetter, ne
+
 from PyQt5.QtCore import Qt, QLineF, QPointF
-from PyQt5.QtGui import QPainter, QPainterPath, QLinearGradient, QBrush, QPen, QColor
+from PyQt5.QtGui import QPainter, QPainterPath, QLinearGradient, QBrush, QPen, QColor, QPixmap, QPolygonF
 from PyQt5.QtWidgets import QWidget
 
 from pydplan_buhlmann import ModelPoint
+from pydplan_decimate import pixelRuns, envelopeIndices
 
 
 colors = [Qt.black, Qt.gray, Qt.lightGray, Qt.darkGray,
@@ -16,11 +21,96 @@ colors = [Qt.black, Qt.gray, Qt.lightGray, Qt.darkGray,
           Qt.blue, Qt.darkBlue, Qt.cyan, Qt.darkCyan,
           Qt.darkMagenta, Qt.magenta, Qt.yellow, Qt.darkRed]
 
+
+def bulkPolygon(xs, ys):
+    '''a QPolygonF of the points (xs[n], ys[n]), the coordinates are copied to it in one block
+
+    Drawing the polygon with one drawPolyline() call replaces a drawLine() call for each segment.
+    :param xs: x coordinates
+    :type xs: list
+    :param ys: y coordinates, same length as xs
+    :type ys: list
+    :rtype: QPolygonF
+    '''
+    count = len(xs)
+    coordinates = array('d', [0.0]) * (2 * count)
+    coordinates[0::2] = array('d', xs)
+    coordinates[1::2] = array('d', ys)
+    polygon = QPolygonF(count)
+    if count:
+        pointer = polygon.data()
+        pointer.setsize(len(coordinates) * coordinates.itemsize)
+        memoryview(pointer)[:] = memoryview(coordinates).cast('B')
+    return polygon
+
+
+def envelopePolygon(start, xs, values, runs, offset, scale, lowest=None):
+    '''bulkPolygon() of the min/max envelope of a curve, see pydplan_decimate, with y = offset + value * scale
+
+    Only the kept points are scaled, so a long profile costs a few points per pixel column instead of all its samples.
+    :param start: the first point of the polygon, before the curve
+    :type start: tuple
+    :param xs: x coordinates of the values, in pixels
+    :type xs: list
+    :param values: the model values of the curve
+    :type values: list or array
+    :param runs: pixelRuns(xs)
+    :type runs: list
+    :param lowest: smaller y coordinates are raised to this
+    :type lowest: float
+    :rtype: QPolygonF
+    '''
+    kept = envelopeIndices(values, runs)
+    if isinstance(kept, range):
+        # nothing to reduce
+        px = [start[0]] + xs
+        py = [start[1]]
+        py.extend([offset + value * scale for value in values])
+    else:
+        px = [start[0]]
+        px.extend([xs[n] for n in kept])
+        py = [start[1]]
+        py.extend([offset + values[n] * scale for n in kept])
+    if lowest is not None:
+        py = [y if y > lowest else lowest for y in py]
+    return bulkPolygon(px, py)
+
+
+def depthPath(plan, plot_width, plot_height, xs, runs):
+    '''the closed area of the depth profile, from the surface at time zero back to the surface at the end
+
+    :param xs: profileX() of the plan
+    :param runs: pixelRuns(xs)
+    '''
+    scale = plot_height / plan.maxDepth
+    polygon = envelopePolygon((0.0, 0.0), xs, [point.depth for point in plan.profileSampled], runs, 0.0, scale)
+    polygon.append(QPointF(plot_width, 0.0))
+    polygon.append(QPointF(0.0, 0.0))
+    path = QPainterPath()
+    path.addPolygon(polygon)
+    path.closeSubpath()
+    return path
+
+
+def profileX(plan, plot_width):
+    '''x coordinates of the profile points, the runtime scaled to plot_width'''
+    totalTime = plan.profileSampled[-1].time
+    return [(point.time / totalTime) * plot_width for point in plan.profileSampled]
+
+
 class PlotBelowWidget(QWidget):
+    # pen color and width, label and its offset of each curve of buildCurves()
+    CURVES = ((Qt.darkGreen, 2, 'ppO2', 0),
+              (Qt.blue, 1, 'ppHe', 0),
+              (Qt.darkYellow, 1, 'ppN2', -10))
+
     def __init__(self, plan=None):
         super().__init__()
         self.plan  = plan
         self.maxPressure = 3.0
+        # the decimated curves, rebuilt when the plan version or the widget size changes
+        self.curveKey = None
+        self.curves = None
         self.initUI()
 
     def initUI(self):
@@ -46,33 +136,16 @@ class PlotBelowWidget(QWidget):
         self.totalTime = self.plan.profileSampled[-1].time
         self.maxPressure = self.plan.maxPPanyGas
 
-        # draw the ppo2
-        x1, y1 = (0, self.plot_height )
-        qp.setPen(QPen(Qt.darkGreen, 2, Qt.SolidLine))
-        for point in  profile:
-            x = (point.time / self.totalTime) * self.plot_width
-            y = (1 - point.ppOxygen / self.maxPressure) * self.plot_height
-            qp.drawLine(QLineF(x1, y1, x, y))
-            x1, y1 = x, y
-        qp.drawText(QPointF(x - 20, y), 'ppO2')
-        # draw the ppHe
-        x1, y1 = (0, self.plot_height )
-        qp.setPen(QPen(Qt.blue, 1, Qt.SolidLine))
-        for point in  profile:
-            x = (point.time / self.totalTime) * self.plot_width
-            y = (1 - point.ppHelium / self.maxPressure) * self.plot_height
-            qp.drawLine(QLineF(x1, y1, x, y))
-            x1, y1 = x, y
-        qp.drawText(QPointF(x - 20, y), 'ppHe')
-        # draw the ppN2
-        x1, y1 = (0, self.plot_height )
-        qp.setPen(QPen(Qt.darkYellow, 1, Qt.SolidLine))
-        for point in  profile:
-            x = (point.time / self.totalTime) * self.plot_width
-            y = (1 - point.ppNitrogen / self.maxPressure) * self.plot_height
-            qp.drawLine(QLineF(x1, y1, x, y))
-            x1, y1 = x, y
-        qp.drawText(QPointF(x - 20, y-10), 'ppN2')
+        # draw the partial pressure curves, each one from the surface at time zero
+        key = (self.plan.version, self.plot_width, self.plot_height)
+        if key != self.curveKey:
+            self.curves = self.buildCurves(profile)
+            self.curveKey = key
+        for (color, width, label, labelOffset), polygon in zip(self.CURVES, self.curves):
+            qp.setPen(QPen(color, width, Qt.SolidLine))
+            qp.drawPolyline(polygon)
+            end = polygon.last()
+            qp.drawText(QPointF(end.x() - 20, end.y() + labelOffset), label)
 
         # draw ppo2=1.6 limit (common deco gas limit, bottom gas limit usually 1.4
         y = (1.0 - 1.60 / self.maxPressure) * self.plot_height
@@ -86,6 +159,17 @@ class PlotBelowWidget(QWidget):
         qp.drawLine(QLineF(0, y, self.plot_width, y))
         qp.drawText(QPointF(self.plot_width/2, y + 10), 'ppN2=3.16 limit (END=30m)')
 
+    def buildCurves(self, profile):
+        # the ppO2, ppHe and ppN2 curves as polygons
+        xs = profileX(self.plan, self.plot_width)
+        runs = pixelRuns(xs)
+        scale = self.plot_height / self.maxPressure
+        curves = []
+        for attribute in ('ppOxygen', 'ppHelium', 'ppNitrogen'):
+            values = [getattr(point, attribute) for point in profile]
+            curves.append(envelopePolygon((0.0, self.plot_height), xs, values, runs, self.plot_height, -scale))
+        return curves
+
     def drawPressureGrid(self, qp):
         qp.setPen(QPen(Qt.gray, 1, Qt.DotLine))
         # pressure lines at maxPressure/6 bar intervals
@@ -108,8 +192,14 @@ class PlotPlanWidget(QWidget):
         self.TC = None
         self.maxTC = None
         self.initUI()
-        self.ceilingPlotX = []
-        self.ceilingPlotY = [[]]
+        # the plot is drawn to a pixmap, and the geometry of the profile is kept for redrawing it,
+        # both are rebuilt only when the plan version or the widget size changes
+        self.layerKey = None
+        self.layerPixmap = None
+        self.geometryKey = None
+        self.depthPath = None
+        self.ceilingPolygons = []
+        self.tankSegments = []
     # initialize the window
     def initUI(self):
         self.qp = QPainter()
@@ -118,20 +208,40 @@ class PlotPlanWidget(QWidget):
     # set the vectorised format of profile
     def setPlan(self, plan):
         self.plan = plan
+        self.layerKey = None
+        self.geometryKey = None
 
     # when any event occurs, like resize, we also redraw the plot
     def paintEvent(self, e):
-        #qp = QPainter()
-        self.qp.begin(self)
         self.drawSize(self.qp)
+        ratio = self.devicePixelRatioF()
+        key = (self.plan.version, self.plot_width, self.plot_height, ratio)
+        if key != self.layerKey:
+            self.drawLayers(ratio)
+            self.layerKey = key
+        # a plain expose only copies the pixmap
+        self.qp.begin(self)
+        self.qp.drawPixmap(0, 0, self.layerPixmap)
+        self.qp.end()
+
+    def drawLayers(self, ratio):
+        # draw all the layers of the plot to a new pixmap
+        self.layerPixmap = QPixmap(self.size() * ratio)
+        self.layerPixmap.setDevicePixelRatio(ratio)
+        self.layerPixmap.fill(self.palette().color(self.backgroundRole()))
+        self.buildGeometry()
+        self.qp.begin(self.layerPixmap)
+        self.qp.setFont(self.font())
         self.drawDepth(self.qp)
-        self.drawDepthGrid(self.qp)
-        self.drawTimeGrid(self.qp)
-        self.drawCeilings(self.qp)
-        # self.drawCeilingMargin(self.qp)
-        self.drawTanks(self.qp)
-        self.drawTankPressure(self.qp)
-        #self.drawTC(self.qp)
+        # the rest needs a calculated profile
+        if self.depthPath is not None:
+            self.drawDepthGrid(self.qp)
+            self.drawTimeGrid(self.qp)
+            self.drawCeilings(self.qp)
+            # self.drawCeilingMargin(self.qp)
+            self.drawTanks(self.qp)
+            self.drawTankPressure(self.qp)
+            #self.drawTC(self.qp)
         self.qp.end()
 
     # redraw the depth profile plot
@@ -141,6 +251,34 @@ class PlotPlanWidget(QWidget):
         self.plot_width = size.width() -50
         self.plot_height = size.height() -20
 
+    def buildGeometry(self):
+        # the depth profile path and the ceiling lines of the compartments, in widget coordinates
+        key = (self.plan.version, self.plot_width, self.plot_height)
+        if key == self.geometryKey:
+            return
+        self.geometryKey = key
+        self.depthPath = None
+        self.ceilingPolygons = []
+        self.tankSegments = []
+        if not self.plan.profileSampled :
+            return
+        profileSampled = self.plan.profileSampled
+        self.totalTime = profileSampled[-1].time
+        self.depthMax = self.plan.maxDepth
+
+        # now we build the DEPTH profile, both it and the ceilings are decimated to the pixel columns
+        xs = profileX(self.plan, self.plot_width)
+        runs = pixelRuns(xs)
+        self.depthPath = depthPath(self.plan, self.plot_width, self.plot_height, xs, runs)
+        self.buildTankPressure(xs)
+
+        # compute the ceiling plots (x,y) for individual tissue compartments, each line starts from the surface
+        scale = self.plot_height / self.depthMax
+        for tc in range(ModelPoint.COMPS):
+            ceilings = self.plan.model.compartmentColumn('ceilings', tc)
+            # the ceilings below the surface are drawn at the surface
+            self.ceilingPolygons.append(envelopePolygon((0.0, 0.0), xs, ceilings, runs, 0.0, scale, lowest=0.0))
+
     def drawDepth(self, qp):
 
         # Fill plot bg area
@@ -157,81 +295,25 @@ class PlotPlanWidget(QWidget):
         qp.drawPath(bgPath)
         qp.drawText(QPointF(50, 50), 'placeholder for the profile plot widget')
 
-        if not self.plan.profileSampled :
+        if self.depthPath is None :
             return
 
-        self.totalTime = self.plan.profileSampled[-1].time
-        self.depthMax = self.plan.maxDepth
-
         # now we plot the DEPTH profile
-        depthPath = QPainterPath()
-        depthPath.moveTo(0.0, 0.0)
-        #point: DiveProfilePoint
-        for n, point in enumerate( self.plan.profileSampled):
-            x = (point.time / self.totalTime ) * self.plot_width
-            y = (point.depth  / self.depthMax) * self.plot_height
-            depthPath.lineTo(x, y)
-
-        depthPath.lineTo(self.plot_width, 0.0)
-        depthPath.lineTo(0.0, 0.0)
-        depthPath.closeSubpath()
         gradient = QLinearGradient(0, 0, 0, 100)
         gradient.setColorAt(0.0, Qt.cyan)
         gradient.setColorAt(1.0, Qt.blue)
         qp.setBrush(QBrush(gradient))
-        qp.drawPath(depthPath)
+        qp.drawPath(self.depthPath)
 
     # redraw the ceiling depths
     def drawCeilings(self, qp):
 
-        if not self.plan.profileSampled :
-            return
-        profileSampled = self.plan.profileSampled
-        self.ceilingPlotX = [0 for y in range(len(profileSampled)) ]
-        self.ceilingPlotY = [[0 for x in range(len(profileSampled))] for y in range(ModelPoint.COMPS)]
-
-        # draw the point.ceiling_use_3m line in green
-        x1, y1 = (0, 0)
-        pen = QPen(Qt.green, 2, Qt.SolidLine)
-        qp.setPen(pen)
-        for n, point in enumerate(profileSampled):
-            x = (point.time / self.totalTime) * self.plot_width
-            self.ceilingPlotX[n] = x
-            y = point.modelpoint.leadCeilingStop / self.depthMax * self.plot_height
-            # qp.drawLine(QLineF(x1, y1, x, y))
-            x1, y1 = x, y
-            #at the same go we compute the ceiling plots (x,y) for individual tissue compartments
-            for tc in range(ModelPoint.COMPS):
-                if not point.modelpoint.ceilings:
-                    yCeiling = 0.0
-                elif point.modelpoint.ceilings[tc] > 0.0:
-                    yCeiling = (point.modelpoint.ceilings[tc] / self.depthMax) * self.plot_height
-                else:
-                    yCeiling = 0.0
-                self.ceilingPlotY[tc][n] = yCeiling
-
-        # draw the running average depth
-        x1, y1 = (0, 0)
-        # qp.setPen(QPen(Qt.lightGray, 1, Qt.SolidLine))
-        for point in  profileSampled:
-            x = (point.time / self.totalTime) * self.plot_width
-            y = point.depthRunAvg / self.depthMax * self.plot_height
-            # qp.drawLine(QLineF(x1, y1, x, y))
-            x1, y1 = x, y
-        # qp.drawText(QPointF(x + 10, y), 'AVG')
-
         # now draw the tissue compartment ceilings one by one
-        for tc in range(ModelPoint.COMPS):
+        for tc, polygon in enumerate(self.ceilingPolygons):
             color = QColor(tc*15, 255-(tc*15), tc*15)
             pen = QPen(color, 1, Qt.SolidLine)
             qp.setPen(pen)
-            x1, y1 = (0, 0)
-            for n in range(len(self.ceilingPlotX)):
-                x = self.ceilingPlotX[n]
-                y = self.ceilingPlotY[tc][n]
-                qp.drawLine(QLineF(x1, y1, x, y))
-                x1 = x
-                y1 = y
+            qp.drawPolyline(polygon)
 
     # redraw the ceiling margin
     def drawCeilingMargin(self, qp):
@@ -353,36 +435,50 @@ class PlotPlanWidget(QWidget):
                 qp.drawLine(QLineF(x1, self.plot_height, x1, yTxt))
                 qp.drawLine(QLineF(x1, yTxt, self.plot_width, yTxt))
 
+    def buildTankPressure(self, xs):
+        # the tank pressure curve split to the segments of each tank used, with the labels of its
+        # first and last pressure
+        profileSampled = self.plan.profileSampled
+        tanks = list(map(attrgetter('tank'), profileSampled))
+        pressures = list(map(attrgetter('currentTankPressure'), profileSampled))
+        scale = -self.plot_height / 300.0
+        changes = [0]
+        changes.extend(compress(range(1, len(tanks)), map(ne, tanks, islice(tanks, 1, None))))
+        changes.append(len(tanks))
+        self.tankSegments = []
+        for start, end in zip(changes, changes[1:]):
+            y = self.plot_height + pressures[start] * scale
+            # the segment begins with a level line from the previous point
+            polygon = envelopePolygon((xs[start - 1] if start else 0.0, y), xs[start:end], pressures[start:end],
+                                      pixelRuns(xs[start:end]), self.plot_height, scale)
+            labels = [QPointF(xs[start] + 2, y), '{:.0f}'.format(pressures[start])]
+            if end < len(tanks):
+                if pressures[end - 1]:
+                    labels.extend([QPointF(xs[end] - 5, self.plot_height + pressures[end - 1] * scale),
+                                   '{:.0f}'.format(pressures[end - 1])])
+            else:
+                labels.extend([QPointF(xs[-1] + 10, self.plot_height + pressures[-1] * scale),
+                               '{:.0f}'.format(pressures[-1])])
+            self.tankSegments.append((QColor(tanks[start].color), polygon, labels))
+
     def drawTankPressure(self, qp):
 
         # draw the tank pressure
-        previousTank = None
-        lastPressure = None
-        x1 = 0
-        y1 = (1.0 - self.plan.profileSampled[0].currentTankPressure / 300.0) * self.plot_height
-
-        for point in  self.plan.profileSampled:
-            thisTank = point.tank
-            x = (point.time / self.totalTime) * self.plot_width
-            y = (1.0 - point.currentTankPressure / 300.0) * self.plot_height
-            if thisTank != previousTank:
-                if lastPressure :
-                    qp.drawText(QPointF(x -5,y1) , '{:.0f}'.format(lastPressure))
-                qp.setPen(QPen(QColor(thisTank.color), 2, Qt.SolidLine))
-                qp.drawText(QPointF(x + 2, y), '{:.0f}'.format(point.currentTankPressure))
-                y1 = y
-
-            qp.drawLine(QLineF(x1, y1, x, y))
-            x1, y1 = x, y
-            previousTank = thisTank
-            lastPressure = point.currentTankPressure
-        qp.drawText(QPointF(x + 10, y), '{:.0f}'.format(lastPressure))
+        for color, polygon, labels in self.tankSegments:
+            qp.setPen(QPen(color, 2, Qt.SolidLine))
+            qp.drawText(labels[0], labels[1])
+            qp.drawPolyline(polygon)
+            for n in range(2, len(labels), 2):
+                qp.drawText(labels[n], labels[n + 1])
 
 ##############################################################################################
 class PlotTissuesWidget(QWidget):
     def __init__(self, plan=None):
         super().__init__()
         self.plan = plan
+        # the decimated depth area and compartment curves, rebuilt when the plan version or the widget size changes
+        self.curveKey = None
+        self.curves = None
         self.initUI()
 
     # initialize the window
@@ -392,11 +488,13 @@ class PlotTissuesWidget(QWidget):
 
     def setPlan(self, plan):
         self.plan = plan
+        self.curveKey = None
 
     # when any event occurs, like resize, we also redraw the plot
     def paintEvent(self, e):
         self.qp.begin(self)
         self.drawSize(self.qp)
+        self.buildCurves()
         self.drawDepthGrey(self.qp)
         self.drawTC(self.qp)
         self.qp.end()
@@ -406,6 +504,27 @@ class PlotTissuesWidget(QWidget):
         self.plot_width = size.width() -50
         self.plot_height = size.height() -20
 
+    def buildCurves(self):
+        # the depth area and the nitrogen and helium pressure curves of each compartment
+        key = (self.plan.version, self.plot_width, self.plot_height)
+        if key == self.curveKey:
+            return
+        self.curveKey = key
+        self.curves = dict(depth=None, nitrogen=[], helium=[])
+        if not self.plan.profileSampled :
+            return
+        xs = profileX(self.plan, self.plot_width)
+        runs = pixelRuns(xs)
+        self.curves['depth'] = depthPath(self.plan, self.plot_width, self.plot_height, xs, runs)
+        # nitrogen on the upper half, helium below it
+        levels = (('nitrogen', self.plot_height / 2.0 + 10, (self.plot_height / 2.0) / self.plan.maxTCnitrogen),
+                  ('helium', self.plot_height, (self.plot_height / 2.2) / (self.plan.maxTChelium or 1.0)))
+        for gas, zeroLevel, scale in levels:
+            for tc in range(ModelPoint.COMPS):
+                # each curve starts from the corner, as the first segment has always been drawn from (0, 0)
+                self.curves[gas].append(envelopePolygon((0.0, 0.0), xs, self.plan.model.compartmentColumn(gas, tc),
+                                                        runs, zeroLevel, -scale))
+
     def drawTC(self, qp):
         if not self.plan.model :
             return
@@ -413,20 +532,11 @@ class PlotTissuesWidget(QWidget):
         # now draw the tissue compartment pressures one by one for N2
         maxN2press = self.plan.maxTCnitrogen
         zeroLevel = self.plot_height / 2.0 + 10
-        for tc in range(ModelPoint.COMPS):
+        for tc, polygon in enumerate(self.curves['nitrogen']):
             color = colors[tc]
             #color = QColor(tc*15, 15+(tc*15), 255-tc*15)
             qp.setPen(QPen(color, 1, Qt.SolidLine))
-
-            x1, y1 = (0, 0)
-            for n, point in enumerate( self.plan.profileSampled):
-                x = (point.time / self.totalTime) * self.plot_width
-                #x = (n / len(self.plan.model)) * self.plot_width
-                pressure = point.modelpoint.tissues[tc].nitrogenPressure
-                y =  zeroLevel - ( (pressure / maxN2press) * (self.plot_height /2.0))
-                qp.drawLine(QLineF(x1, y1, x, y))
-                x1 = x
-                y1 = y
+            qp.drawPolyline(polygon)
 
         qp.setPen(QPen(Qt.black, 1, Qt.DashLine))
         qp.drawText(QPointF(10, 10), 'Nitrogen tissue compartment pressures')
@@ -453,19 +563,11 @@ class PlotTissuesWidget(QWidget):
             qp.drawText(QPointF(10, self.plot_height), 'NO HELIUM USED')
             return # there is no helium
         zeroLevel = self.plot_height
-        for tc in range(ModelPoint.COMPS):
+        for tc, polygon in enumerate(self.curves['helium']):
             color = colors[tc]
             #color = QColor(255-(tc*10), tc*10, tc*10)
             qp.setPen(QPen(color, 1, Qt.SolidLine))
-            x1, y1 = (0, 0)
-            for n, point in enumerate(self.plan.profileSampled):
-                x = (point.time / self.totalTime) * self.plot_width
-                #x = (n / len(self.plan.model)) * self.plot_width
-                pressure = point.modelpoint.tissues[tc].heliumPressure
-                y =  zeroLevel - ( (pressure / maxHEpress) * (self.plot_height/heScale))
-                qp.drawLine(QLineF(x1, y1, x, y))
-                x1 = x
-                y1 = y
+            qp.drawPolyline(polygon)
 
         qp.setPen(QPen(Qt.darkGreen, 1, Qt.DashLine))
         qp.drawLine(QLineF(0, zeroLevel, self.plot_width, zeroLevel))
@@ -476,7 +578,7 @@ class PlotTissuesWidget(QWidget):
         while pLine < maxHEpress:
             lineLevel = zeroLevel - (self.plot_height/heScale * (pLine / maxHEpress))
             qp.drawLine(QLineF(0, lineLevel, self.plot_width, lineLevel))
-            qp.drawText(self.plot_width + 10, lineLevel, '{:.1f}'.format(pLine))
+            qp.drawText(QPointF(self.plot_width + 10, lineLevel), '{:.1f}'.format(pLine))
             pLine += 0.5
         # draw ticks
         qp.setPen(QPen(Qt.darkGreen, 1, Qt.SolidLine))
@@ -509,23 +611,16 @@ class PlotTissuesWidget(QWidget):
         self.depthMax = self.plan.maxDepth
 
         # now we plot the DEPTH profile
-        depthPath = QPainterPath()
-        depthPath.moveTo(0.0, 0.0)
-        for n, point in enumerate( self.plan.profileSampled):
-            x = (point.time / self.totalTime ) * self.plot_width
-            y = (point.depth  / self.depthMax) * self.plot_height
-            depthPath.lineTo(x, y)
-
-        depthPath.lineTo(self.plot_width, 0.0)
-        depthPath.lineTo(0.0, 0.0)
-        depthPath.closeSubpath()
         qp.setBrush(QColor(240,240,240))
-        qp.drawPath(depthPath)
+        qp.drawPath(self.curves['depth'])
 
 class PlotPressureGraphWidget(QWidget):
     def __init__(self, plan=None):
         super().__init__()
         self.plan = plan
+        # the decimated compartment curves, rebuilt when the plan version, plot type or widget size changes
+        self.curveKey = None
+        self.curves = None
         self.initUI()
 
     def initUI(self):
@@ -534,6 +629,7 @@ class PlotPressureGraphWidget(QWidget):
 
     def setPlan(self, plan):
         self.plan = plan
+        self.curveKey = None
 
     def paintEvent(self, e):
         self.qp.begin(self)
@@ -556,32 +652,46 @@ class PlotPressureGraphWidget(QWidget):
         offset = -1.0
         qp.setPen(QPen(Qt.darkCyan, 2, Qt.DashLine))
         qp.drawLine(QLineF(0, self.plot_height , self.plot_width, 0))
-        # do x y plot on ambient vs tissue pressures
-        for tc in range(ModelPoint.COMPS):
+        if plot=='Total':
+            title = 'Nitrogen + Helium Pressure plot'
+        elif plot=='Nitrogen':
+            title = 'Nitrogen Pressure plot'
+        elif plot == 'Helium':
+            title = 'Helium Pressure plot'
+        else:
+            return
+        key = (self.plan.version, plot, self.plot_width, self.plot_height)
+        if key != self.curveKey:
+            self.curves = self.buildCurves(plot, scaler, offset)
+            self.curveKey = key
+        for tc, polygon in enumerate(self.curves):
             color = colors[tc]
             qp.setPen(QPen(color, 2, Qt.SolidLine))
             qp.drawText(QPointF(5, 40 + tc * 10), 'TC {}'.format(tc))
-            x1, y1 = (0, self.plot_height)
-
-            for n, mPoint in enumerate( self.plan.model ):
-                #x =  (((mPoint.ambient + offset) / scaler) * self.plot_width)
-                x = scaleToX(mPoint.ambient, scaler, offset, self.plot_width)
-                if plot=='Total':
-                    qp.drawText(QPointF(5, 10), 'Nitrogen + Helium Pressure plot')
-                    TCpressure = mPoint.tissues[tc].nitrogenPressure \
-                                 + mPoint.tissues[tc].heliumPressure
-                elif plot=='Nitrogen':
-                    qp.drawText(QPointF(5, 10), 'Nitrogen Pressure plot')
-                    TCpressure = mPoint.tissues[tc].nitrogenPressure
-                elif plot == 'Helium':
-                    qp.drawText(QPointF(5, 10), 'Helium Pressure plot')
-                    TCpressure = mPoint.tissues[tc].heliumPressure
-                else:
-                    break
-                #y =   self.plot_height - (((TCpressure +offset) / scaler) * self.plot_height)
-                y = scaleToY(TCpressure, scaler, offset, self.plot_height)
-                qp.drawLine(QLineF(x1, y1, x, y))
-                x1, y1 = x, y
+            qp.drawPolyline(polygon)
+        # the title once, with the pen of the last compartment as before
+        qp.drawText(QPointF(5, 10), title)
+
+    def buildCurves(self, plot, scaler, offset):
+        # do x y plot on ambient vs tissue pressures, each curve starts from the lower left corner
+        model = self.plan.model
+        xs = [scaleToX(ambient, scaler, offset, self.plot_width) for ambient in model.column('ambient')]
+        # the ambient pressure is not monotonic, a run ends whenever the curve moves to another pixel column
+        runs = pixelRuns(xs)
+        curves = []
+        for tc in range(ModelPoint.COMPS):
+            if plot=='Total':
+                pressures = [nitrogen + helium for nitrogen, helium in
+                             zip(model.compartmentColumn('nitrogen', tc), model.compartmentColumn('helium', tc))]
+            elif plot=='Nitrogen':
+                pressures = model.compartmentColumn('nitrogen', tc)
+            else:
+                pressures = model.compartmentColumn('helium', tc)
+            # same as scaleToY(pressure, scaler, offset, self.plot_height)
+            curves.append(envelopePolygon((0.0, self.plot_height), xs, pressures, runs,
+                                          self.plot_height - offset / scaler * self.plot_height,
+                                          -self.plot_height / scaler))
+        return curves
 
     def drawMvalueLines(self, qp, plot ='Total', ghHigh = 1.0, gfLow = 1.0):
         scaler = 5.0
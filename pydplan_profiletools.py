@@ -4,9 +4,14 @@
 # part of PYDPLAN, a Python Dive Planner with PyQt5 GUI
 # module for handling dive profile
 
-from pydplan_classes import currentTank, DivePlan, DecoStop
-from copy import deepcopy
-from pydplan_buhlmann import depth2absolutePressure, Buhlmann, ModelPoint, Constants
+import sys
+import math
+import copy
+import threading
+from collections import OrderedDict
+from pydplan_classes import currentTank, DivePlan, DecoStop, PlanResult
+from pydplan_buhlmann import depth2absolutePressure, Buhlmann, ModelPoint, Constants, decoStopMinutes
+from pydplan_history import ModelHistory
 
 # gradient factor object
 class gradientFactor():
@@ -105,15 +110,7 @@ def tanksCheck(diveplan: DivePlan, divephase: DivePhase, beginDepth=0.0, endDept
             divephaseNext = DivePhase.DESCENDING
             diveplan.currentTank = diveplan.tankList[TankType.BOTTOM]
             diveplan.currentTank.useFromTime = runtime
-            if diveplan.tankList[TankType.DECO1].use == True:
-                diveplan.nextTank = diveplan.tankList[TankType.DECO1]
-                diveplan.changeDepth = diveplan.tankList[TankType.DECO1].changeDepth
-            elif diveplan.tankList[TankType.DECO2].use == True:
-                diveplan.nextTank = diveplan.tankList[TankType.DECO2]
-                diveplan.changeDepth = diveplan.tankList[TankType.DECO2].changeDepth
-            else:
-                diveplan.nextTank = None
-                diveplan.changeDepth = -1
+            diveplan.nextTank, diveplan.changeDepth = firstDecoTank(diveplan)
     elif divephase == DivePhase.DESCENDING:
         # just update tank pressure
         divephaseNext = DivePhase.DESCENDING
@@ -196,7 +193,7 @@ def tanksCheck(diveplan: DivePlan, divephase: DivePhase, beginDepth=0.0, endDept
         diveplan.currentTank.useUntilTime = runtime
 
     else:
-        print('tanksCheck: error')
+        print('tanksCheck: error', file=sys.stderr)
         return None, -1, -1
 
     # calculate gas used to update tank pressure
@@ -215,32 +212,353 @@ def tanksCheck(diveplan: DivePlan, divephase: DivePhase, beginDepth=0.0, endDept
     return divephaseNext
 
 
-def calculatePlan(diveplan : DivePlan, verbose=False):
+def firstDecoTank(diveplan: DivePlan):
+    '''the first deco tank in use, DECO1 or DECO2, and its change depth, or None and -1 if no deco tanks'''
+    for tankType in (TankType.DECO1, TankType.DECO2):
+        if diveplan.tankList[tankType].use == True:
+            return diveplan.tankList[tankType], diveplan.tankList[tankType].changeDepth
+    return None, -1
+
+
+def newModelPoint(engine='python'):
+    '''create an empty model state for the selected tissue model engine
+
+    :param engine: 'python' for ModelPoint or 'numpy' for the vectorized VectorModelPoint
+    :type engine: str
+    :return: the model state object
+    :rtype: ModelPoint
+    '''
+    if engine == 'python':
+        return ModelPoint()
+    elif engine == 'numpy':
+        # imported here, so that NumPy is needed only when this engine is selected
+        from pydplan_vector import VectorModelPoint
+        return VectorModelPoint()
+    else:
+        raise ValueError('unsupported engine <{}>'.format(engine))
+
+
+def calculatePlan(diveplan : DivePlan, verbose=False, engine='python', decoSolver='step', quantize=True,
+                  stepping='fixed', sampleInterval=60.0, checkpoints=None):
     '''Calculates a valid diveplan
 
     :param diveplan:
     :type diveplan:
+    :param engine: tissue model engine, 'python' for ModelPoint or 'numpy' for the vectorized VectorModelPoint
+    :type engine: str
+    :param decoSolver: 'step' for fixed interval deco stops, 'analytic' to solve each stop time at once
+    :type decoSolver: str
+    :param quantize: with the analytic solver, round the stop times up to whole minutes
+    :type quantize: bool
+    :param stepping: 'fixed' for the fixed step sizes, 'adaptive' to step from event to event
+    :type stepping: str
+    :param sampleInterval: with adaptive stepping, seconds between the regular samples of the recorded profile
+    :type sampleInterval: float
+    :param checkpoints: continue from the checkpoint of an earlier plan with the same descent and bottom,
+        and keep the checkpoint of this plan, see planSteps()
+    :type checkpoints: PlanCheckpoints
     :return:
     :rtype:
     '''
+    model = newModelPoint(engine)
+    for point in planSteps(diveplan, model, verbose=verbose, decoSolver=decoSolver, quantize=quantize,
+                           stepping=stepping, sampleInterval=sampleInterval, checkpoints=checkpoints):
+        pass
+    return diveplan.model
 
 
-    def calculateStepAscend(depth, interval):
+def runPlan(diveplan : DivePlan, verbose=False, engine='python', decoSolver='step', quantize=True,
+            stepping='fixed', sampleInterval=60.0, checkpoints=None):
+    '''Calculates a plan without changing it, and returns the results separately
+
+    calculatePlan() stores its results to the plan, changes the tank pressures, and for repetitive dives the
+    bottom time and gradient factors. runPlan() calculates an inputCopy() of the plan instead, so the tanks and
+    all the other state of the run are its own, and the plan is only read. The same plan can be run from many
+    threads or processes at the same time, as long as nobody changes it meanwhile.
+    :param diveplan: the plan to calculate, it is not changed
+    :type diveplan: DivePlan
+    :return: the results, with the same options the same results as calculatePlan() gives
+    :rtype: PlanResult
+    '''
+    calculated = diveplan.inputCopy()
+    calculatePlan(calculated, verbose=verbose, engine=engine, decoSolver=decoSolver, quantize=quantize,
+                  stepping=stepping, sampleInterval=sampleInterval, checkpoints=checkpoints)
+    return PlanResult(calculated)
+
+
+def iterPlan(diveplan : DivePlan, engine='python', every=1, events=False, states=False, decoSolver='step',
+             quantize=True, stepping='fixed', checkpoints=None):
+    '''Calculates a plan and yields its profile points as they are ready, without keeping them
+
+    Like calculatePlan(), the results are stored to the plan, and planSummary(diveplan) can be used after the last
+    point. But the profile and the model states are not recorded, so the memory used does not grow with the plan.
+    A point is yielded when the next step has begun, after the deco decisions of its own step, which may still move
+    it to the depth of a new stop. With adaptive stepping only the points of the steps are yielded, as the regular
+    samples of sampleProfile() are made from the whole profile.
+    :param diveplan: the plan to calculate, results are stored into it
+    :type diveplan: DivePlan
+    :param engine: tissue model engine, 'python' for ModelPoint or 'numpy' for the vectorized VectorModelPoint
+    :type engine: str
+    :param every: yield only every k-th point, the last point is always yielded
+    :type every: int
+    :param events: yield only the first and last point and the points where the phase or the tank changes
+    :type events: bool
+    :param states: set point.modelpoint to a copy of the model state of the point, like the recorded profile has
+    :type states: bool
+    :return: generator of DiveProfilePoint
+    :rtype: generator
+    '''
+    if every < 1:
+        raise ValueError('every must be at least 1, not <{}>'.format(every))
+    model = newModelPoint(engine)
+    previous = None
+    pending = None
+    count = 0
+    for point in planSteps(diveplan, model, record=False, decoSolver=decoSolver, quantize=quantize,
+                           stepping=stepping, checkpoints=checkpoints):
+        if states:
+            # the model changes in the next step, so the state is copied to a history of one row
+            state = ModelHistory(capacity=1)
+            state.append(model)
+            point.modelpoint = state[0]
+        if events:
+            selected = previous is None or point.divephase != previous.divephase or point.tank is not previous.tank
+        else:
+            selected = count % every == 0
+        if pending is not None:
+            yield pending
+        pending = point if selected else None
+        previous = point
+        count += 1
+    if pending is None:
+        pending = previous
+    if pending is not None:
+        yield pending
+
+
+# the tanks that can be breathed before the ascent begins, the deco tanks are used only in the ascent
+CHECKPOINT_TANKS = (TankType.BOTTOM, TankType.TRAVEL)
+# meters, a solved stop clears the next stop by this much, so the ceiling of the model after the stop is not
+# rounded up to this stop by the rounding errors of its own calculation
+CEILING_MARGIN = 1e-6
+# the results of the plan so far at the checkpoint
+CHECKPOINT_RESULTS = ('maxPPoxygen', 'maxPPnitrogen', 'maxPPhelium', 'maxPPanyGas', 'maxTCnitrogen', 'maxTChelium',
+                      'ascentBegins')
+# the local variables of planSteps() at the checkpoint
+CHECKPOINT_VALUES = ('index', 'divephase', 'runtime', 'intervalMinutes', 'beginDepth', 'endDepth', 'depthSum',
+                     'ascending', 'currentDecoDone', 'bottom_start_runtime', 'intervalBottom', 'intervalDeco')
+
+
+def checkpointKey(diveplan : DivePlan, model, record, stepping):
+    '''the inputs the descent and bottom of a plan depend on, plans with the same key have the same checkpoint
+
+    GF low is one of them, as the ceilings recorded before the ascent are calculated with it. GF high, the ascent
+    rates, the deco tanks, the planned stops of Custom mode and the deco solver are used only in the ascent.
+    :rtype: tuple
+    '''
+    tanks = tuple((tank.use, tank.o2, tank.he, tank.changeDepth, tank.liters, tank.bar, tank.SAC)
+                  for tank in (diveplan.tankList[tankType] for tankType in CHECKPOINT_TANKS))
+    return (type(model).__name__, record, stepping, diveplan.GFlow, diveplan.bottomDepth, diveplan.bottomTime,
+            diveplan.descTime, tanks)
+
+
+class PlanCheckpoint():
+    """
+    the state of planSteps() when the ascent of the first dive begins: the tissues after the last bottom step,
+    the tank pressures, the run time, the maximum pressures so far and the recorded profile.
+    It is taken before the deco decisions of the last bottom step, which depend on the ascent inputs.
+    """
+    def __init__(self, diveplan, model, point, profile, history, values):
+        '''
+        :param point: the DiveProfilePoint of the last bottom step
+        :param profile: the recorded profile so far, the checkpoint keeps a copy of it
+        :param history: the recorded model states so far, the checkpoint keeps a copy of it
+        :param values: the local variables of planSteps(), CHECKPOINT_VALUES
+        :type values: dict
+        '''
+        self.values = {name: values[name] for name in CHECKPOINT_VALUES}
+        self.results = {name: getattr(diveplan, name) for name in CHECKPOINT_RESULTS}
+        self.tanks = {tankType: {name: getattr(diveplan.tankList[tankType], name) for name in DivePlan.TANK_RESULTS}
+                      for tankType in CHECKPOINT_TANKS}
+        # the tanks are stored by type, so the checkpoint can be used with the tanks of another plan
+        tankTypes = {id(tank): tankType for tankType, tank in diveplan.tankList.items()}
+        self.currentTank = tankTypes[id(diveplan.currentTank)]
+        self.nextTank = tankTypes.get(id(diveplan.nextTank))
+        self.changeDepth = diveplan.changeDepth
+        self.state = ModelHistory(capacity=1)
+        self.state.append(model)
+        self.point = copy.copy(point)
+        self.pointTank = tankTypes[id(point.tank)]
+        self.profile, self.history = self.copyProfile(profile, history)
+        self.profileTanks = [tankTypes[id(recorded.tank)] for recorded in profile]
+
+    @staticmethod
+    def copyProfile(profile, history):
+        '''copies of the profile points and their model states, so the copies can be changed'''
+        history = history.copy()
+        profile = [copy.copy(point) for point in profile]
+        for row, point in enumerate(profile):
+            point.modelpoint = history[row]
+        return profile, history
+
+    def restore(self, diveplan, model, modelUsed):
+        '''continue a plan from the checkpoint, the tanks of the plan must be initialized by tanksCheck()
+
+        :param diveplan: the plan, with the same checkpointKey() as the plan of the checkpoint
+        :param model: the empty model state of the plan
+        :return: copies of the recorded profile and model states and of the point of the last bottom step
+        :rtype: tuple
+        '''
+        for name, value in self.results.items():
+            setattr(diveplan, name, value)
+        for tankType, values in self.tanks.items():
+            for name, value in values.items():
+                setattr(diveplan.tankList[tankType], name, value)
+        diveplan.currentTank = diveplan.tankList[self.currentTank]
+        if self.nextTank in CHECKPOINT_TANKS:
+            diveplan.nextTank = diveplan.tankList[self.nextTank]
+            diveplan.changeDepth = self.changeDepth
+        else:
+            # the deco tanks of this plan may be different
+            diveplan.nextTank, diveplan.changeDepth = firstDecoTank(diveplan)
+        # a step of zero minutes at the same depth keeps the tissue pressures, and calculates the ceilings again
+        state = self.state[0]
+        depth = self.values['endDepth']
+        model.restoreTissues(modelUsed, state)
+        model.calculateAllTissuesDepth(modelUsed = modelUsed, beginDepth= depth, endDepth= depth, intervalMinutes= 0.0,
+                                       heliumFraction= 0.0, nitrogenFraction= 0.0, gfNow= state.gfNow)
+        profile, history = self.copyProfile(self.profile, self.history)
+        for point, tankType in zip(profile, self.profileTanks):
+            point.tank = diveplan.tankList[tankType]
+        # the same point as the last recorded one, if the profile is recorded
+        point = profile[-1] if profile else copy.copy(self.point)
+        point.tank = diveplan.tankList[self.pointTank]
+        return profile, history, point
+
+
+class PlanCheckpoints():
+    """
+    bounded LRU cache of PlanCheckpoint by checkpointKey(), keeps the checkpoints of plans calculated one after
+    another, like while a gradient factor is changed in the GUI, or in a sweep over gradient factors
+    """
+    def __init__(self, size=16):
+        self.size = size
+        self.recent = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            checkpoint = self.recent.get(key)
+            if checkpoint is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.recent.move_to_end(key)
+            return checkpoint
+
+    def put(self, key, checkpoint):
+        with self.lock:
+            self.recent[key] = checkpoint
+            self.recent.move_to_end(key)
+            if len(self.recent) > self.size:
+                self.recent.popitem(last=False)
+
+
+def planSteps(diveplan : DivePlan, model, verbose=False, record=True, decoSolver='step', quantize=True,
+              stepping='fixed', sampleInterval=60.0, checkpoints=None):
+    '''Generator that executes the diveplan state machine one step at a time
+
+    Each step yields its new DiveProfilePoint right after model.calculateAllTissuesDepth() has been
+    called for it, and before the new model state is used for the deco decisions. calculatePlan() just
+    runs this to the end, while calculatePlans() of pydplan_batch uses the pause to update the tissues of
+    many plans in one vectorized step.
+    :param diveplan: the plan to execute, results are stored into it
+    :type diveplan: DivePlan
+    :param model: empty model state, like ModelPoint() or VectorModelPoint()
+    :type model: ModelPoint
+    :param record: if False, the profile and model states are not stored, only the summary values
+    :type record: bool
+    :param decoSolver: 'step' repeats 1..3 minute intervals at a deco stop until the ceiling has cleared the
+        next stop, 'analytic' solves the stop time with decoStopMinutes() and executes it as one segment
+    :type decoSolver: str
+    :param quantize: with the analytic solver, round the stop times up to whole minutes
+    :type quantize: bool
+    :param stepping: 'fixed' uses the fixed step sizes: descent / 5, bottom time / 20, 5 s ascent and 1..3 minute
+        deco steps. 'adaptive' does the bottom and each deco stop as one exact constant depth step, and ascends
+        from event to event: the 3 m stop grid, ascent rate changes, gas switches and the ceiling.
+        Deco stops are then solved with the analytic solver.
+    :type stepping: str
+    :param sampleInterval: with adaptive stepping, the recorded profile is resampled by sampleProfile()
+        to this many seconds between samples, None keeps only the event points
+    :type sampleInterval: float
+    :param checkpoints: if it has a checkpoint with the checkpointKey() of this plan, the plan continues from
+        there when the ascent begins, with the same results as from the surface. Otherwise a checkpoint is
+        added to it when the ascent of the first dive begins. The model must have restoreTissues().
+    :type checkpoints: PlanCheckpoints
+    :return: generator of DiveProfilePoint
+    :rtype: generator
+    '''
+
+
+    def ascentRate(depth):
         if depth > (diveplan.bottomDepth / 2.0):
             rate = diveplan.ascRateToDeco
         elif depth > 6.0:
             rate = diveplan.ascRateAtDeco
         else:
             rate = diveplan.ascRateToSurface
-        return rate * interval
+        return rate
+
+    def calculateStepAscend(depth, interval):
+        return ascentRate(depth) * interval
+
+    def nextAscentEvent(depth):
+        # the first depth shallower than depth where something may change: the next 3 m stop,
+        # ascent rate change, gas switch or the current ceiling
+        events = [math.ceil(depth / 3.0) * 3.0 - 3.0, model.leadCeilingStop, 0.0]
+        for eventDepth in [diveplan.bottomDepth / 2.0, 6.0]:
+            if eventDepth < depth:
+                events.append(eventDepth)
+        if diveplan.nextTank != None and diveplan.changeDepth < depth:
+            events.append(diveplan.changeDepth)
+        return min(max(events), depth)
+
+    def ceilingClearMinutes(depth, ceilingDepth):
+        # minutes to stay at depth with the current gas until the ceiling is shallower than ceilingDepth
+        tank = diveplan.currentTank
+        nitrogenPressures, heliumPressures = model.tissueColumns()[:2]
+        return decoStopMinutes(nitrogenPressures, heliumPressures, modelUsed, depth2absolutePressure(depth),
+                               heliumFraction= tank.he / 100.0,
+                               nitrogenFraction= 1.0 - (tank.he + tank.o2) / 100.0,
+                               gf= gfObject.gfGet(depth), ceilingDepth= ceilingDepth - CEILING_MARGIN)
+
+    def adaptiveAscent(depth):
+        # depth and seconds of the next ascent step
+        target = nextAscentEvent(depth)
+        if target < depth:
+            return target, (depth - target) / ascentRate(depth)
+        # the ceiling does not allow ascending, so wait here until it has cleared the next 3 m step
+        waitMinutes = ceilingClearMinutes(depth, math.ceil(depth / 3.0) * 3.0 - 3.0)
+        if waitMinutes <= 0.0:
+            waitMinutes = 5.0 / 60.0
+        return depth, waitMinutes * 60.0
+
+    if decoSolver not in ('step', 'analytic'):
+        raise ValueError('unsupported decoSolver <{}>'.format(decoSolver))
+    if stepping not in ('fixed', 'adaptive'):
+        raise ValueError('unsupported stepping <{}>'.format(stepping))
+    adaptive = stepping == 'adaptive'
+    # the analytic stop times need the model state before the stop, so only in Calculate mode
+    analyticStops = (decoSolver == 'analytic' or adaptive) and diveplan.planMode == PlanMode.Calculate.value
 
     gfObject = gradientFactor(GFlow= diveplan.GFlow, GFhigh= diveplan.GFhigh)
 
     modelConstants = Buhlmann()
     modelUsed = modelConstants.model['ZHL16c']
     diveplan.modelUsed = modelUsed
-    model = ModelPoint()
-    modelPoints = []
+    modelPoints = ModelHistory()
     diveplan.decoStopsCalculated = []
     model.initSurface(modelUsed)
 
@@ -280,11 +598,126 @@ def calculatePlan(diveplan : DivePlan, verbose=False):
     # note that tanksCheck may select the diveplan.currentTank
     divephase = DivePhase.STARTING
     currentDecoDone = -1 # FIXME: ugly hack, see below
+    # True after an analytic deco stop segment, which was solved to clear the next stop
+    stopSolved = False
+    # every dive of a multi dive day needs its own steps
+    maxIterations = 5000 * max(1, dives)
+    decisionPending = False
+    saveKey = None
+    if checkpoints is not None:
+        key = checkpointKey(diveplan, model, record, stepping)
+        checkpoint = checkpoints.get(key)
+        if checkpoint is None:
+            # a new checkpoint is saved when the ascent begins
+            saveKey = key
+        else:
+            # continue from the end of the bottom, with the deco decisions of the last bottom step
+            outProfile, modelPoints, newPoint = checkpoint.restore(diveplan, model, modelUsed)
+            (index, divephase, runtime, intervalMinutes, beginDepth, endDepth, depthSum, ascending,
+             currentDecoDone, bottom_start_runtime, intervalBottom, intervalDeco) = \
+                [checkpoint.values[name] for name in CHECKPOINT_VALUES]
+            newDecoStop = None
+            tank = diveplan.currentTank
+            decisionPending = True
     while True :
+        if decisionPending:
+            # the deco decisions of the previous point, made before the next step
+            decisionPending = False
+            # here we start the deco stops when ascending, or check if deco stop can be ended
+            if divephase in [DivePhase.ASCENDING, DivePhase.STOP_DECO, DivePhase.ASC_T,
+                             DivePhase.STOP_ASC_T]:
+                # which mode of operation: 'Custom', 'Calculate', 'Import'
+                if diveplan.planMode == PlanMode.Calculate.value:
+                    # we are in Calculate mode,
+                    # check that next step will not cross ceiling
+                    if endDepth  <= model.leadCeilingStop and divephase != DivePhase.STOP_DECO:
+                        # we have hit a deco ceiling or tanks change, check if starting or ongoing deco
+                        if divephase == DivePhase.STOP_ASC_T:
+                            # stop for a tank change first
+                            pass
+                        else:
+                            divephase = DivePhase.STOP_DECO
+                        currentDecoDone = 0.0
+                        # force the next depth to be at the step
+                        if endDepth < model.leadCeilingStop:
+                            # this is a bounce, but should not occur due to fixes done higher up
+                            if verbose:
+                                print('BOUNCE at {} s {} m'.format(runtime, endDepth))
+                        beginDepth= model.leadCeilingStop
+                        endDepth = beginDepth
+                        # now set the gradient factor
+                        newPoint.gfNow = gfObject.gfSet(endDepth)
+                        newPoint.gfSet = True
+                        # the decos near surface take longer, so longer intervals used
+                        if beginDepth == 3.0:
+                            intervalDeco = 180.0
+                        elif beginDepth == 6.0:
+                            intervalDeco = 120.0
+                        else:
+                            intervalDeco = 60.0
+                        #record the new deco stop
+                        newDecoStop = DecoStop(depth=beginDepth, time=0.0, number=0)
+                        newDecoStop.runtime = runtime
+                    elif divephase == DivePhase.STOP_DECO:
+                        if  currentDecoDone == -1:
+                            # really dirty fix
+                            currentDecoDone = intervalDeco
+                            newDecoStop = DecoStop(depth=beginDepth, time=intervalDeco, number=0)
+                            newDecoStop.runtime = runtime
+                            pass
+                        else:
+                            # ongoing deco stop, increment the timer
+                            currentDecoDone += intervalDeco
+                            #todo: check long it has been now?
+                        if newDecoStop != None:
+                            newDecoStop.time = currentDecoDone
+                        # check if time to end deco, a solved stop ends after its segment, as its ceiling may be
+                        # exactly at the next stop
+                        if stopSolved or endDepth  > model.leadCeilingMeters + 3.0:
+                            divephase = DivePhase.ASCENDING
+                            diveplan.decoStopsCalculated.append(newDecoStop)
+                            newDecoStop = None
+                            #divephase = DivePhase.DECOEND
+                        stopSolved = False
+
+                ############ check if in Custom mode ########################
+                elif diveplan.planMode == PlanMode.Custom.value:
+                    # we are in Custom mode, check if planned deco stop here
+                    if plannedStopPointer >= 0:
+                        # yes we have planned deco stops
+                        if divephase in [DivePhase.ASCENDING, DivePhase.ASC_T]:
+                            # check if we have planned deco stop here
+                            # fixme: we should test for next step, instead of current depth that might already be above the stop
+                            if endDepth <= diveplan.decoStopList[plannedStopPointer].depth :
+                                # so start a deco stop and reset timer
+                                divephase = DivePhase.STOP_DECO
+                                diveplan.decoStopList[plannedStopPointer].done = 0.0
+                                newPoint.depth = diveplan.decoStopList[plannedStopPointer].depth
+                                endDepth = newPoint.depth
+                                beginDepth  = newPoint.depth
+                                # now set the gradient factor
+                                newPoint.gfNow = gfObject.gfSet(endDepth)
+                                newPoint.gfSet = True
+                        elif divephase == DivePhase.STOP_DECO:
+                            # planned deco stop ongoing, increment timer, check if then done with it
+                            diveplan.decoStopList[plannedStopPointer].done += intervalDeco
+                            if diveplan.decoStopList[plannedStopPointer].done >= \
+                                    diveplan.decoStopList[plannedStopPointer].time:
+                                # we have done the deco, now start ascending again
+                                divephase = DivePhase.ASCENDING
+                                plannedStopPointer += 1
+                                if plannedStopPointer >= len(diveplan.decoStopList):
+                                    # we have consumed the list of deco stops, stop checking for them
+                                    plannedStopPointer = -1
+                    pass
+                else:
+                    # getting here is actually a disastrous bug, should handle it more seriously...
+                    print('unsupported mode', file=sys.stderr)
+                    break
+
         index += 1
-        if index > 5000:
-            print('index >500')
-            raise ValueError('over 500 iterations, aborting')
+        if index > maxIterations:
+            raise ValueError('over {} iterations, aborting'.format(maxIterations))
             break
 
         if divephase == DivePhase.STARTING:
@@ -333,6 +766,9 @@ def calculatePlan(diveplan : DivePlan, verbose=False):
 
 
         elif divephase == DivePhase.BOTTOM:
+            if adaptive:
+                # the rest of the bottom time in one constant depth step
+                intervalBottom = bottom_start_runtime + diveplan.bottomTime - runtime
             runtime += intervalBottom
             intervalMinutes = intervalBottom / 60.0
             beginDepth = diveplan.bottomDepth
@@ -345,6 +781,9 @@ def calculatePlan(diveplan : DivePlan, verbose=False):
 
 
         elif divephase == DivePhase.ASCENDING:
+            if adaptive:
+                # ascend to the next event in one step
+                ascentTarget, intervalAscent = adaptiveAscent(endDepth)
             runtime += intervalAscent
             intervalMinutes = intervalAscent / 60.0
             beginDepth = endDepth
@@ -356,6 +795,9 @@ def calculatePlan(diveplan : DivePlan, verbose=False):
                 endDepth = model.leadCeilingStop
             else:
                 endDepth   = beginDepth - stepAscend
+            if adaptive:
+                # exactly at the event, without the rounding of rate * interval
+                endDepth = ascentTarget
             if endDepth <= 0.0:
                 divephase = DivePhase.SURFACE
                 beginDepth = 0.0
@@ -364,8 +806,13 @@ def calculatePlan(diveplan : DivePlan, verbose=False):
             else:
                 divephase = tanksCheck(diveplan, DivePhase.ASCENDING,
                                                       beginDepth, endDepth, intervalMinutes, runtime=runtime)
+                if adaptive and divephase == DivePhase.ASC_T and endDepth <= diveplan.changeDepth:
+                    # the step went right to the gas switch, which ASC_T would have stopped at
+                    divephase = DivePhase.STOP_ASC_T
 
         elif divephase == DivePhase.ASC_T:
+            if adaptive:
+                ascentTarget, intervalAscent = adaptiveAscent(endDepth)
             runtime += intervalAscent
             intervalMinutes = intervalAscent / 60.0
             beginDepth = endDepth
@@ -377,6 +824,9 @@ def calculatePlan(diveplan : DivePlan, verbose=False):
                 endDepth = model.leadCeilingStop
             else:
                 endDepth   = beginDepth - stepAscend
+            if adaptive:
+                # exactly at the event, without the rounding of rate * interval
+                endDepth = ascentTarget
             if endDepth <= diveplan.changeDepth:
                 endDepth = diveplan.changeDepth
                 divephase = DivePhase.STOP_ASC_T
@@ -395,6 +845,25 @@ def calculatePlan(diveplan : DivePlan, verbose=False):
             #print('+ STOP_CHG_TANK_ASC at {} m '.format(endDepth))
 
         elif divephase == DivePhase.STOP_DECO:
+            if analyticStops:
+                # solve how long until the ceiling has cleared the next stop, and do the stop in one segment
+                decoMinutes = ceilingClearMinutes(endDepth, endDepth - 3.0)
+                if quantize:
+                    decoMinutes = math.ceil(decoMinutes)
+                if decoMinutes <= 0.0:
+                    # the ceiling is already above the next stop, so no need to stop here, but keep the time
+                    # already done at this stop
+                    divephase = DivePhase.ASCENDING
+                    if newDecoStop != None and newDecoStop.time > 0.0:
+                        diveplan.decoStopsCalculated.append(newDecoStop)
+                    newDecoStop = None
+                    continue
+                intervalDeco = decoMinutes * 60.0
+                stopSolved = True
+            elif adaptive and diveplan.planMode == PlanMode.Custom.value and plannedStopPointer >= 0:
+                # the rest of the planned stop in one step
+                plannedStop = diveplan.decoStopList[plannedStopPointer]
+                intervalDeco = max(plannedStop.time - plannedStop.done, 0.0)
             runtime += intervalDeco
             intervalMinutes = intervalDeco / 60.0
             tanksCheck(diveplan, DivePhase.STOP_DECO, beginDepth, endDepth, intervalMinutes, runtime=runtime)
@@ -450,114 +919,147 @@ def calculatePlan(diveplan : DivePlan, verbose=False):
                                   intervalMinutes= intervalMinutes,
                                   heliumFraction= heliumFraction, nitrogenFraction = nitrogenFraction,
                                   gfNow= gfObject.gfGet(endDepth))
+        # pause here, the caller may complete the model calculation before we continue
+        yield newPoint
 
         # search and record max N2, He TC pressures
         diveplan.maxTCnitrogen = max(diveplan.maxTCnitrogen, model.maxNitrogenPressure)
         diveplan.maxTChelium = max(diveplan.maxTChelium, model.maxHeliumPressure)
 
-        # then deepcopy and append the model state to the list of model states
-        modelCopy = deepcopy( model)        # must deepcopy to keep a snapshot of what the state was here
-        modelPoints.append(modelCopy)       # append to the list of saved model states
-        newPoint.modelpoint = modelCopy     # also link the model point to the profile point
-        outProfile.append(newPoint)         # append to the list of dive  profile
-
-        # here we start the deco stops when ascending, or check if deco stop can be ended
-        if divephase in [DivePhase.ASCENDING, DivePhase.STOP_DECO, DivePhase.ASC_T,
-                         DivePhase.STOP_ASC_T]:
-            # which mode of operation: 'Custom', 'Calculate', 'Import'
-            if diveplan.planMode == PlanMode.Calculate.value:
-                # we are in Calculate mode,
-                # check that next step will not cross ceiling
-                if endDepth  <= model.leadCeilingStop and divephase != DivePhase.STOP_DECO:
-                    # we have hit a deco ceiling or tanks change, check if starting or ongoing deco
-                    if divephase == DivePhase.STOP_ASC_T:
-                        # stop for a tank change first
-                        pass
-                    else:
-                        divephase = DivePhase.STOP_DECO
-                    currentDecoDone = 0.0
-                    # force the next depth to be at the step
-                    if endDepth < model.leadCeilingStop:
-                        # this is a bounce, but should not occur due to fixes done higher up
-                        if verbose:
-                            print('BOUNCE at {} s {} m'.format(runtime, endDepth))
-                    beginDepth= model.leadCeilingStop
-                    endDepth = beginDepth
-                    # now set the gradient factor
-                    newPoint.gfNow = gfObject.gfSet(endDepth)
-                    newPoint.gfSet = True
-                    # the decos near surface take longer, so longer intervals used
-                    if beginDepth == 3.0:
-                        intervalDeco = 180.0
-                    elif beginDepth == 6.0:
-                        intervalDeco = 120.0
-                    else:
-                        intervalDeco = 60.0
-                    #record the new deco stop
-                    newDecoStop = DecoStop(depth=beginDepth, time=0.0, number=0)
-                    newDecoStop.runtime = runtime
-                elif divephase == DivePhase.STOP_DECO:
-                    if  currentDecoDone == -1:
-                        # really dirty fix
-                        currentDecoDone = intervalDeco
-                        newDecoStop = DecoStop(depth=beginDepth, time=intervalDeco, number=0)
-                        newDecoStop.runtime = runtime
-                        pass
-                    else:
-                        # ongoing deco stop, increment the timer
-                        currentDecoDone += intervalDeco
-                        #todo: check long it has been now?
-                    if newDecoStop != None:
-                        newDecoStop.time = currentDecoDone
-                    # check if time to end deco
-                    if endDepth  > model.leadCeilingMeters + 3.0:
-                        divephase = DivePhase.ASCENDING
-                        diveplan.decoStopsCalculated.append(newDecoStop)
-                        newDecoStop = None
-                        #divephase = DivePhase.DECOEND
-
-            ############ check if in Custom mode ########################
-            elif diveplan.planMode == PlanMode.Custom.value:
-                # we are in Custom mode, check if planned deco stop here
-                if plannedStopPointer >= 0:
-                    # yes we have planned deco stops
-                    if divephase in [DivePhase.ASCENDING, DivePhase.ASC_T]:
-                        # check if we have planned deco stop here
-                        # fixme: we should test for next step, instead of current depth that might already be above the stop
-                        if endDepth <= diveplan.decoStopList[plannedStopPointer].depth :
-                            # so start a deco stop and reset timer
-                            divephase = DivePhase.STOP_DECO
-                            diveplan.decoStopList[plannedStopPointer].done = 0.0
-                            newPoint.depth = diveplan.decoStopList[plannedStopPointer].depth
-                            endDepth = newPoint.depth
-                            beginDepth  = newPoint.depth
-                            # now set the gradient factor
-                            newPoint.gfNow = gfObject.gfSet(endDepth)
-                            newPoint.gfSet = True
-                    elif divephase == DivePhase.STOP_DECO:
-                        # planned deco stop ongoing, increment timer, check if then done with it
-                        diveplan.decoStopList[plannedStopPointer].done += intervalDeco
-                        if diveplan.decoStopList[plannedStopPointer].done >= \
-                                diveplan.decoStopList[plannedStopPointer].time:
-                            # we have done the deco, now start ascending again
-                            divephase = DivePhase.ASCENDING
-                            plannedStopPointer += 1
-                            if plannedStopPointer >= len(diveplan.decoStopList):
-                                # we have consumed the list of deco stops, stop checking for them
-                                plannedStopPointer = -1
-                pass
-            else:
-                # getting here is actually a disastrous bug, should handle it more seriously...
-                print('unsupported mode')
-                break
+        if record:
+            # then record the model state as a new row of the model history
+            row = modelPoints.append(model)             # columnar snapshot of what the state was here
+            newPoint.modelpoint = modelPoints[row]      # also link a view of the row to the profile point
+            outProfile.append(newPoint)                 # append to the list of dive  profile
+        decisionPending = True
+
+        if saveKey is not None and divephase == DivePhase.ASCENDING:
+            # the last bottom step of the first dive, its deco decisions are not made yet
+            values = dict(index=index, divephase=divephase, runtime=runtime, intervalMinutes=intervalMinutes,
+                          beginDepth=beginDepth, endDepth=endDepth, depthSum=depthSum, ascending=ascending,
+                          currentDecoDone=currentDecoDone, bottom_start_runtime=bottom_start_runtime,
+                          intervalBottom=intervalBottom, intervalDeco=intervalDeco)
+            checkpoints.put(saveKey, PlanCheckpoint(diveplan, model, newPoint, outProfile, modelPoints, values))
+            saveKey = None
 
     # dive has ended, now save the data for plotting and printing
+    if adaptive and record and sampleInterval:
+        outProfile, modelPoints = sampleProfile(outProfile, modelPoints, modelUsed, sampleInterval)
+    diveplan.totalTime = runtime
     diveplan.profileSampled = outProfile
     diveplan.model = modelPoints
-    return modelPoints
+    diveplan.version += 1
+
+
+def sampleProfile(profile, history, modelUsed, interval=60.0):
+    '''resample a profile calculated with adaptive stepping, for the plots and tables
+
+    The adaptive steps can be long, like the whole bottom time in one step. This adds samples at regular times
+    between the recorded points, every interval seconds of runtime. The model state of a sample is calculated
+    from the state at the begin of its step, with the same gas, depth change and gradient factor as the step.
+    The recorded points themselves are kept as they are.
+    :param profile: list of DiveProfilePoint, as recorded by planSteps()
+    :type profile: list
+    :param history: the model states recorded for the profile points
+    :type history: ModelHistory
+    :param modelUsed: the model coefficients list used in calculation
+    :type modelUsed: Buhlmann.model
+    :param interval: seconds between the samples
+    :type interval: float
+    :return: the resampled profile list and its ModelHistory
+    :rtype: tuple
+    '''
+    samples = []
+    sampledHistory = ModelHistory(capacity=len(history) + int(profile[-1].time / interval) + 1)
+    model = ModelPoint()
+    previous = None
+    for point, modelpoint in zip(profile, history):
+        if previous is not None and point.time > previous.time:
+            stepSeconds = point.time - previous.time
+            heliumFraction = point.tank.he / 100.0
+            oxygenFraction = point.tank.o2 / 100.0
+            nitrogenFraction = 1.0 - heliumFraction - oxygenFraction
+            # at constant depth each sample continues from the previous one, the Haldane equation is exact
+            # for any split of the step. When the depth changes, each sample starts from the begin of the step
+            constantDepth = point.depth == previous.depth
+            sampleTime = (math.floor(previous.time / interval) + 1) * interval
+            startTime = previous.time
+            if sampleTime < point.time:
+                model.restoreTissues(modelUsed, previousState)
+            while sampleTime < point.time:
+                ratio = (sampleTime - previous.time) / stepSeconds
+                depth = previous.depth + (point.depth - previous.depth) * ratio
+                if not constantDepth and startTime != previous.time:
+                    model.restoreTissues(modelUsed, previousState)
+                    startTime = previous.time
+                model.calculateAllTissuesDepth(modelUsed = modelUsed,
+                                               beginDepth= previous.depth, endDepth= depth,
+                                               intervalMinutes= (sampleTime - startTime) / 60.0,
+                                               heliumFraction= heliumFraction,
+                                               nitrogenFraction = nitrogenFraction,
+                                               gfNow= modelpoint.gfNow)
+                # the phase of a point is the phase it starts, so the samples are in the phase of the previous one
+                sample = DiveProfilePoint(sampleTime, depth, point.tank, divephase=previous.divephase,
+                                          gfSet=previous.gfSet, ascending=previous.ascending)
+                sample.gfNow = modelpoint.gfNow
+                sample.depthRunAvg = previous.depthRunAvg + (point.depthRunAvg - previous.depthRunAvg) * ratio
+                if point.tank is previous.tank:
+                    sample.currentTankPressure = previous.currentTankPressure + \
+                        (point.currentTankPressure - previous.currentTankPressure) * ratio
+                else:
+                    sample.currentTankPressure = point.currentTankPressure
+                sample.ppOxygen   = sample.pressure * oxygenFraction / Constants.surfacePressure
+                sample.ppNitrogen = sample.pressure * nitrogenFraction / Constants.surfacePressure
+                sample.ppHelium   = sample.pressure * heliumFraction / Constants.surfacePressure
+                row = sampledHistory.append(model)
+                sample.modelpoint = sampledHistory[row]
+                samples.append(sample)
+                if constantDepth:
+                    startTime = sampleTime
+                sampleTime += interval
+        row = sampledHistory.append(modelpoint)
+        point.modelpoint = sampledHistory[row]
+        samples.append(point)
+        previous = point
+        previousState = point.modelpoint
+    return samples, sampledHistory
+
+
+def planSummary(diveplan : DivePlan):
+    '''summary of a calculated diveplan, run time, deco stops, gas used and the maximum pressures
+
+    :param diveplan: a plan after calculatePlan() or calculatePlans(), or the PlanResult of runPlan()
+    :type diveplan: DivePlan
+    :return: dictionary of the summary values, times in seconds, pressures in bar, gas in liters
+    :rtype: dict
+    '''
+    decoStops = [stop for stop in diveplan.decoStopsCalculated if stop != None]
+    tanks = dict()
+    for iTank in diveplan.tankList.keys():
+        tank = diveplan.tankList[iTank]
+        if tank.use == True:
+            tanks[tank.name] = {'start': tank.bar, 'end': tank.pressure,
+                                'used': (tank.bar - tank.pressure) * tank.liters}
+    summary = {'runtime': diveplan.totalTime,
+               'decoStops': [{'runtime': stop.runtime, 'depth': stop.depth, 'time': stop.time}
+                             for stop in decoStops],
+               'decoTime': sum(stop.time for stop in decoStops),
+               'tanks': tanks,
+               'maxPPoxygen': diveplan.maxPPoxygen,
+               'maxPPnitrogen': diveplan.maxPPnitrogen,
+               'maxPPhelium': diveplan.maxPPhelium,
+               'maxTCnitrogen': diveplan.maxTCnitrogen,
+               'maxTChelium': diveplan.maxTChelium,
+               }
+    return summary
 
 
 class DiveProfilePoint():
+    # one of these for each step and sample of a profile, slots instead of a __dict__ per point
+    __slots__ = ('time', 'depth', 'pressure', 'divephase', 'tank', 'modelpoint',
+                 'leadTC_now', 'ceiling_now', 'ceiling_now_3m', 'gfNow', 'gfSet', 'ascending',
+                 'depthRunAvg', 'ppOxygen', 'ppHelium', 'ppNitrogen', 'currentTankPressure')
+
     def __init__(self, pTime, pDepth, tank, divephase=DivePhase.NULL, gfSet = False, ascending = False):
         '''
         Object to store a point in executed dive profile, append these into a list to store the entire profile
@@ -0,0 +1,231 @@
+#!/usr/bin/python
+# (c) 2018 Ian Leiman, ian.leiman@gmail.com
+# pydplan_sweep
+# part of PYDPLAN, a Python Dive Planner with PyQt5 GUI
+# "what-if" tables: calculatePlan() of a base plan for a grid of gradient factors, bottom times and depths,
+# calculated in a pool of worker processes
+#
+# calculatePlan() changes the plan it calculates, the tank pressures, decoStopsCalculated, profileSampled,
+# so every case is calculated on its own inputCopy() of the base plan. The base plan is sent to each worker
+# process once, the cases are sent in chunks, and only the summaries come back.
+#
+# usage:
+#   python pydplan_sweep.py plan.json --gf-low 30 40 50 --gf-high 70 80 90 --time 20 25 30 -o table.csv
+#
+import os
+import sys
+import csv
+import json
+import argparse
+from itertools import product
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pydplan_profiletools import calculatePlan, planSummary, PlanCheckpoints
+
+# the values of a case, with the same units as the plan files of pydplan_cli
+CASE_KEYS = ('gfLow', 'gfHigh', 'time', 'depth')
+# checkpoints kept by each worker, the cases with the same GF low, time and depth share the descent and bottom
+SWEEP_CHECKPOINTS = 64
+
+
+def sweepCases(gfLow=(None,), gfHigh=(None,), time=(None,), depth=(None,)):
+    '''all the combinations of the given values, the last one changes fastest
+
+    None keeps the value of the base plan.
+    :param gfLow: gradient factors low in percent
+    :type gfLow: list
+    :param gfHigh: gradient factors high in percent
+    :type gfHigh: list
+    :param time: bottom times in minutes
+    :type time: list
+    :param depth: bottom depths in meters
+    :type depth: list
+    :return: one dictionary for each case, with the keys that have a value
+    :rtype: list
+    '''
+    return [{key: value for key, value in zip(CASE_KEYS, values) if value is not None}
+            for values in product(gfLow, gfHigh, time, depth)]
+
+
+def applyCase(divePlan, case):
+    '''set the values of a case to a plan, with the same conversions as pydplan_cli.planFromDict()'''
+    for key in case.keys():
+        if key not in CASE_KEYS:
+            raise ValueError('unknown sweep value <{}>'.format(key))
+    if 'gfLow' in case:
+        divePlan.GFlow = float(case['gfLow']) / 100.0
+    if 'gfHigh' in case:
+        divePlan.GFhigh = float(case['gfHigh']) / 100.0
+    if 'time' in case:
+        divePlan.bottomTime = float(case['time']) * 60.0
+    if 'depth' in case:
+        divePlan.bottomDepth = float(case['depth'])
+        divePlan.maxDepth = divePlan.bottomDepth
+        divePlan.descTime = divePlan.bottomDepth / divePlan.descRate
+
+
+def sweepSummary(divePlan):
+    '''the values of a calculated plan shown in a what-if table
+
+    :return: run time and deco time in seconds, liters of gas used from each tank and the maximum ppO2
+    :rtype: dict
+    '''
+    summary = planSummary(divePlan)
+    return {'runtime': summary['runtime'],
+            'decoTime': summary['decoTime'],
+            'gasUsed': {name: tank['used'] for name, tank in summary['tanks'].items()},
+            'maxPPoxygen': summary['maxPPoxygen'],
+            }
+
+
+def calculateCase(basePlan, case, options, checkpoints=None):
+    '''calculate one case on a copy of the base plan, a case that fails gives its error message'''
+    divePlan = basePlan.inputCopy()
+    try:
+        applyCase(divePlan, case)
+        calculatePlan(divePlan, checkpoints=checkpoints, **options)
+        result = sweepSummary(divePlan)
+    except (ValueError, KeyError, TypeError) as error:
+        result = {'error': str(error)}
+    result['case'] = case
+    return result
+
+
+# the base plan, options and checkpoints of a worker process, set once by initWorker()
+_workerPlan = None
+_workerOptions = None
+_workerCheckpoints = None
+
+def initWorker(basePlan, options):
+    global _workerPlan, _workerOptions, _workerCheckpoints
+    _workerPlan = basePlan
+    _workerOptions = options
+    _workerCheckpoints = PlanCheckpoints(size=SWEEP_CHECKPOINTS)
+
+
+def calculateChunk(cases):
+    '''calculate a chunk of cases in a worker process'''
+    return [calculateCase(_workerPlan, case, _workerOptions, _workerCheckpoints) for case in cases]
+
+
+def sweepPlans(basePlan, cases, workers=None, chunkSize=None, progress=None, options=None):
+    '''calculate a plan for each case, in a pool of worker processes
+
+    The base plan is not changed. The results are in the same order as the cases, whatever order the chunks
+    are ready in.
+    :param basePlan: the plan the cases are applied to
+    :type basePlan: DivePlan
+    :param cases: the values of each case, see sweepCases()
+    :type cases: list
+    :param workers: number of worker processes, default is the number of CPUs, 1 calculates in this process
+    :type workers: int
+    :param chunkSize: cases sent to a worker at once, default gives about four chunks per worker
+    :type chunkSize: int
+    :param progress: called as progress(done, total) after each chunk is ready
+    :type progress: function
+    :param options: calculatePlan() options, like {'stepping': 'adaptive'}
+    :type options: dict
+    :return: sweepSummary() of each case with the case in 'case', or 'error' and 'case' if the plan failed
+    :rtype: list
+    '''
+    cases = list(cases)
+    options = dict(options or dict())
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if chunkSize is None:
+        chunkSize = max(1, -(-len(cases) // (workers * 4)))
+    # the copy has only the inputs of the plan, so it is small to send and not changed by the GUI meanwhile
+    basePlan = basePlan.inputCopy()
+    starts = range(0, len(cases), chunkSize)
+    results = [None] * len(cases)
+    done = 0
+
+    if workers == 1:
+        checkpoints = PlanCheckpoints(size=SWEEP_CHECKPOINTS)
+        for start in starts:
+            chunk = cases[start:start + chunkSize]
+            results[start:start + len(chunk)] = [calculateCase(basePlan, case, options, checkpoints)
+                                                 for case in chunk]
+            done += len(chunk)
+            if progress is not None:
+                progress(done, len(cases))
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=initWorker, initargs=(basePlan, options)) as pool:
+        futures = {pool.submit(calculateChunk, cases[start:start + chunkSize]): start for start in starts}
+        for future in as_completed(futures):
+            start = futures[future]
+            chunk = future.result()
+            results[start:start + len(chunk)] = chunk
+            done += len(chunk)
+            if progress is not None:
+                progress(done, len(cases))
+    return results
+
+
+def writeSweepCsv(results, out):
+    '''one row per case: the case values, run time and deco time in minutes, gas used of each tank and max ppO2'''
+    tankNames = sorted({name for result in results for name in result.get('gasUsed', dict()).keys()})
+    caseKeys = [key for key in CASE_KEYS if any(key in result['case'] for result in results)]
+    writer = csv.writer(out, lineterminator='\n')
+    writer.writerow(caseKeys + ['runtime', 'decoTime'] + ['gas ' + name for name in tankNames] +
+                    ['maxPPoxygen', 'error'])
+    for result in results:
+        row = [result['case'].get(key, '') for key in caseKeys]
+        if 'error' in result:
+            row += [''] * (3 + len(tankNames)) + [result['error']]
+        else:
+            row += ['{:.1f}'.format(result['runtime'] / 60.0), '{:.1f}'.format(result['decoTime'] / 60.0)]
+            row += ['{:.0f}'.format(result['gasUsed'][name]) if name in result['gasUsed'] else ''
+                    for name in tankNames]
+            row += ['{:.2f}'.format(result['maxPPoxygen']), '']
+        writer.writerow(row)
+
+
+def main(argv=None):
+    # imported here, so the worker processes do not need the command line module
+    from pydplan_cli import readPlanFile, planFromDict, planOptions
+
+    parser = argparse.ArgumentParser(description='pydplan what-if tables over gradient factors and bottom times')
+    parser.add_argument('plan', help='base plan file, .json or .toml, as for pydplan_cli.py')
+    parser.add_argument('--gf-low', dest='gfLow', type=float, nargs='+', default=[None], help='GF low %%')
+    parser.add_argument('--gf-high', dest='gfHigh', type=float, nargs='+', default=[None], help='GF high %%')
+    parser.add_argument('--time', type=float, nargs='+', default=[None], help='bottom times in minutes')
+    parser.add_argument('--depth', type=float, nargs='+', default=[None], help='bottom depths in meters')
+    parser.add_argument('-f', '--format', choices=['csv', 'json'], default='csv', help='output format')
+    parser.add_argument('-o', '--output', help='output file, default is stdout')
+    parser.add_argument('-j', '--workers', type=int, help='worker processes, default is the number of CPUs')
+    parser.add_argument('--chunk-size', dest='chunkSize', type=int)
+    parser.add_argument('--quiet', action='store_true', help='do not show the progress on stderr')
+    args = parser.parse_args(argv)
+
+    try:
+        data = readPlanFile(args.plan)
+        basePlan = planFromDict(data)
+        options = planOptions(data)
+    except ValueError as error:
+        print('pydplan: {}'.format(error), file=sys.stderr)
+        return 1
+    cases = sweepCases(args.gfLow, args.gfHigh, args.time, args.depth)
+
+    def showProgress(done, total):
+        print('\r{}/{} plans'.format(done, total), end='\n' if done == total else '', file=sys.stderr)
+
+    results = sweepPlans(basePlan, cases, workers=args.workers, chunkSize=args.chunkSize,
+                         progress=None if args.quiet else showProgress, options=options)
+
+    out = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        if args.format == 'json':
+            json.dump(results, out, indent=1)
+            out.write('\n')
+        else:
+            writeSweepCsv(results, out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 1 if any('error' in result for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,10 +3,10 @@
 # pydplan_table
 # part of PYDPLAN, a Python Dive Planner with PyQt5 GUI
 # table tools
-from PyQt5.QtWidgets import QTableWidgetItem, QTableWidget
-from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QTableWidgetItem, QTableWidget, QTableView
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QVariant
+from PyQt5.QtGui import QBrush
 #from pydplan.pydplan_classes import DivePlan
-from pydplan_profiletools import DiveProfilePoint
 
 def tableUpdate(tableW: QTableWidget, modelRun: list):
 
@@ -74,88 +74,134 @@ def tableUpdate2(tableW: QTableWidget, modelRun: list, profile: list):
     tableW.resizeRowsToContents()
     tableW.show()
 
-def tableUpdate3(tableW: QTableWidget, profile: list):
-    """
-    print a table of the dive profile to the give QTableWidget
-    :param tableW:
-    :type tableW:
-    :param profile:
-    :type profile:
-    :return:
-    :rtype:
-    """
-    rows = len(profile)
-    columns = 28
-    tableW.setRowCount(rows)
-    tableW.setColumnCount(columns)
-    tableW.setAlternatingRowColors(True)
-
-    col_hdr = [
-        ('time', 'runtime in min:sec' ),
-        ('depth', 'current dive depth in meters'),
-        ('phase','current dive phase'),
-        ('T', 'currently used scuba tank ID'),
-        ('o2/he', 'Oxygen/Helium % in current tank'),
-        #('he', 'Helium % in current tank'),
-        ('bar', 'Tank pressure in bar'),
-        ('ppO2', 'Oxygen partial pressure in bar'),
-        ('GF', 'Gradient Factor used'),
-        ('C:3m', 'GF Ceiling depth at 3m increment'),
-        ('CEIL', 'GF Ceiling depth in meters, no rounding'),
-        ('margin', 'Ceiling margin, meters from current depth'),
-        ('lead', 'leading/ceiling tissue compartment number'),
-
-        ]
-    # table column headers
-    c = 0
-    for hrdTxt, toolTipTxt in col_hdr:
-        tableW.setHorizontalHeaderItem(c, QTableWidgetItem(hrdTxt))
-        tableW.horizontalHeaderItem(c).setToolTip(toolTipTxt)
-        c += 1
-    for tc in range (16):
-        tableW.setHorizontalHeaderItem(c, QTableWidgetItem('tc#{}'.format(tc)))
-        tableW.horizontalHeaderItem(c).setToolTip('ceiling in meters for tissue compartment number {}'.format(tc))
-        c += 1
-    # table rows
-    point : DiveProfilePoint
-    for row, point  in enumerate( profile):
-        col = 0
+# the columns of the profile table, header text and tool tip, then the ceilings of the 16 compartments
+PROFILE_COLUMNS = [
+    ('time', 'runtime in min:sec' ),
+    ('depth', 'current dive depth in meters'),
+    ('phase','current dive phase'),
+    ('T', 'currently used scuba tank ID'),
+    ('o2/he', 'Oxygen/Helium % in current tank'),
+    ('bar', 'Tank pressure in bar'),
+    ('ppO2', 'Oxygen partial pressure in bar'),
+    ('GF', 'Gradient Factor used'),
+    ('C:3m', 'GF Ceiling depth at 3m increment'),
+    ('CEIL', 'GF Ceiling depth in meters, no rounding'),
+    ('margin', 'Ceiling margin, meters from current depth'),
+    ('lead', 'leading/ceiling tissue compartment number'),
+    ] + [('tc#{}'.format(tc), 'ceiling in meters for tissue compartment number {}'.format(tc)) for tc in range(16)]
+MARGIN_COLUMN = 10
+CEILINGS_COLUMN = 12
+
+
+def profileCellText(point, column):
+    '''the text of one cell of the profile table, the one definition of the formats of its columns
+
+    :param point: a profile point with its modelpoint
+    :type point: DiveProfilePoint
+    :param column: column number, see PROFILE_COLUMNS
+    :type column: int
+    :rtype: str
+    '''
+    if column >= CEILINGS_COLUMN:
+        return '{:.1f}'.format(point.modelpoint.ceilings[column - CEILINGS_COLUMN])
+    if column == 0:
         min, sec = divmod(point.time, 60)
-        tableW.setItem(row, col, QTableWidgetItem('{:02.0f}:{:02.0f}'.format(min, sec)))
-        col += 1
-        tableW.setItem(row, col, QTableWidgetItem('{:>5.1f}'.format(point.depth)))
-        col += 1
-        tableW.setItem(row, col, QTableWidgetItem('{}'.format(point.divephase.name)))
-        col += 1
-        tableW.setItem(row, col, QTableWidgetItem('{:s}'.format(point.tank.name)))
-        col += 1
-        tableW.setItem(row, col, QTableWidgetItem('{:.0f}/{:.0f}'.format(point.tank.o2, point.tank.he)))
-        #col += 1
-        #tableW.setItem(row, col, QTableWidgetItem('{:.0f}'.format(point.tank.he)))
-        col += 1
-        tableW.setItem(row, col, QTableWidgetItem('{:>3.0f}'.format(point.currentTankPressure)))
-        col += 1
-        tableW.setItem(row, col, QTableWidgetItem('{:>4.2f}'.format(point.ppOxygen)))
-        col += 1
-        tableW.setItem(row, col, QTableWidgetItem('{:.2f}'.format(point.gfNow)))
-        col += 1
-        tableW.setItem(row, col, QTableWidgetItem('{}'.format(point.modelpoint.leadCeilingStop)))
-        col += 1
-        tableW.setItem(row, col, QTableWidgetItem('{:.1f}'.format(point.modelpoint.leadCeilingMeters)))
-        col += 1
-        margin_now = point.depth - point.modelpoint.leadCeilingMeters
-        tableW.setItem(row, col, QTableWidgetItem('{:+.1f}'.format(margin_now)))
-        tableW.item(row, col).setTextAlignment(Qt.AlignRight)
-        if margin_now < 0:
-            tableW.item(row, col).setBackground(Qt.red)
-        col += 1
-        tableW.setItem(row, col, QTableWidgetItem('{}'.format(point.modelpoint.leadTissue)))
-        col += 1
-
-        for ceiling in point.modelpoint.ceilings:
-            tableW.setItem(row, col, QTableWidgetItem('{:.1f}'.format(ceiling)))
-            col += 1
-
-    tableW.resizeColumnsToContents()
-    tableW.resizeRowsToContents()
-    #tableW.show()
\ No newline at end of file
+        return '{:02.0f}:{:02.0f}'.format(min, sec)
+    if column == 1:
+        return '{:>5.1f}'.format(point.depth)
+    if column == 2:
+        return '{}'.format(point.divephase.name)
+    if column == 3:
+        return '{:s}'.format(point.tank.name)
+    if column == 4:
+        return '{:.0f}/{:.0f}'.format(point.tank.o2, point.tank.he)
+    if column == 5:
+        return '{:>3.0f}'.format(point.currentTankPressure)
+    if column == 6:
+        return '{:>4.2f}'.format(point.ppOxygen)
+    if column == 7:
+        return '{:.2f}'.format(point.gfNow)
+    if column == 8:
+        return '{}'.format(point.modelpoint.leadCeilingStop)
+    if column == 9:
+        return '{:.1f}'.format(point.modelpoint.leadCeilingMeters)
+    if column == MARGIN_COLUMN:
+        return '{:+.1f}'.format(point.depth - point.modelpoint.leadCeilingMeters)
+    return '{}'.format(point.modelpoint.leadTissue)
+
+
+class ProfileTableModel(QAbstractTableModel):
+    '''
+    the dive profile as a table model for a QTableView
+
+    The cells are formatted only when the view asks for them, that is when they are visible, so a new profile
+    costs nothing until the TABLE tab is shown.
+    '''
+    def __init__(self, profile=None, parent=None):
+        super().__init__(parent)
+        self.profile = profile or []
+
+    def setProfile(self, profile):
+        # the view rereads everything, after a recalculation all rows may have changed
+        self.beginResetModel()
+        self.profile = profile
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.profile)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(PROFILE_COLUMNS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return QVariant()
+        point = self.profile[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            return profileCellText(point, column)
+        if column == MARGIN_COLUMN:
+            if role == Qt.TextAlignmentRole:
+                return int(Qt.AlignRight | Qt.AlignVCenter)
+            if role == Qt.BackgroundRole and point.depth - point.modelpoint.leadCeilingMeters < 0:
+                return QBrush(Qt.red)
+        return QVariant()
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal:
+            if role == Qt.DisplayRole:
+                return PROFILE_COLUMNS[section][0]
+            if role == Qt.ToolTipRole:
+                return PROFILE_COLUMNS[section][1]
+        elif role == Qt.DisplayRole:
+            return str(section + 1)
+        return QVariant()
+
+
+def sizeProfileColumns(tableV: QTableView, sampleRows=50):
+    '''set the column widths from the header and a sample of rows, instead of measuring every cell
+
+    The rows are spread evenly over the profile, so the deep and the shallow parts both are in the sample.
+    The row height is the same for all rows, one line of text.
+    :param tableV: a view of a ProfileTableModel
+    :type tableV: QTableView
+    :param sampleRows: number of rows measured
+    :type sampleRows: int
+    '''
+    model = tableV.model()
+    profile = model.profile
+    metrics = tableV.fontMetrics()
+    headerMetrics = tableV.horizontalHeader().fontMetrics()
+    step = max(1, len(profile) // sampleRows)
+    sample = profile[::step]
+    padding = 2 * metrics.averageCharWidth() + 2
+    for column, header in enumerate(PROFILE_COLUMNS):
+        width = headerMetrics.width(header[0])
+        for point in sample:
+            width = max(width, metrics.width(profileCellText(point, column)))
+        tableV.setColumnWidth(column, width + padding)
+    tableV.verticalHeader().setDefaultSectionSize(metrics.height() + 6)
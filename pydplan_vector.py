@@ -0,0 +1,282 @@
+#!/usr/bin/python
+# (c) 2018 Ian Leiman, ian.leiman@gmail.com
+# pydplan_vector
+# PYDPLAN module for a NumPy vectorized Bühlmann tissue engine, a Python Dive Planner with PyQt5 GUI
+# same model as pydplan_buhlmann.ModelPoint, but all 16 compartments are updated in one array operation
+#
+import math
+from array import array
+from collections import OrderedDict
+import threading
+import numpy as np
+
+from pydplan_buhlmann import ModelPoint, Constants, DecayTable, decayTable, depth2absolutePressure
+
+# index of each inert gas along the last axis of the pressure and coefficient arrays
+NITROGEN = 0
+HELIUM = 1
+
+
+class VectorCoefficients():
+    """
+    Buhlmann model coefficients of one model variant stored in contiguous arrays of shape (COMPS, 2),
+    the last axis holds the [Nitrogen, Helium] values
+    """
+    def __init__(self, modelUsed):
+        self.modelUsed = modelUsed
+        self.k = np.array([[c.NitrogenK, c.HeliumK] for c in modelUsed])
+        self.a = np.array([[c.NitrogenA, c.HeliumA] for c in modelUsed])
+        self.b = np.array([[c.NitrogenB, c.HeliumB] for c in modelUsed])
+        # decay factors as arrays, converted from the DecayTable shared with ModelPoint
+        self.decayTable = decayTable(modelUsed)
+        self.decays = OrderedDict()
+        # the coefficients are shared by the plans calculated in other threads
+        self.lock = threading.Lock()
+
+    def decay(self, minutes):
+        '''exp(-k * minutes) of all compartments as an array of shape (COMPS, 2), from the shared DecayTable'''
+        with self.lock:
+            decay = self.decays.get(minutes)
+            if decay is not None:
+                self.decays.move_to_end(minutes)
+                return decay
+        # the table has (Helium, Nitrogen) pairs, the arrays have [Nitrogen, Helium]
+        decay = np.array(self.decayTable.get(minutes))[:, ::-1].copy()
+        with self.lock:
+            self.decays[minutes] = decay
+            if len(self.decays) > DecayTable.CACHE_SIZE + len(DecayTable.INTERVALS):
+                self.decays.popitem(last=False)
+        return decay
+
+# one VectorCoefficients per model variant, keyed by the identity of the coefficients list
+_vectorCoefficients = dict()
+
+def vectorCoefficients(modelUsed):
+    '''return the cached VectorCoefficients of a model variant, create it at first use
+
+    :param modelUsed: the model coefficients list, like BUHLMANN_COEF['ZHL16c']
+    :type modelUsed: list
+    :return: coefficient arrays for the model
+    :rtype: VectorCoefficients
+    '''
+    coefficients = _vectorCoefficients.get(id(modelUsed))
+    if coefficients is None:
+        coefficients = VectorCoefficients(modelUsed)
+        _vectorCoefficients[id(modelUsed)] = coefficients
+    return coefficients
+
+
+def tissuePressures(pressures, constK, gasInspired, gasRate, minutes, schreiner, decay=None):
+    '''new Nitrogen and Helium pressures of all compartments after an exposure interval
+
+    Works on any number of leading dimensions, so the same code updates one model (COMPS, 2)
+    or a batch of models (N, COMPS, 2). The arithmetic is written in the same order as
+    Compartment.calculateCompartment() and Compartment.newPressureSchreiner(), so the results match
+    the scalar engine.
+    :param pressures: old tissue pressures, shape (..., COMPS, 2)
+    :type pressures: numpy.ndarray
+    :param constK: K constants, shape (COMPS, 2)
+    :type constK: numpy.ndarray
+    :param gasInspired: inspired pressures, shape (..., 2)
+    :type gasInspired: numpy.ndarray
+    :param gasRate: BAR/min change rate of the inspired gases, shape (..., 2)
+    :type gasRate: numpy.ndarray
+    :param minutes: minutes of exposure, shape (...)
+    :type minutes: numpy.ndarray
+    :param schreiner: True where the Schreiner equation is used, shape (...)
+    :type schreiner: numpy.ndarray
+    :param decay: exp(-constK * minutes) if already known, like from VectorCoefficients.decay()
+    :type decay: numpy.ndarray
+    :return: the new tissue pressures, shape (..., COMPS, 2)
+    :rtype: numpy.ndarray
+    '''
+    gasInspired = np.asarray(gasInspired)[..., np.newaxis, :]
+    gasRate = np.asarray(gasRate)[..., np.newaxis, :]
+    minutes = np.asarray(minutes)[..., np.newaxis, np.newaxis]
+    schreiner = np.asarray(schreiner)[..., np.newaxis, np.newaxis]
+    if decay is None:
+        decay = np.exp(-constK * minutes)
+    # constant depth -> simplified Haldane or the instantaneous equation
+    haldane = pressures + ((gasInspired - pressures) * (1 - decay))
+    # ascending or descending -> Schreiner equation
+    schreinerP = (gasInspired +
+                  gasRate * (minutes - (1.0 / constK)) -
+                  (gasInspired - pressures -
+                   (gasRate / constK)) *
+                  decay)
+    return np.where(schreiner, schreinerP, haldane)
+
+
+def mixedCoefficients(pressures, coefficients):
+    '''the HeliumNitrogen A & B coefficients, weighted by the tissue gas pressures
+
+    :param pressures: tissue pressures, shape (..., COMPS, 2)
+    :type pressures: numpy.ndarray
+    :param coefficients: coefficient arrays of the model
+    :type coefficients: VectorCoefficients
+    :return: tuple of A and B arrays, shape (..., COMPS)
+    :rtype: tuple
+    '''
+    heliumPressure = pressures[..., HELIUM]
+    nitrogenPressure = pressures[..., NITROGEN]
+    a = coefficients.a
+    b = coefficients.b
+    heliumNitrogenA = (((a[:, HELIUM] * heliumPressure) + (a[:, NITROGEN] * nitrogenPressure)) /
+                       (heliumPressure + nitrogenPressure))
+    heliumNitrogenB = (((b[:, HELIUM] * heliumPressure) + (b[:, NITROGEN] * nitrogenPressure)) /
+                       (heliumPressure + nitrogenPressure))
+    return heliumNitrogenA, heliumNitrogenB
+
+
+def maxAmbientPressures(pressures, heliumNitrogenA, heliumNitrogenB, gf):
+    '''tolerated ambient pressures for all compartments at the given gradient factor,
+    the array version of Compartment.get_max_amb()
+    '''
+    gf = np.asarray(gf)[..., np.newaxis]
+    return (((pressures[..., HELIUM] + pressures[..., NITROGEN]) - heliumNitrogenA * gf) /
+            (gf / heliumNitrogenB - gf + 1.0))
+
+
+class VectorCompartment():
+    '''
+    read only view to one compartment of a VectorModelPoint, has the attributes of Compartment used by the plots
+    '''
+    def __init__(self, modelpoint, index):
+        self.index = index
+        self.nitrogenPressure = float(modelpoint.pressures[index, NITROGEN])
+        self.heliumPressure = float(modelpoint.pressures[index, HELIUM])
+        self.HeliumNitrogenA = float(modelpoint.heliumNitrogenA[index])
+        self.HeliumNitrogenB = float(modelpoint.heliumNitrogenB[index])
+        self.mv = ((self.heliumPressure + self.nitrogenPressure) /
+                   (Constants.surfacePressure / self.HeliumNitrogenB + self.HeliumNitrogenA))
+        self.ambTolP = float(modelpoint.ambient) / self.HeliumNitrogenB + self.HeliumNitrogenA
+
+
+class VectorModelPoint():
+    """
+    object that stores a Buhlmann model state for 16 tissue compartments in NumPy arrays,
+    a drop in replacement of ModelPoint for calculatePlan(engine='numpy')
+    """
+    COMPS = ModelPoint.COMPS
+
+    def __init__(self, modelUsed = 'ZHL16c'):
+        self.modelUsed = modelUsed
+        self.coefficients = None
+
+        self.pressures = np.zeros((self.COMPS, 2))
+        self.heliumNitrogenA = np.zeros(self.COMPS)
+        self.heliumNitrogenB = np.ones(self.COMPS)
+        self.ceilingArray = np.zeros(self.COMPS)
+        self.ambient = 0.0 # store the ambient pressure used to calculate this point
+        self.leadMaxAmbBars = -100.0
+        self.gfNow = 1.0
+        self.leadTissue = -1
+        self.leadCeilingMeters = -100.0
+        self.leadCeilingStop = -1
+
+        self.leadCeilingBarsNitrogen = 0.0
+        self.leadCeilingBarsHelium = 0.0
+        self.maxNitrogenPressure = 0.0
+        self.maxHeliumPressure = 0.0
+
+        # store water wapor partial pressure
+        self.waterVapor = Constants.WaterVaporSurface
+
+    def __deepcopy__(self, memo):
+        newobj = VectorModelPoint(self.modelUsed)
+        newobj.__dict__.update(self.__dict__)
+        newobj.pressures = self.pressures.copy()
+        newobj.heliumNitrogenA = self.heliumNitrogenA.copy()
+        newobj.heliumNitrogenB = self.heliumNitrogenB.copy()
+        newobj.ceilingArray = self.ceilingArray.copy()
+        return newobj
+
+    @property
+    def ceilings(self):
+        return self.ceilingArray.tolist()
+
+    @property
+    def tissues(self):
+        return [VectorCompartment(self, index) for index in range(self.COMPS)]
+
+    def tissueColumns(self):
+        '''the tissue state as arrays of COMPS values, used by ModelHistory to record this state'''
+        return (array('d', np.ascontiguousarray(self.pressures[:, NITROGEN]).tobytes()),
+                array('d', np.ascontiguousarray(self.pressures[:, HELIUM]).tobytes()),
+                array('d', self.heliumNitrogenA.tobytes()),
+                array('d', self.heliumNitrogenB.tobytes()),
+                array('d', self.ceilingArray.tobytes()))
+
+    def initSurface(self, mc):
+        self.coefficients = vectorCoefficients(mc)
+        self.pressures[:, HELIUM] = 0.0
+        self.pressures[:, NITROGEN] = Constants.initN2
+        self.heliumNitrogenA, self.heliumNitrogenB = mixedCoefficients(self.pressures, self.coefficients)
+
+    def restoreTissues(self, mc, modelpoint):
+        '''set the tissue pressures from another model state, like a recorded ModelPointView'''
+        self.coefficients = vectorCoefficients(mc)
+        for comp in modelpoint.tissues:
+            self.pressures[comp.index, NITROGEN] = comp.nitrogenPressure
+            self.pressures[comp.index, HELIUM] = comp.heliumPressure
+        self.heliumNitrogenA, self.heliumNitrogenB = mixedCoefficients(self.pressures, self.coefficients)
+
+    def calculateAllTissues(self, modelUsed, beginPressure, endPressure,
+                            intervalMinutes,  # in minutes
+                            heliumFraction, nitrogenFraction, gfNow):
+        ''' Calculate all tissue compartments for the given model constants, in one vectorized step
+        see ModelPoint.calculateAllTissues() for the parameters
+        '''
+        coefficients = vectorCoefficients(modelUsed)
+        self.coefficients = coefficients
+        heliumInspired = (beginPressure - self.waterVapor) * heliumFraction
+        nitrogenInspired = (beginPressure - self.waterVapor) * nitrogenFraction
+
+        if beginPressure == endPressure :
+            # constant depth case, gas rate not changing
+            heliumBarPerMin = 0.0
+            nitrogenBarPerMin = 0.0
+        else:
+            # ascending or descending, calculate BAR/min change rate for inert gases
+            barPerMin = (endPressure - beginPressure) / intervalMinutes
+            heliumBarPerMin   = barPerMin * heliumFraction
+            nitrogenBarPerMin = barPerMin * nitrogenFraction
+        # same rule as Compartment.calculateCompartment(), Schreiner only when both gases are changing
+        schreiner = heliumBarPerMin != 0 and nitrogenBarPerMin != 0
+
+        self.ambient = endPressure
+        self.gfNow = gfNow
+        self.pressures = tissuePressures(self.pressures, coefficients.k,
+                                         (nitrogenInspired, heliumInspired),
+                                         (nitrogenBarPerMin, heliumBarPerMin),
+                                         intervalMinutes, schreiner, coefficients.decay(intervalMinutes))
+        self.heliumNitrogenA, self.heliumNitrogenB = mixedCoefficients(self.pressures, coefficients)
+
+        # the actual ceilings to use, based on gfNow
+        maxAmbBars = maxAmbientPressures(self.pressures, self.heliumNitrogenA, self.heliumNitrogenB,
+                                         gfNow) - Constants.surfacePressure
+        self.ceilingArray = maxAmbBars * 10.0
+        # find out the leading tissue and record it
+        lead = int(np.argmax(self.ceilingArray))
+        self.leadTissue = lead
+        self.leadMaxAmbBars = float(maxAmbBars[lead])
+        self.leadCeilingMeters = float(self.ceilingArray[lead])
+        self.leadCeilingStop = int(math.ceil(self.leadCeilingMeters / 3.0) * 3.0)
+        # search for maximum pressures
+        maxPressures = self.pressures.max(axis=0)
+        if maxPressures[NITROGEN] > 0.0:
+            self.maxNitrogenPressure = float(maxPressures[NITROGEN])
+        if maxPressures[HELIUM] > 0.0:
+            self.maxHeliumPressure = float(maxPressures[HELIUM])
+
+    def calculateAllTissuesDepth(self, modelUsed, beginDepth, endDepth,
+                            intervalMinutes,  # in minutes
+                            heliumFraction, nitrogenFraction, gfNow):
+        """
+        same as calculateAllTissues() but depths as arguments, instead of pressures
+        """
+        beginPressure = depth2absolutePressure(beginDepth)
+        endPressure = depth2absolutePressure(endDepth)
+        self.calculateAllTissues(modelUsed, beginPressure, endPressure,
+                                intervalMinutes,  # in minutes
+                                heliumFraction, nitrogenFraction, gfNow)
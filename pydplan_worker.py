@@ -0,0 +1,132 @@
+# (c) 2018 Ian Leiman, ian.leiman@gmail.com
+# pydplan_worker
+# part of PYDPLAN, a Python Dive Planner with PyQt5 GUI
+# recalculates the dive plan in a worker thread, so that the GUI does not freeze while the inputs change
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+
+from pydplan_classes import PlanResult
+from pydplan_profiletools import planSteps, newModelPoint, PlanCheckpoints
+from pydplan_plancache import planCache, planFingerprint
+
+
+class PlanWorkerSignals(QObject):
+    # QRunnable is not a QObject, so its signals are here
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+
+
+class PlanWorker(QRunnable):
+    '''
+    calculates one plan in a thread of the pool, the plan must be an inputCopy() that nobody else uses
+    '''
+    def __init__(self, generation, divePlan, options=None, checkpoints=None):
+        super().__init__()
+        self.generation = generation
+        self.divePlan = divePlan
+        self.options = options or dict()
+        self.checkpoints = checkpoints
+        self.cancelled = False
+        self.signals = PlanWorkerSignals()
+
+    def cancel(self):
+        # checked between the steps of the plan
+        self.cancelled = True
+
+    def run(self):
+        options = dict(self.options)
+        model = newModelPoint(options.pop('engine', 'python'))
+        try:
+            # same as calculatePlan(), but can stop after any step
+            for point in planSteps(self.divePlan, model, checkpoints=self.checkpoints, **options):
+                if self.cancelled:
+                    return
+        except ValueError as error:
+            self.signals.failed.emit(self.generation, error.args[0])
+            return
+        if not self.cancelled:
+            self.signals.finished.emit(self.generation, self.divePlan)
+
+
+class PlanScheduler(QObject):
+    '''
+    debounces the recalculation requests of the GUI, and runs the latest one in a worker thread
+
+    request() restarts the debounce timer. When the inputs have not changed for debounceMs, makeInput() is called
+    to take a copy of the inputs, the plan still being calculated is cancelled and the new one is started.
+    planReady is emitted only for the plan of the latest request, so an older plan never replaces a newer one.
+    The results are kept in a PlanCache, so when an input is changed back, the earlier results are shown at once.
+    When only the gradient factor high, the ascent rates or the deco gases change, the plan continues from the
+    PlanCheckpoint at the end of the bottom of the earlier plans.
+    '''
+    planReady = pyqtSignal(object)
+    planFailed = pyqtSignal(str)
+
+    def __init__(self, makeInput, debounceMs=150, options=None, cache=None, parent=None):
+        '''
+        :param makeInput: function returning a new DivePlan to calculate, called in the GUI thread
+        :type makeInput: function
+        :param debounceMs: milliseconds to wait for more input changes before calculating
+        :type debounceMs: int
+        :param options: calculatePlan() options, like engine or stepping
+        :type options: dict
+        :param cache: the cache of the results, planCache() if None
+        :type cache: PlanCache
+        '''
+        super().__init__(parent)
+        self.makeInput = makeInput
+        self.options = options or dict()
+        self.cache = cache if cache is not None else planCache()
+        self.fingerprint = None
+        # only the worker thread uses them, one plan at a time
+        self.checkpoints = PlanCheckpoints()
+        self.generation = 0
+        self.worker = None
+        # one thread is enough, a cancelled plan stops at its next step
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(debounceMs)
+        self.timer.timeout.connect(self.start)
+
+    def request(self):
+        self.timer.start()
+
+    def start(self):
+        self.timer.stop()
+        if self.worker is not None:
+            self.worker.cancel()
+        self.worker = None
+        self.generation += 1
+        divePlan = self.makeInput()
+        self.fingerprint = planFingerprint(divePlan, **self.options)
+        result = self.cache.get(self.fingerprint)
+        if result is not None:
+            self.planReady.emit(result)
+            return
+        self.worker = PlanWorker(self.generation, divePlan, self.options, self.checkpoints)
+        self.worker.signals.finished.connect(self.workerFinished)
+        self.worker.signals.failed.connect(self.workerFailed)
+        self.pool.start(self.worker)
+
+    def workerFinished(self, generation, divePlan):
+        # the signals are delivered to the GUI thread, so a newer request can not start in between
+        if generation == self.generation:
+            self.worker = None
+            result = PlanResult(divePlan)
+            self.cache.put(self.fingerprint, result)
+            self.planReady.emit(result)
+
+    def workerFailed(self, generation, message):
+        if generation == self.generation:
+            self.worker = None
+            self.planFailed.emit(message)
+
+    def shutdown(self):
+        '''cancel the pending and running plans, and wait for the worker thread'''
+        self.timer.stop()
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker = None
+        self.pool.waitForDone()
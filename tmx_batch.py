@@ -0,0 +1,157 @@
+#!/usr/bin/python
+# (c) 2018 Ian Leiman, ian.leiman@gmail.com
+# tmx_batch.py
+# GNU General Public License v3.0
+# use at your own risk, no guarantees, no liability!
+# github project https://github.com/eianlei/trimix-fill/
+# Python-3 functions:
+#    tmx_batch() calculates trimix blending like tmx_calc(), for arrays of cylinders in one vectorized pass
+#    tmx_batch_text() builds the human readable recipe text of one cylinder, only when it is needed
+import numpy as np
+
+from tmx_calc import tmx_calc
+
+FILLTYPES = ('pp', 'cfm', 'tmx', 'air', 'nx')
+
+# one row of results for each cylinder, the same keys as the tmx_calc() result dictionary, and also
+# the inputs of the row so that the text can be made later
+TMX_BATCH_DTYPE = np.dtype([
+    ('status_code', np.int16),
+    ('filltype', 'U8'),
+    ('start_bar', float), ('end_bar', float),
+    ('start_o2', float), ('start_he', float), ('end_o2', float), ('end_he', float),
+    ('he_ignore', bool), ('o2_ignore', bool),
+    ('tbar_2', float), ('tbar_3', float),
+    ('add_he', float), ('add_o2', float), ('add_air', float),
+    ('add_nitrox', float), ('nitrox_pct', float),
+    ('add_tmx', float), ('tmx_o2_pct', float), ('tmx_he_pct', float), ('tmx_preo2_pct', float),
+    ('mix_o2_pct', float), ('mix_he_pct', float), ('mix_n_pct', float),
+])
+
+# the fields that are set to zero when the row has an error, like tmx_calc() returns them
+RESULT_FIELDS = ('tbar_2', 'tbar_3', 'add_he', 'add_o2', 'add_air', 'add_nitrox', 'nitrox_pct',
+                 'add_tmx', 'tmx_o2_pct', 'tmx_he_pct', 'tmx_preo2_pct', 'mix_o2_pct', 'mix_he_pct', 'mix_n_pct')
+
+
+def tmx_batch(filltype="pp", start_bar=0, end_bar=200, start_o2=21, start_he=35, end_o2=21, end_he=35,
+              he_ignore=False, o2_ignore=False):
+    """calculates trimix blending for arrays of cylinders
+
+    The arguments are the same as for tmx_calc(), but each one can be a scalar or an array, and they are
+    broadcast against each other. So a whole rig can be calculated with one fill type and a list of start
+    pressures, or each cylinder can have its own fill type and mixes.
+    The status code of each row is the one tmx_calc() would return for the same inputs, the first failed
+    check in the same order. Rows with an error have zero results, like tmx_calc(). A row where tmx_calc()
+    would divide by zero gets status_code 99.
+    :return: structured array of TMX_BATCH_DTYPE, with the shape of the broadcast inputs
+    :rtype: numpy.ndarray
+    """
+    (filltype, start_bar, end_bar, start_o2, start_he, end_o2, end_he, he_ignore, o2_ignore) = np.broadcast_arrays(
+        np.asarray(filltype, dtype=str), *[np.asarray(value, dtype=float) for value in
+                                            (start_bar, end_bar, start_o2, start_he, end_o2, end_he)],
+        np.asarray(he_ignore, dtype=bool), np.asarray(o2_ignore, dtype=bool))
+    result = np.zeros(filltype.shape, dtype=TMX_BATCH_DTYPE)
+    result['filltype'] = filltype
+    result['start_bar'] = start_bar
+    result['end_bar'] = end_bar
+    result['start_o2'] = start_o2
+    result['start_he'] = start_he
+    result['end_o2'] = end_o2
+    result['end_he'] = end_he
+    result['he_ignore'] = he_ignore
+    result['o2_ignore'] = o2_ignore
+
+    # check if filling just air or just Nitrox
+    o2_ignore = o2_ignore | (filltype == "air")
+    he_ignore = he_ignore | (filltype == "air") | (filltype == "nx")
+
+    # do the calculations, the same formulas as tmx_calc() for all the rows, the errors are checked after
+    with np.errstate(divide='ignore', invalid='ignore'):
+        start_he_bar = start_bar * start_he / 100 # how many bars Helium in tank at start?
+        # plain Nitrox fill does not add any He, so at the end we have same He bar
+        end_he_bar = np.where(he_ignore, start_he_bar, end_bar * end_he / 100)
+        # % He after the tank is filled full, the target of the fill
+        target_he = np.where(he_ignore, 100 * start_he_bar / end_bar, end_he)
+        add_he = np.where(he_ignore, 0.0, end_he_bar - start_he_bar)
+        # tbar_2 is the tank pressure after we have filled Helium with PP method
+        tbar_2 = start_bar + add_he
+        # how many bar of air we must top after Helium and Oxygen are in, or just top with air
+        add_air = np.where(o2_ignore, end_bar - start_bar,
+                           (end_bar * (1 - target_he / 100 - end_o2 / 100)
+                            - start_bar * (1 - start_o2 / 100 - start_he / 100)) / 0.79)
+        tbar_3 = np.where(o2_ignore, start_bar, end_bar - add_air)
+        add_o2 = np.where(o2_ignore, 0.0, tbar_3 - tbar_2)
+        start_o2_bar = start_bar * start_o2 / 100 # how many bars O2 in tank at start?
+        mix_o2_pct = 100 * (start_o2_bar + add_o2 + add_air * 0.21) / end_bar
+        mix_he_pct = 100 * (start_he_bar + add_he) / end_bar
+        mix_n_pct = 100 - mix_he_pct - mix_o2_pct
+        # additional output needed for cfm fill case
+        add_nitrox = end_bar - tbar_2
+        end_o2_bar = end_bar * end_o2 / 100
+        nitrox_pct = 100 * ((end_o2_bar - start_o2_bar) / add_nitrox)
+        # additional output needed for tmx fill case
+        add_tmx = end_bar - start_bar
+        tmx_he_pct = 100 * (end_he_bar - start_he_bar) / add_tmx
+        tmx_o2_pct = 100 * (end_o2_bar - start_o2_bar) / add_tmx
+        tmx_preo2_pct = tmx_o2_pct * ((100 - tmx_he_pct) / 100)
+    values = dict(tbar_2=tbar_2, tbar_3=tbar_3, add_he=add_he, add_o2=add_o2, add_air=add_air,
+                  add_nitrox=add_nitrox, nitrox_pct=nitrox_pct, add_tmx=add_tmx, tmx_o2_pct=tmx_o2_pct,
+                  tmx_he_pct=tmx_he_pct, tmx_preo2_pct=tmx_preo2_pct, mix_o2_pct=mix_o2_pct,
+                  mix_he_pct=mix_he_pct, mix_n_pct=mix_n_pct)
+
+    cfm = (filltype == "cfm") | (filltype == "nx")
+    tmx = filltype == "tmx"
+    # the checks of tmx_calc() in its order, the first failing check of a row gives its status code
+    finite = np.ones(filltype.shape, dtype=bool)
+    for name in RESULT_FIELDS:
+        finite &= np.isfinite(values[name])
+    checks = ((10, ~np.isin(filltype, FILLTYPES)),
+              (11, start_bar < 0),
+              (12, end_bar < 0),
+              (13, start_bar > 300),
+              (14, end_bar > 301),
+              (15, end_bar <= start_bar),
+              (16, start_o2 < 0),
+              (17, start_he < 0),
+              (18, end_o2 < 0),
+              (19, end_he < 0),
+              (20, start_o2 > 100),
+              (21, start_he > 100),
+              (22, end_o2 > 100),
+              (23, end_he > 100),
+              (24, start_o2 + start_he > 100),
+              (25, end_o2 + end_he > 100),
+              # tmx_calc() would stop to a division by zero before checking the results
+              (99, ~finite),
+              (52, cfm & (nitrox_pct < 21)),
+              (53, cfm & (nitrox_pct > 36)),
+              (54, tmx & (tmx_he_pct > 36)),
+              (55, tmx & (tmx_o2_pct > 36)),
+              (56, tmx & (tmx_preo2_pct < 12)),
+              (61, add_he < 0),
+              (62, add_o2 < -0.000000001),
+              (63, add_air < 0))
+    status_code = np.select([failed for code, failed in checks], [code for code, failed in checks], 0)
+    result['status_code'] = status_code
+    valid = status_code == 0
+    for name in RESULT_FIELDS:
+        result[name] = np.where(valid, values[name], 0.0)
+    return result
+
+
+def tmx_batch_text(result, index):
+    """the human readable recipe or error text of one row of tmx_batch(), the same as tmx_calc() returns
+
+    :param result: the result of tmx_batch()
+    :type result: numpy.ndarray
+    :param index: index of the row
+    :type index: int or tuple
+    :rtype: str
+    """
+    row = result[index]
+    if row['status_code'] == 99:
+        return 'FATAL ERROR\n'
+    # whole numbers as int, so that the text shows them like the inputs of tmx_calc() usually are
+    numbers = [int(value) if value.is_integer() else value for value in
+               (float(row[name]) for name in ('start_bar', 'end_bar', 'start_o2', 'start_he', 'end_o2', 'end_he'))]
+    return tmx_calc(str(row['filltype']), *numbers, bool(row['he_ignore']), bool(row['o2_ignore']))['status_text']
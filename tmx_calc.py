@@ -9,7 +9,8 @@
 #    tmx_cost_calc() calculates the cost of filling
 def tmx_calc(filltype: object = "pp", start_bar: object = 0, end_bar: object = 200,
              start_o2: object = 21, start_he: object = 35, end_o2: object = 21, end_he: object = 35,
-             he_ignore: object = False, o2_ignore: object = False) -> object:
+             he_ignore: object = False, o2_ignore: object = False,
+             ztable: object = None, temp_c: object = 20.0) -> object:
     """calculates trimix blending for 3 different fill methods"""
     # input parameters:
     #  filltype: {pp, cfm, tmx}
@@ -26,6 +27,8 @@ def tmx_calc(filltype: object = "pp", start_bar: object = 0, end_bar: object = 2
     #  end_he: wanted he%, must be >=0 and <= 100
     #  he_ignore: boolean, true = ignore helium target, plain Nitrox fill
     #  o2_ignore: boolean, true = ignore oxygen target, plain AIR fill
+    #  ztable: None = ideal gas, or a ZTable from vdw_ztable.ztable() for real gas Van der Waals corrections
+    #  temp_c: temperature in Celsius, used only with ztable
     #
     # return dictionary tmx_result, following keys:
     #  status_code: 0 if all OK, 10...20 input errors 50...60 calculation errors, 99 fatal
@@ -136,6 +139,22 @@ def tmx_calc(filltype: object = "pp", start_bar: object = 0, end_bar: object = 2
     if filltype == "nx" :
         he_ignore = True
 
+    # real gas: the formulas below are a balance of the amounts of each gas, so with a ztable they are
+    # calculated in the bars an ideal gas of the same mols would have, start_bar / Z, and the pressures of
+    # the recipe are converted back to real pressures when the results are ready
+    if ztable is not None:
+        real_start_bar = start_bar
+        real_end_bar = end_bar
+        end_mix_o2 = end_o2
+        end_mix_he = end_he
+        if he_ignore:
+            end_mix_he = start_bar * start_he / end_bar
+        if o2_ignore:
+            end_mix_o2 = (start_bar * start_o2 + 0.21 * (end_bar * (100 - end_mix_he) - start_bar * (100 - start_he))) \
+                         / end_bar
+        start_bar = ztable.ideal_bar(start_bar, temp_c, start_o2 / 100, start_he / 100)
+        end_bar = ztable.ideal_bar(end_bar, temp_c, end_mix_o2 / 100, end_mix_he / 100)
+
 
     # do the calculations
     start_he_bar = start_bar * start_he / 100 # how many bars Helium in tank at start?
@@ -232,6 +251,28 @@ def tmx_calc(filltype: object = "pp", start_bar: object = 0, end_bar: object = 2
         return tmx_result
 
 
+    if ztable is not None:
+        # back to real pressures, each stage of the fill from its amount of gas and its mix
+        if add_he == 0:
+            tbar_2 = real_start_bar
+        else:
+            tbar_2 = ztable.real_bar(tbar_2, temp_c, start_o2_bar / tbar_2, (start_he_bar + add_he) / tbar_2)
+        if o2_ignore:
+            tbar_3 = real_start_bar
+        elif add_o2 == 0:
+            tbar_3 = tbar_2
+        else:
+            tbar_3 = ztable.real_bar(tbar_3, temp_c, (start_o2_bar + add_o2) / tbar_3,
+                                     (start_he_bar + add_he) / tbar_3)
+        start_bar = real_start_bar
+        end_bar = real_end_bar
+        add_he = tbar_2 - start_bar
+        if not o2_ignore:
+            add_o2 = tbar_3 - tbar_2
+        add_air = end_bar - tbar_3
+        add_nitrox = end_bar - tbar_2
+        add_tmx = end_bar - start_bar
+
     # since we are here, then all error checking has passed, and numerical results should be valid
     # build nice text to return at tmx_result['status_text']
     if add_he > 0:
@@ -0,0 +1,261 @@
+#!/usr/bin/python
+# (c) 2018 Ian Leiman, ian.leiman@gmail.com
+# tmx_topoff.py
+# GNU General Public License v3.0
+# use at your own risk, no guarantees, no liability!
+# github project https://github.com/eianlei/trimix-fill/
+# Python-3 functions:
+#    topoff_search() finds the cheapest or fastest sequence of fills from the sources of a fill station
+#    that takes a cylinder from its current contents to the wanted mix, within a tolerance
+#
+# The search tries every set of one, two or three sources. The mols to add from each source are solved from
+# the balance of total mols, O2 and He, the total mols of the wanted fill come from the Van der Waals gas law.
+# Three sources can reach the wanted mix exactly, with one or two sources the mix is the closest one they can
+# make, and it is accepted if it is within the tolerance. The fills of a set are done in the order of the
+# highest pressure each source can fill to, the compressor last, and the pressures after each fill are solved
+# by Van der Waals gas law to check that every bank can still decant to it.
+# The cost is calculated by tmx_cost_calc() from the pure oxygen and helium that the filled gas contains.
+
+from itertools import combinations
+
+from tmx_calc import tmx_cost_calc
+from vdw_calc import vdw_solve_mols, vdw_solve_pressure, ideal_gas_p
+
+# minutes to connect, fill and analyze one source, added to the fill time of each step
+STEP_MINUTES = 5.0
+# a source that would add less than this many mols is not used, the same set without it is tried anyway
+MIN_FILL_MOLS = 1e-6
+
+
+class FillSource():
+    """
+    a source of gas at the fill station, pure oxygen, helium, the air compressor or a bank of nitrox or trimix
+    """
+    def __init__(self, name, o2=21.0, he=0.0, bar=None, compressor=False, rate_bar_min=10.0):
+        '''
+        :param name: name of the source shown in the fill steps
+        :type name: str
+        :param o2: % oxygen of the gas
+        :type o2: float
+        :param he: % helium of the gas
+        :type he: float
+        :param bar: pressure of the bank, it can fill the cylinder up to this pressure, None if not limited
+        :type bar: float or None
+        :param compressor: filled by the compressor, which costs fill_cost_eur once per fill
+        :type compressor: bool
+        :param rate_bar_min: how many bars per minute the source fills
+        :type rate_bar_min: float
+        '''
+        self.name = name
+        self.o2 = o2
+        self.he = he
+        self.bar = bar
+        self.compressor = compressor
+        self.rate_bar_min = rate_bar_min
+        self.o2_f = o2 / 100.0
+        self.he_f = he / 100.0
+        self.n2_f = 1.0 - self.o2_f - self.he_f
+        # the gas priced as helium, and oxygen that is added on top of the oxygen of the air it was made with
+        self.pure_o2_f = max(self.o2_f - self.n2_f * (0.21 / 0.79), 0.0)
+        # the order of the fills, a bank must be decanted before the cylinder pressure gets above its pressure
+        self.limit = float('inf') if bar is None else bar
+
+
+def station_sources(o2_bar=200.0, he_bar=200.0):
+    '''the sources of a simple fill station: oxygen and helium banks and the air compressor'''
+    return [FillSource('Helium', 0.0, 100.0, he_bar, rate_bar_min=20.0),
+            FillSource('Oxygen', 100.0, 0.0, o2_bar, rate_bar_min=5.0),
+            FillSource('air', 21.0, 0.0, None, compressor=True, rate_bar_min=10.0)]
+
+
+def det3(columns):
+    '''determinant of a 3 x 3 matrix given as three columns'''
+    (a1, b1, c1), (a2, b2, c2), (a3, b3, c3) = columns
+    return a1 * (b2 * c3 - b3 * c2) - a2 * (b1 * c3 - b3 * c1) + a3 * (b1 * c2 - b2 * c1)
+
+
+def solve_fill_mols(sources, fill_mols, miss_o2, miss_he):
+    '''
+    mols to add from each source of a set, so that they add fill_mols in total and come closest to the
+    missing mols of oxygen and helium
+    :param sources: one, two or three sources
+    :type sources: tuple
+    :param fill_mols: total mols to add
+    :type fill_mols: float
+    :param miss_o2: mols of oxygen to add
+    :type miss_o2: float
+    :param miss_he: mols of helium to add
+    :type miss_he: float
+    :return: mols from each source, or None if a source would be emptied or is not needed
+    :rtype: list or None
+    '''
+    if len(sources) == 1:
+        mols = [fill_mols]
+    elif len(sources) == 2:
+        # mols = [t, fill_mols - t], t is the least squares solution of the oxygen and helium balance
+        first, second = sources
+        d_o2 = first.o2_f - second.o2_f
+        d_he = first.he_f - second.he_f
+        divisor = d_o2 * d_o2 + d_he * d_he
+        if divisor == 0.0:
+            return None
+        r_o2 = fill_mols * second.o2_f - miss_o2
+        r_he = fill_mols * second.he_f - miss_he
+        t = -(r_o2 * d_o2 + r_he * d_he) / divisor
+        mols = [t, fill_mols - t]
+    else:
+        # three sources, the balance of total, oxygen and helium mols solved exactly by Cramer's rule
+        columns = [(1.0, source.o2_f, source.he_f) for source in sources]
+        det = det3(columns)
+        if abs(det) < 1e-12:
+            return None
+        balance = (fill_mols, miss_o2, miss_he)
+        mols = [det3(columns[:i] + [balance] + columns[i + 1:]) / det for i in range(3)]
+    if min(mols) < MIN_FILL_MOLS:
+        return None
+    return mols
+
+
+def topoff_search(liters=12.0, start_bar=0.0, start_o2=21.0, start_he=0.0, end_bar=200.0, end_o2=21.0, end_he=35.0,
+                  sources=None, o2_tolerance=0.5, he_tolerance=1.0, objective='cost',
+                  o2_cost_eur=4.14, he_cost_eur=25.0, fill_cost_eur=5.0, temp_c=20.0):
+    '''
+    searches the cheapest or fastest sequence of fills that reaches the wanted mix within tolerance
+    :param liters: size of the cylinder in liters (water volume)
+    :type liters: float
+    :param start_bar: pressure in the cylinder now
+    :type start_bar: float
+    :param start_o2: % oxygen in the cylinder now
+    :type start_o2: float
+    :param start_he: % helium in the cylinder now
+    :type start_he: float
+    :param end_bar: wanted pressure
+    :type end_bar: float
+    :param end_o2: wanted % oxygen
+    :type end_o2: float
+    :param end_he: wanted % helium
+    :type end_he: float
+    :param sources: the sources of the fill station, station_sources() if None
+    :type sources: list of FillSource
+    :param o2_tolerance: the resulting % oxygen may differ this much from the wanted
+    :type o2_tolerance: float
+    :param he_tolerance: the resulting % helium may differ this much from the wanted
+    :type he_tolerance: float
+    :param objective: 'cost' for the cheapest fill, 'time' for the fastest
+    :type objective: str
+    :param o2_cost_eur: cost of pure oxygen in Euros per cubic meter, as for tmx_cost_calc()
+    :type o2_cost_eur: float
+    :param he_cost_eur: cost of pure helium in Euros per cubic meter
+    :type he_cost_eur: float
+    :param fill_cost_eur: one time cost for using the compressor
+    :type fill_cost_eur: float
+    :param temp_c: temperature in Celsius
+    :type temp_c: float
+    :return: dictionary of status_code, status_text, steps, cost, minutes, mix_o2_pct, mix_he_pct and end_bar
+       each step is a dictionary of source, from_bar, to_bar and add_bar
+    :rtype: dict
+    '''
+    topoff_result = {'status_code': 99,  # 99 remains if something fatal happens
+                     'status_text': 'FATAL ERROR\n',
+                     'steps': [], 'cost': 0, 'minutes': 0,
+                     'mix_o2_pct': 0, 'mix_he_pct': 0, 'end_bar': 0}
+    if sources is None:
+        sources = station_sources()
+    if objective not in ('cost', 'time'):
+        topoff_result['status_code'] = 10
+        topoff_result['status_text'] = "ERROR: unknown objective '{}'\n".format(objective)
+        return topoff_result
+    if end_bar <= start_bar:
+        topoff_result['status_code'] = 15
+        topoff_result['status_text'] = "ERROR: wanted pressure must be higher than start!\n"
+        return topoff_result
+
+    temp_k = temp_c + 273.0
+    start_o2_f = start_o2 / 100.0
+    start_he_f = start_he / 100.0
+    end_o2_f = end_o2 / 100.0
+    end_he_f = end_he / 100.0
+    start_mols = vdw_solve_mols(start_bar, liters, start_o2_f, start_he_f, 1.0 - start_o2_f - start_he_f, temp_c)
+    start_mols_o2 = start_mols * start_o2_f
+    start_mols_he = start_mols * start_he_f
+    # the wanted mols, solved again for the mix that a set of sources really makes
+    end_mols = vdw_solve_mols(end_bar, liters, end_o2_f, end_he_f, 1.0 - end_o2_f - end_he_f, temp_c)
+
+    best = None
+    for count in (1, 2, 3):
+        for fill_set in combinations(sorted(sources, key=lambda source: source.limit), count):
+            mols = None
+            mix_mols = end_mols
+            for iteration in range(2):
+                mols = solve_fill_mols(fill_set, mix_mols - start_mols,
+                                       mix_mols * end_o2_f - start_mols_o2, mix_mols * end_he_f - start_mols_he)
+                if mols is None:
+                    break
+                mix_o2_f = (start_mols_o2 + sum(m * source.o2_f for m, source in zip(mols, fill_set))) / mix_mols
+                mix_he_f = (start_mols_he + sum(m * source.he_f for m, source in zip(mols, fill_set))) / mix_mols
+                if abs(mix_o2_f - end_o2_f) * 100 > o2_tolerance or abs(mix_he_f - end_he_f) * 100 > he_tolerance:
+                    mols = None
+                    break
+                # the mix is not exactly the wanted one, so the same pressure has a bit different mols
+                mix_mols = vdw_solve_mols(end_bar, liters, mix_o2_f, mix_he_f, 1.0 - mix_o2_f - mix_he_f, temp_c)
+            if mols is None:
+                continue
+
+            # pressures after each fill, each source must be able to fill up to it
+            steps = []
+            bar = start_bar
+            cumulative_mols = start_mols
+            cumulative_o2 = start_mols_o2
+            cumulative_he = start_mols_he
+            for m, source in zip(mols, fill_set):
+                cumulative_mols += m
+                cumulative_o2 += m * source.o2_f
+                cumulative_he += m * source.he_f
+                o2_f = cumulative_o2 / cumulative_mols
+                he_f = cumulative_he / cumulative_mols
+                to_bar = vdw_solve_pressure(cumulative_mols, liters, o2_f, he_f, 1.0 - o2_f - he_f, temp_c)
+                if to_bar > source.limit:
+                    break
+                steps.append({'source': source.name, 'from_bar': bar, 'to_bar': to_bar, 'add_bar': to_bar - bar})
+                bar = to_bar
+            if len(steps) < count:
+                continue
+
+            # the oxygen and helium bought, as bars of ideal gas in this cylinder like tmx_cost_calc() counts them
+            add_o2 = ideal_gas_p(sum(m * source.pure_o2_f for m, source in zip(mols, fill_set)), liters, temp_k)
+            add_he = ideal_gas_p(sum(m * source.he_f for m, source in zip(mols, fill_set)), liters, temp_k)
+            compressor = any(source.compressor for source in fill_set)
+            cost_result = tmx_cost_calc(liters, end_bar, add_o2, add_he, o2_cost_eur, he_cost_eur,
+                                        fill_cost_eur if compressor else 0.0)
+            minutes = sum(STEP_MINUTES + step['add_bar'] / source.rate_bar_min
+                          for step, source in zip(steps, fill_set))
+            score = cost_result['cost'] if objective == 'cost' else minutes
+            if best is None or score < best[0]:
+                best = (score, steps, cost_result, minutes, cumulative_o2 / cumulative_mols,
+                        cumulative_he / cumulative_mols, bar)
+
+    if best is None:
+        topoff_result['status_code'] = 70
+        topoff_result['status_text'] = \
+            "ERROR: the mix cannot be blended from these sources!\n" \
+            " - try bleeding the cylinder or a bank with a higher pressure\n"
+        return topoff_result
+
+    score, steps, cost_result, minutes, mix_o2_f, mix_he_f, bar = best
+    topoff_result['status_code'] = 0
+    topoff_result['steps'] = steps
+    topoff_result['cost'] = cost_result['cost']
+    topoff_result['minutes'] = minutes
+    topoff_result['mix_o2_pct'] = 100 * mix_o2_f
+    topoff_result['mix_he_pct'] = 100 * mix_he_f
+    topoff_result['end_bar'] = bar
+    fills = "".join(" - From {:.1f} bars add {:.1f} bar {},\n".format(step['from_bar'], step['add_bar'],
+                                                                     step['source']) for step in steps)
+    topoff_result['status_text'] = \
+        "Starting from {} bar with mix {:.0f}/{:.0f}/{:.0f} (O2/He/N).\n" \
+        "Top-off blend, {:.2f} EUR, {:.0f} minutes:\n" \
+        "{}" \
+        "Resulting mix will be {:.1f}/{:.1f}/{:.1f} (O2/He/N) at {:.1f} bar.\n".format(
+            start_bar, start_o2, start_he, 100 - start_o2 - start_he, cost_result['cost'], minutes, fills,
+            100 * mix_o2_f, 100 * mix_he_f, 100 - 100 * mix_o2_f - 100 * mix_he_f, bar)
+    return topoff_result
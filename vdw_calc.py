@@ -10,7 +10,15 @@
 #    and there is no error checking what so ever, so crashes are more than likely
 
 import math
-from scipy.optimize import fsolve
+# the solvers use only arithmetic operators, so they work on floats and as well on numpy arrays of cylinders
+
+# Newton iteration of vdw_solve_mols() stops when the relative change of mols is below this
+VDW_TOLERANCE = 1e-12
+VDW_MAX_ITERATIONS = 50
+# Van der Waals constants a (L^2 bar/mol^2) and b (L/mol) of O2, N2, He
+# https://en.wikipedia.org/wiki/Van_der_Waals_constants_(data_page)
+VDW_A = (1.382, 1.370, 0.0346)
+VDW_B = (0.03186, 0.03870, 0.0238)
 
 class GasMix():
     def __init__(self, o2_f, he_f, name, mols, pressure, temp_C, volume):
@@ -45,6 +53,21 @@ def van_der_waals_n(n, *args):
     f = (p + (n*n * a) / (V*V)) * (V - (n * b)) - (n * R * T)
     return f
 
+def van_der_waals_dn(n, *args):
+    ''' derivative of van_der_waals_n() by n, for the Newton iteration '''
+    p, V, T, a, b = args # unpack the args
+    R= 0.0831451
+    return (2.0 * n * a) / (V*V) * (V - (n * b)) - b * (p + (n*n * a) / (V*V)) - R * T
+
+def mol_fraction(mols, mols_all):
+    ''' fraction of mols in mols_all, zero for an empty mix, which has no pressure whatever its fractions are
+    (mols_all == 0) adds one to the divisor only where it is zero, for floats and numpy arrays alike '''
+    return mols / (mols_all + (mols_all == 0))
+
+def all_true(condition):
+    ''' condition is a bool for floats, and an array of bools for numpy arrays '''
+    return condition.all() if hasattr(condition, 'all') else condition
+
 def vdw_mix_ab(o2_f, he_f, n2_f):
     ''' calculate vdw coefficients a and b for a mix of O2, N2, He
     input the fractions of each gas, return tuple
@@ -52,9 +75,8 @@ def vdw_mix_ab(o2_f, he_f, n2_f):
     mix_a = 0.0
     mix_b = 0.0
     x = [o2_f, n2_f, he_f]
-    # https://en.wikipedia.org/wiki/Van_der_Waals_constants_(data_page)
-    a = [1.382, 1.370, 0.0346]
-    b = [0.03186, 0.03870, 0.0238]
+    a = VDW_A
+    b = VDW_B
     for i in range(3):
         for j in range(3):
             mix_a += math.sqrt( a[i]*a[j])* x[i]*x[j]
@@ -63,82 +85,75 @@ def vdw_mix_ab(o2_f, he_f, n2_f):
 
 def vdw_solve_pressure(mols, volume, o2_f, he_f, n2_f, temperature):
     '''
-    returns the pressure of a gas mixture of o2, he, n2 by solving Van der Waals equation
+    returns the pressure of a gas mixture of o2, he, n2 from Van der Waals equation
     given mols, volume and temperature in Celsius
-    :param mols:
-    :type mols:
-    :param volume:
-    :type volume:
-    :param o2_f:
-    :type o2_f:
-    :param he_f:
-    :type he_f:
-    :param n2_f:
-    :type n2_f:
-    :param temperature:
-    :type temperature:
-    :return:
-    :rtype:
+    the equation is explicit for pressure: p = nRT / (V - nb) - n^2 a / V^2
+    all the arguments can be floats or numpy arrays of the same shape
+    :param mols: total mols of gas
+    :type mols: float
+    :param volume: volume in liters
+    :type volume: float
+    :param o2_f: fraction of oxygen
+    :type o2_f: float
+    :param he_f: fraction of helium
+    :type he_f: float
+    :param n2_f: fraction of nitrogen
+    :type n2_f: float
+    :param temperature: temperature in Celsius
+    :type temperature: float
+    :return: pressure in bar
+    :rtype: float
     '''
+    R= 0.0831451
     temp_K = temperature +273.0
     mix_a, mix_b = vdw_mix_ab(o2_f, he_f, n2_f)
-    seed_p = ideal_gas_p(n=mols, V=volume, T=temp_K)
-    solved_p = fsolve(van_der_waals_p, seed_p, (mols, volume, temp_K, mix_a, mix_b))
-    return solved_p
+    return mols * R * temp_K / (volume - mols * mix_b) - (mols * mols * mix_a) / (volume * volume)
 
 def vdw_solve_mols(pressure, volume, o2_f, he_f, n2_f, temperature):
     '''
     returns the total mols in a gas mixture of o2, he, n2 by solving Van der Waals equation
     given pressure, volume and temperature in Celsius
-    :param pressure:
-    :type pressure:
-    :param volume:
-    :type volume:
-    :param o2_f:
-    :type o2_f:
-    :param he_f:
-    :type he_f:
-    :param n2_f:
-    :type n2_f:
-    :param temperature:
-    :type temperature:
-    :return:
-    :rtype:
+    the equation is cubic for mols, it is solved by Newton iteration seeded from the ideal gas law
+    all the arguments can be floats or numpy arrays of the same shape
+    :param pressure: pressure in bar
+    :type pressure: float
+    :param volume: volume in liters
+    :type volume: float
+    :param o2_f: fraction of oxygen
+    :type o2_f: float
+    :param he_f: fraction of helium
+    :type he_f: float
+    :param n2_f: fraction of nitrogen
+    :type n2_f: float
+    :param temperature: temperature in Celsius
+    :type temperature: float
+    :return: total mols of gas
+    :rtype: float
     '''
     temp_K = temperature +273.0
     mix_a, mix_b = vdw_mix_ab(o2_f, he_f, n2_f)
-    seed_n = ideal_gas_n(pressure, volume, temp_K)
-    solved_n = fsolve(van_der_waals_n, seed_n, (pressure, volume, temp_K, mix_a, mix_b))
-    return solved_n
+    return vdw_newton_mols(pressure, volume, temp_K, mix_a, mix_b)
 
-def vdw_calc(start_bar: float = 0.0, want_bar: float = 200.0,
-             start_o2: float = 21.0, start_he: float = 35.0, want_o2: float = 21.0, want_he: float = 35.0,
-             volume = 12.0, start_temp_c = 20.0,
-             ) :
+def vdw_newton_mols(pressure, volume, temp_K, mix_a, mix_b):
+    ''' the Newton iteration of vdw_solve_mols(), for any Van der Waals coefficients a and b and temperature in Kelvin '''
+    args = (pressure, volume, temp_K, mix_a, mix_b)
+    n = ideal_gas_n(pressure, volume, temp_K)
+    for iteration in range(VDW_MAX_ITERATIONS):
+        step = van_der_waals_n(n, *args) / van_der_waals_dn(n, *args)
+        n = n - step
+        if all_true(abs(step) <= VDW_TOLERANCE * (abs(n) + 1.0)):
+            break
+    return n
+
+def vdw_fill_bars(start_bar, want_bar, start_o2, start_he, want_o2, want_he, volume, start_temp_c, ztable=None):
     '''
-    calculates a partial pressure gas fill using Van der Waals gas law
-    :param start_bar:
-    :type start_bar:
-    :param want_bar:
-    :type want_bar:
-    :param start_o2:
-    :type start_o2:
-    :param start_he:
-    :type start_he:
-    :param want_o2:
-    :type want_o2:
-    :param want_he:
-    :type want_he:
-    :param volume:
-    :type volume:
-    :param start_temp_c:
-    :type start_temp_c:
-    :return:
-    :rtype:
+    the numbers of a partial pressure fill by Van der Waals gas law, for vdw_calc()
+    all the arguments can be floats or numpy arrays of the same shape, so a whole rack of cylinders
+    can be calculated with one call
+    with a ZTable of vdw_ztable.py the mols are looked up from the table instead of solving them, for floats only
+    :return: bars to add of helium, oxygen and air, and the pressures after the helium and oxygen fills
+    :rtype: tuple
     '''
-    vdw_result = {'status_code': 99,  # 99 remains if something fatal happens
-                  'status_text': 'Van Der Waals calculator not implemented yet\n',  # this is overwritten by something else
-                  }
     # assume end temperature is same as start, could change this later to make things more complicated
     end_temp_c = start_temp_c
     # convert percentages to fractions (_f)
@@ -148,16 +163,15 @@ def vdw_calc(start_bar: float = 0.0, want_bar: float = 200.0,
     want_o2_f = want_o2 / 100.0
     want_he_f = want_he / 100.0
     want_n2_f = 1.0 - want_o2_f - want_he_f
+    solve_mols = vdw_solve_mols if ztable is None else ztable.mols
 
     # how many mols of gas we have at start, in total and of each kind
-    solve_start = vdw_solve_mols(start_bar, volume, start_o2_f, start_he_f, start_n2_f, start_temp_c)
-    vdw_start_mols_all = solve_start[0]
+    vdw_start_mols_all = solve_mols(start_bar, volume, start_o2_f, start_he_f, start_n2_f, start_temp_c)
     vdw_start_mols_o2 = vdw_start_mols_all * start_o2_f
     vdw_start_mols_he = vdw_start_mols_all * start_he_f
     vdw_start_mols_n2 = vdw_start_mols_all * start_n2_f
     # how many mols of gas we want to have, in total and of each kind
-    solve_want_mols_all = vdw_solve_mols(want_bar, volume, want_o2_f, want_he_f, want_n2_f, end_temp_c)
-    vdw_want_mols_all = solve_want_mols_all[0]
+    vdw_want_mols_all = solve_mols(want_bar, volume, want_o2_f, want_he_f, want_n2_f, end_temp_c)
     vdw_want_mols_o2 = vdw_want_mols_all * want_o2_f
     vdw_want_mols_he = vdw_want_mols_all * want_he_f
     vdw_want_mols_n2 = vdw_want_mols_all * want_n2_f
@@ -169,28 +183,61 @@ def vdw_calc(start_bar: float = 0.0, want_bar: float = 200.0,
 
     # first stage of filling is by helium, and we get a new mix "mix_he"
     mix_he_mols_all = vdw_start_mols_all + vdw_fill_mols_he # after filling he, we get this many mols total into new mix
-    mix_he_o2_f = vdw_start_mols_o2 / mix_he_mols_all       # this mix has this new fraction of o2
-    mix_he_he_f = vdw_want_mols_he  / mix_he_mols_all       #
+    mix_he_o2_f = mol_fraction(vdw_start_mols_o2, mix_he_mols_all) # this mix has this new fraction of o2
+    mix_he_he_f = mol_fraction(vdw_want_mols_he, mix_he_mols_all)  #
     mix_he_n2_f = 1.0 - mix_he_o2_f - mix_he_he_f
     # then solve for pressure of this new mix
-    solve_mix_helium_bars = vdw_solve_pressure(mix_he_mols_all, volume, mix_he_o2_f, mix_he_he_f, mix_he_n2_f, start_temp_c)
-    mix_helium_bars = solve_mix_helium_bars[0]
+    mix_helium_bars = vdw_solve_pressure(mix_he_mols_all, volume, mix_he_o2_f, mix_he_he_f, mix_he_n2_f, start_temp_c)
     vdw_fill_he_bars = mix_helium_bars - start_bar # pressure of helium to fill
 
     # air is topped last, but we need to calculate how much we need it, so we can calculate for oxygen
     air_o2_mols_o2 = vdw_fill_mols_n2 * (0.21/0.79)    # this much o2 comes with the air we fill
     mix_o2_mols_o2 = vdw_fill_mols_o2 - air_o2_mols_o2 # this much extra o2 we need in mols
     mix_o2_mols_all = mix_he_mols_all + mix_o2_mols_o2 # total mols in the next mix
-    mix_o2_o2_f = (mix_o2_mols_o2 + vdw_start_mols_o2) / mix_o2_mols_all
-    mix_o2_he_f = vdw_want_mols_he / mix_o2_mols_all
+    mix_o2_o2_f = mol_fraction(mix_o2_mols_o2 + vdw_start_mols_o2, mix_o2_mols_all)
+    mix_o2_he_f = mol_fraction(vdw_want_mols_he, mix_o2_mols_all)
     mix_o2_n2_f = 1.0 - mix_o2_o2_f - mix_o2_he_f
     # then solve for pressure of this new mix
-    solve_mix_oxygen_bars = vdw_solve_pressure(mix_o2_mols_all, volume, mix_o2_o2_f, mix_o2_he_f, mix_o2_n2_f, start_temp_c)
-    mix_oxygen_bars = solve_mix_oxygen_bars[0]
+    mix_oxygen_bars = vdw_solve_pressure(mix_o2_mols_all, volume, mix_o2_o2_f, mix_o2_he_f, mix_o2_n2_f, start_temp_c)
     vdw_fill_o2_bars = mix_oxygen_bars - mix_helium_bars # pressure of oxygen to fill
 
     # finally air
     vdw_fill_air_bars = want_bar - mix_oxygen_bars
+    return vdw_fill_he_bars, vdw_fill_o2_bars, vdw_fill_air_bars, mix_helium_bars, mix_oxygen_bars
+
+def vdw_calc(start_bar: float = 0.0, want_bar: float = 200.0,
+             start_o2: float = 21.0, start_he: float = 35.0, want_o2: float = 21.0, want_he: float = 35.0,
+             volume = 12.0, start_temp_c = 20.0,
+             ztable = None) :
+    '''
+    calculates a partial pressure gas fill using Van der Waals gas law
+    :param start_bar:
+    :type start_bar:
+    :param want_bar:
+    :type want_bar:
+    :param start_o2:
+    :type start_o2:
+    :param start_he:
+    :type start_he:
+    :param want_o2:
+    :type want_o2:
+    :param want_he:
+    :type want_he:
+    :param volume:
+    :type volume:
+    :param start_temp_c:
+    :type start_temp_c:
+    :param ztable: look up the mols from this table of vdw_ztable.py instead of solving them, None to solve
+    :type ztable: ZTable
+    :return:
+    :rtype:
+    '''
+    vdw_result = {'status_code': 99,  # 99 remains if something fatal happens
+                  'status_text': 'Van Der Waals calculator not implemented yet\n',  # this is overwritten by something else
+                  }
+    (vdw_fill_he_bars, vdw_fill_o2_bars, vdw_fill_air_bars,
+     mix_helium_bars, mix_oxygen_bars) = vdw_fill_bars(start_bar, want_bar, start_o2, start_he, want_o2, want_he,
+                                                        volume, start_temp_c, ztable)
 
     vdw_result['fill_he_bars']  = vdw_fill_he_bars
     vdw_result['fill_o2_bars']  = vdw_fill_o2_bars
@@ -0,0 +1,220 @@
+#!/usr/bin/python
+# (c) 2018 Ian Leiman, ian.leiman@gmail.com
+# vdw_ztable.py
+# GNU General Public License v3.0
+# use at your own risk, no guarantees, no liability!
+# github project https://github.com/eianlei
+# Python-3 functions:
+#    ztable() returns the table of compressibility factors Z of O2/He/N2 mixes by Van der Waals gas law,
+#    built once and cached to disk, so real gas corrections cost a table lookup instead of solving the equation
+#
+# Z = pV / nRT tells how much a real gas differs from an ideal gas: the same mols at the same temperature have
+# Z times the pressure of an ideal gas. Z does not depend on the volume of the cylinder, and by Van der Waals gas
+# law it depends on pressure, temperature and the mix only through two numbers:
+#    B = b p / RT, the volume of the molecules compared to the volume of the gas, grows with pressure
+#    r = a / (b R T), the attraction compared to the volume of the molecules, depends on temperature and mix
+# where a and b are the coefficients of the mix from vdw_mix_ab(). Z is the root of
+#    Z^3 - (1 + B) Z^2 + r B Z - r B^2 = 0
+# so the table is over B and r, and covers all pressures, temperatures and mixes with 2 dimensions, the mix
+# is exact and only the interpolation between the grid points is approximate. Above their critical temperature,
+# r < 27/8, all the gases have one root, so Z is smooth over the table.
+#    ZTable.z() the compressibility factor
+#    ZTable.mols() mols in a cylinder, same arguments as vdw_solve_mols()
+#    ZTable.ideal_bar() and ZTable.real_bar() convert a real pressure to the pressure of an ideal gas of the same
+#    mols and back, so the ideal gas formulas of tmx_calc() can be used as a balance of mols
+
+import os
+import sys
+import math
+import json
+from array import array
+
+from vdw_calc import ideal_gas_n, vdw_newton_mols, VDW_A, VDW_B
+
+# the axes of the table as (first value, step, number of values)
+# B is 0.71 for nitrogen at 400 bar and -10 C, r is 1.98 for oxygen at -10 C
+ZTABLE_B = (0.0, 0.0025, 321)   # 0...0.8
+ZTABLE_R = (0.0, 0.025, 89)     # 0...2.2
+# change this when the file format changes, a cached table of another format is built again
+ZTABLE_FORMAT = 1
+ZTABLE_FILE = 'vdw_ztable.bin'
+# the gas constant of vdw_calc, L bar / (K mol)
+R = 0.0831451
+# vdw_mix_ab() sums sqrt(a_i * a_j) x_i x_j over the gas pairs, which is (sum of x_i sqrt(a_i))^2
+SQRT_A = tuple(math.sqrt(a) for a in VDW_A)
+SQRT_B = tuple(math.sqrt(b) for b in VDW_B)
+
+
+def axis_values(axis):
+    start, step, count = axis
+    return [start + step * i for i in range(count)]
+
+
+def axis_cell(axis, value):
+    ''' index of the grid cell of value and the position in it, 0...1 inside the grid, linear extrapolation
+    beyond the ends of the axis '''
+    start, step, count = axis
+    position = (value - start) / step
+    index = min(max(int(position), 0), count - 2)
+    return index, position - index
+
+
+class ZTable():
+    """
+    compressibility factors Z of the Van der Waals gas law on a grid of B and r, B is the row
+    """
+    def __init__(self, values, b_axis=ZTABLE_B, r_axis=ZTABLE_R):
+        self.values = values
+        self.b_axis = b_axis
+        self.r_axis = r_axis
+
+    def mix_constants(self, temperature, o2_f, he_f):
+        '''
+        B per bar and r of a mix at a temperature
+        :return: (B / pressure, r)
+        :rtype: tuple
+        '''
+        n2_f = 1.0 - o2_f - he_f
+        sqrt_a = o2_f * SQRT_A[0] + n2_f * SQRT_A[1] + he_f * SQRT_A[2]
+        sqrt_b = o2_f * SQRT_B[0] + n2_f * SQRT_B[1] + he_f * SQRT_B[2]
+        rt = R * (temperature + 273.0)
+        mix_b = sqrt_b * sqrt_b
+        return mix_b / rt, sqrt_a * sqrt_a / (mix_b * rt)
+
+    def row_z(self, ib, ir, fr):
+        ''' Z at the row ib of B, interpolated in r '''
+        index = ib * self.r_axis[2] + ir
+        low = self.values[index]
+        return low + (self.values[index + 1] - low) * fr
+
+    def z(self, pressure, temperature, o2_f, he_f):
+        '''
+        the compressibility factor Z of a mix
+        :param pressure: pressure in bar
+        :type pressure: float
+        :param temperature: temperature in Celsius
+        :type temperature: float
+        :param o2_f: fraction of oxygen
+        :type o2_f: float
+        :param he_f: fraction of helium
+        :type he_f: float
+        :rtype: float
+        '''
+        b_per_bar, r = self.mix_constants(temperature, o2_f, he_f)
+        ir, fr = axis_cell(self.r_axis, r)
+        ib, fb = axis_cell(self.b_axis, b_per_bar * pressure)
+        low = self.row_z(ib, ir, fr)
+        return low + (self.row_z(ib + 1, ir, fr) - low) * fb
+
+    def mols(self, pressure, volume, o2_f, he_f, n2_f, temperature):
+        '''
+        total mols of gas in a cylinder, takes the same arguments as vdw_solve_mols() so it can be used instead of
+        it, n2_f is not needed as nitrogen is the rest of the mix
+        '''
+        return ideal_gas_n(pressure, volume, temperature + 273.0) / self.z(pressure, temperature, o2_f, he_f)
+
+    def ideal_bar(self, pressure, temperature, o2_f, he_f):
+        ''' the pressure an ideal gas of the same mols would have '''
+        return pressure / self.z(pressure, temperature, o2_f, he_f)
+
+    def real_bar(self, ideal_bar, temperature, o2_f, he_f):
+        '''
+        the real pressure of a mix from the pressure an ideal gas of the same mols would have, the inverse of
+        ideal_bar()
+        Inside one cell of B, Z is linear in pressure, Z = z_low + slope * (p - p_low), so p = ideal_bar * Z is
+        solved directly, and the next cell is tried only if the result is not in the cell
+        '''
+        b_per_bar, r = self.mix_constants(temperature, o2_f, he_f)
+        ir, fr = axis_cell(self.r_axis, r)
+        start, step, count = self.b_axis
+        pressure = ideal_bar
+        for attempt in range(count):
+            ib, fb = axis_cell(self.b_axis, b_per_bar * pressure)
+            low = self.row_z(ib, ir, fr)
+            slope = (self.row_z(ib + 1, ir, fr) - low) / step * b_per_bar
+            pressure_low = (start + step * ib) / b_per_bar
+            pressure = ideal_bar * (low - slope * pressure_low) / (1.0 - ideal_bar * slope)
+            if axis_cell(self.b_axis, b_per_bar * pressure)[0] == ib:
+                break
+        return pressure
+
+
+def build_ztable():
+    '''
+    calculates the table by solving Van der Waals equation at every grid point
+    A gas of 1 bar in 1 liter at 300 K is solved with the coefficients a and b that give B and r of the point
+    :rtype: ZTable
+    '''
+    rt = R * 300.0
+    values = array('d')
+    for b_reduced in axis_values(ZTABLE_B):
+        mix_b = b_reduced * rt
+        values.extend([1.0 / (rt * vdw_newton_mols(1.0, 1.0, 300.0, r * mix_b * rt, mix_b))
+                       for r in axis_values(ZTABLE_R)])
+    return ZTable(values)
+
+
+def ztable_header():
+    ''' the first line of the cache file, a cached table is used only if it was made with the same header '''
+    header = {'format': ZTABLE_FORMAT, 'byteorder': sys.byteorder, 'b': ZTABLE_B, 'r': ZTABLE_R}
+    return json.dumps(header, sort_keys=True).encode('ascii') + b'\n'
+
+
+def ztable_cache_path():
+    ''' the cache file in $PYDPLAN_CACHE_DIR, or in ~/.cache/pydplan '''
+    cache_dir = os.environ.get('PYDPLAN_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'pydplan')
+    return os.path.join(cache_dir, ZTABLE_FILE)
+
+
+def load_ztable(path):
+    '''
+    reads a cached table
+    :return: the table, or None if there is no file or it was made with other axes
+    :rtype: ZTable or None
+    '''
+    try:
+        with open(path, 'rb') as cache:
+            if cache.readline() != ztable_header():
+                return None
+            data = cache.read()
+    except OSError:
+        return None
+    values = array('d')
+    values.frombytes(data[:len(data) - len(data) % values.itemsize])
+    if len(values) != ZTABLE_B[2] * ZTABLE_R[2]:
+        return None
+    return ZTable(values)
+
+
+def save_ztable(table, path):
+    ''' writes the table to the cache file, a new file is renamed over the old one so readers never see half a file '''
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temporary, 'wb') as cache:
+        cache.write(ztable_header())
+        table.values.tofile(cache)
+    os.replace(temporary, path)
+
+
+_ztable = None
+
+def ztable(path=None):
+    '''
+    return the shared ZTable, read from the cache file at first use, or built and saved to it
+    :param path: cache file, ztable_cache_path() if None
+    :type path: str
+    :rtype: ZTable
+    '''
+    global _ztable
+    if _ztable is None:
+        if path is None:
+            path = ztable_cache_path()
+        table = load_ztable(path)
+        if table is None:
+            table = build_ztable()
+            try:
+                save_ztable(table, path)
+            except OSError:
+                pass # no place to cache, the table is built again by the next process
+        _ztable = table
+    return _ztable